@@ -0,0 +1,80 @@
+"""Throughput and p50/p99 latency of the micro-batching scheduler against offered load.
+
+An open-loop load generator submits requests with exponential inter-arrival times at each offered rate, once through
+a scheduler that runs every request on its own (max batch size 1) and once with micro-batching enabled.
+
+    python -m artdescapi.benchmarks.batching_load --model-dir /srv/model-25lang-all/ --rates 1,2,4,8
+"""
+import concurrent.futures
+import random
+import statistics
+import threading
+import time
+
+import torch
+
+from artdescapi.benchmarks.common import build_model, make_batch, parse_args
+from artdescapi.utils.batching import BatchScheduler
+from artdescapi.utils.utils import lang_dict
+
+
+def add_args(parser):
+    parser.add_argument('--rates', default='1,2,4,8', help='comma-separated offered loads in requests/s')
+    parser.add_argument('--requests', type=int, default=64, help='requests per offered load')
+    parser.add_argument('--num-langs', type=int, default=10, help='source languages per request')
+    parser.add_argument('--num-beams', type=int, default=2)
+    parser.add_argument('--max-batch-size', type=int, default=8)
+    parser.add_argument('--window-ms', type=float, default=10)
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def run_load(scheduler, rate, num_requests, seed=0):
+    rng = random.Random(seed)
+    latencies = []
+    lock = threading.Lock()
+
+    def request(send_at):
+        time.sleep(max(0.0, send_at - time.monotonic()))
+        start = time.monotonic()
+        scheduler.submit({'num_beams': 1}).result()
+        with lock:
+            latencies.append(time.monotonic() - start)
+
+    start = time.monotonic()
+    send_at = start
+    with concurrent.futures.ThreadPoolExecutor(max_workers=num_requests) as executor:
+        for _ in range(num_requests):
+            send_at += rng.expovariate(rate)
+            executor.submit(request, send_at)
+    elapsed = time.monotonic() - start
+    return len(latencies) / elapsed, statistics.median(latencies), percentile(latencies, 0.99)
+
+
+def main():
+    args = parse_args(__doc__, add_args)
+    model = build_model(args.model_dir)
+
+    def predict_batch(items, return_exceptions=False):
+        # synthetic stand-in for ModelLoader.predict_batch: same model work, random token ids
+        batch = make_batch(model, args.num_langs, args.seq_len, batch_size=len(items))
+        tokens = model.generate(**batch, max_length=20, min_length=2, num_beams=args.num_beams,
+                                num_return_sequences=args.num_beams, target_lang=lang_dict['en'],
+                                decoder_start_token_id=model.config.eos_token_id)
+        return [tokens[i * args.num_beams:(i + 1) * args.num_beams] for i in range(len(items))]
+
+    with torch.no_grad():
+        predict_batch([{}])  # warm-up
+    print('offered (req/s)\tmax batch\tthroughput (req/s)\tp50 (s)\tp99 (s)')
+    for rate in [float(r) for r in args.rates.split(',')]:
+        for max_batch_size in (1, args.max_batch_size):
+            scheduler = BatchScheduler(predict_batch, max_batch_size=max_batch_size, max_wait=args.window_ms / 1000)
+            throughput, p50, p99 = run_load(scheduler, rate, args.requests)
+            print(f'{rate:g}\t{max_batch_size}\t{throughput:.2f}\t{p50:.3f}\t{p99:.3f}')
+
+
+if __name__ == '__main__':
+    main()
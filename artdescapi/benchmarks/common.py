@@ -0,0 +1,96 @@
+"""Shared helpers for the inference benchmarks.
+
+The benchmarks run against the serving checkpoint when ``--model-dir`` is given and against a small randomly
+initialised model of the same architecture otherwise, so they can be run on a laptop without the model volume.
+"""
+import argparse
+import json
+import statistics
+import time
+
+import torch
+
+from artdescapi.transformers import AutoConfig, MBartConfig, MBartForConditionalGeneration
+from artdescapi.utils.utils import lang_dict
+
+
+def add_model_args(parser):
+    parser.add_argument('--model-dir', default=None,
+                        help='checkpoint directory (e.g. /srv/model-25lang-all/); random small model if omitted')
+    parser.add_argument('--seq-len', type=int, default=128, help='tokens per source paragraph')
+    parser.add_argument('--repeats', type=int, default=5, help='timed runs per configuration')
+    parser.add_argument('--threads', type=int, default=None, help='torch intra-op threads')
+    return parser
+
+
+def build_model(model_dir=None):
+    if model_dir is not None:
+        config = AutoConfig.from_pretrained(model_dir)
+        config.graph_embd_length = 128
+        model = MBartForConditionalGeneration.from_pretrained(model_dir, config=config)
+    else:
+        config = MBartConfig(vocab_size=32000, d_model=256, encoder_layers=4, decoder_layers=4,
+                             encoder_attention_heads=4, decoder_attention_heads=4,
+                             encoder_ffn_dim=1024, decoder_ffn_dim=1024, graph_embd_length=128)
+        model = MBartForConditionalGeneration(config)
+    model.eval()
+    return model
+
+
+def make_batch(model, num_langs, seq_len, batch_size=1, min_len=None, seed=0):
+    """Synthetic multi-source batch in the ``input_ids[lang]`` / ``attention_mask[lang]`` format.
+
+    With ``min_len`` every language gets a random length in ``[min_len, seq_len]``, like real first paragraphs.
+    """
+    generator = torch.Generator().manual_seed(seed)
+    config = model.config
+    input_ids = {}
+    attention_mask = {}
+    for i, lang in enumerate(lang_dict):
+        if i < num_langs:
+            length = seq_len
+            if min_len is not None:
+                length = int(torch.randint(min_len, seq_len + 1, (1,), generator=generator))
+            ids = torch.randint(4, config.vocab_size, (batch_size, length), generator=generator)
+            ids[:, -1] = config.eos_token_id
+            input_ids[lang] = ids
+            attention_mask[lang] = torch.ones_like(ids)
+        else:
+            input_ids[lang] = None
+            attention_mask[lang] = None
+    return {'input_ids': input_ids, 'attention_mask': attention_mask, 'graph_embeddings': None,
+            'bert_inputs': None, 'bert_outputs': torch.zeros((batch_size, 768))}
+
+
+def read_feature_items(path):
+    """ModelLoader items from a file of JSON lines as returned by ``/article`` or ``POST /articles``.
+
+    Articles without a first paragraph in their own language (or without features, e.g. errors) are skipped.
+    """
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            article = json.loads(line)
+            if 'features' in article and article['features']['first-paragraphs'].get(article['lang']):
+                yield {'sources': article['features']['first-paragraphs'],
+                       'descriptions': article['features']['descriptions'], 'tgt_lang': article['lang']}
+
+
+def timed(fn, repeats):
+    """Run ``fn`` once to warm up and then ``repeats`` times; return (median seconds, last result)."""
+    result = fn()
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), result
+
+
+def parse_args(description, extra_args=None):
+    parser = add_model_args(argparse.ArgumentParser(description=description))
+    if extra_args is not None:
+        extra_args(parser)
+    args = parser.parse_args()
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+    return args
@@ -0,0 +1,60 @@
+"""Aggregate throughput of concurrent predictions at 1, 2 and 4 callers.
+
+Each caller thread runs single-article generate() calls back to back on the shared model. Every caller count is run
+twice: with each call using all intra-op threads (the default) and with the cores split between callers by
+``intra_op_threads``, the policy ModelLoader applies for ``max_concurrency``.
+
+    python -m artdescapi.benchmarks.concurrent_callers --model-dir /srv/model-25lang-all/ --callers 1,2,4
+"""
+import concurrent.futures
+import os
+import time
+
+import torch
+
+from artdescapi.benchmarks.common import build_model, make_batch, parse_args
+from artdescapi.utils.utils import intra_op_threads, lang_dict
+
+
+def add_args(parser):
+    parser.add_argument('--callers', default='1,2,4', help='comma-separated numbers of concurrent callers')
+    parser.add_argument('--requests', type=int, default=8, help='predictions per caller')
+    parser.add_argument('--num-langs', type=int, default=10, help='source languages per request')
+    parser.add_argument('--num-beams', type=int, default=2)
+
+
+def run_callers(predict, callers, requests):
+    def caller():
+        for _ in range(requests):
+            predict()
+
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=callers) as executor:
+        for future in [executor.submit(caller) for _ in range(callers)]:
+            future.result()
+    return callers * requests / (time.perf_counter() - start)
+
+
+def main():
+    args = parse_args(__doc__, add_args)
+    model = build_model(args.model_dir)
+    batch = make_batch(model, args.num_langs, args.seq_len)
+    num_threads = args.threads or os.cpu_count()
+
+    def predict():
+        return model.generate(**batch, max_length=20, min_length=2, num_beams=args.num_beams,
+                              num_return_sequences=args.num_beams, target_lang=lang_dict['en'],
+                              decoder_start_token_id=model.config.eos_token_id)
+
+    predict()  # warm-up
+    print(f'cores: {num_threads}')
+    print('callers\tthreads per call\tthroughput (req/s)')
+    for callers in [int(c) for c in args.callers.split(',')]:
+        for threads in sorted({num_threads, intra_op_threads(callers, num_threads)}, reverse=True):
+            torch.set_num_threads(threads)
+            throughput = run_callers(predict, callers, args.requests)
+            print(f'{callers}\t{threads}\t{throughput:.2f}')
+
+
+if __name__ == '__main__':
+    main()
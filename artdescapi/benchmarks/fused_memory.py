@@ -0,0 +1,38 @@
+"""Per-token decoding latency with the fused encoder memory rebuilt at every step vs. computed once per generate().
+
+    python -m artdescapi.benchmarks.fused_memory --model-dir /srv/model-25lang-all/ --num-beams 2
+"""
+import torch
+
+from artdescapi.benchmarks.common import build_model, make_batch, parse_args, timed
+from artdescapi.utils.utils import lang_dict
+
+
+def add_args(parser):
+    parser.add_argument('--num-beams', type=int, default=2)
+    parser.add_argument('--max-length', type=int, default=20)
+    parser.add_argument('--langs', default='1,5,25', help='comma-separated numbers of source languages')
+
+
+def main():
+    args = parse_args(__doc__, add_args)
+    model = build_model(args.model_dir)
+
+    print('langs\tcache_fusion\tms/token')
+    for num_langs in [int(n) for n in args.langs.split(',')]:
+        batch = make_batch(model, num_langs, args.seq_len)
+        for cache_fusion in (False, True):
+            def run():
+                # generate() mutates the mask/encoder dicts in place, so every run gets fresh copies
+                kwargs = {k: (dict(v) if isinstance(v, dict) else v) for k, v in batch.items()}
+                with torch.no_grad():
+                    return model.generate(**kwargs, max_length=args.max_length, min_length=args.max_length,
+                                          num_beams=args.num_beams, target_lang=lang_dict['en'],
+                                          decoder_start_token_id=model.config.eos_token_id,
+                                          cache_fusion=cache_fusion)
+            seconds, tokens = timed(run, args.repeats)
+            print(f'{num_langs}\t{cache_fusion}\t{1000 * seconds / (tokens.shape[-1] - 1):.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+"""Encoder wall time against the number of source languages: one call per language vs. packed length buckets.
+
+    python -m artdescapi.benchmarks.packed_encoder --model-dir /srv/model-25lang-all/ --threads 8
+"""
+import torch
+
+from artdescapi.benchmarks.common import build_model, make_batch, parse_args, timed
+
+
+def add_args(parser):
+    parser.add_argument('--min-len', type=int, default=16, help='shortest source paragraph in tokens')
+    parser.add_argument('--buckets', default='1,2,4', help='comma-separated bucket counts for the packed encoder')
+    parser.add_argument('--langs', default='1,5,10,25', help='comma-separated numbers of source languages')
+
+
+def main():
+    args = parse_args(__doc__, add_args)
+    model = build_model(args.model_dir)
+    encoder = model.get_encoder()
+    buckets = [int(b) for b in args.buckets.split(',')]
+
+    print('langs\tloop (ms)\t' + '\t'.join(f'packed/{b} (ms)' for b in buckets))
+    for num_langs in [int(n) for n in args.langs.split(',')]:
+        batch = make_batch(model, num_langs, args.seq_len, min_len=args.min_len)
+        input_ids, attention_mask = batch['input_ids'], batch['attention_mask']
+
+        def loop():
+            return {lang: encoder(ids, attention_mask=attention_mask[lang], return_dict=True)
+                    for lang, ids in input_ids.items() if ids is not None}
+
+        with torch.no_grad():
+            row = [timed(loop, args.repeats)[0]]
+            for num_buckets in buckets:
+                row.append(timed(lambda: encoder.forward_packed(input_ids, attention_mask, num_buckets=num_buckets),
+                                 args.repeats)[0])
+        print(f'{num_langs}\t' + '\t'.join(f'{1000 * seconds:.1f}' for seconds in row))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+"""Memory of uWSGI workers sharing one preloaded model, as proportional set size (PSS) at 1, 2 and 4 workers.
+
+Emulates the ``MODEL_PRELOAD`` set-up: this process loads the model like the uWSGI master does
+(``ModelLoader(prefork=True)``, a warm-up prediction, ``gc.freeze()``) and forks the workers, which start their
+threads and make a few predictions as serving would. PSS charges each page to the processes sharing it in equal
+parts, so the sum over the master and its workers is the memory they actually use, while each worker's RSS counts
+the shared pages in full. With ``--per-worker``, the workers load a model of their own instead, for comparison (it
+needs memory for all the copies). With ``--no-pack``, the master leaves the weights where loading put them instead of
+moving them into one buffer per dtype (``pack_weights``); the master's peak RSS while loading is reported for both.
+
+    python -m artdescapi.benchmarks.prefork_memory --model-dir /srv/model-25lang-all/ --workers 1 2 4
+"""
+import argparse
+import gc
+import json
+import os
+import statistics
+import traceback
+
+from artdescapi.benchmarks.common import read_feature_items
+from artdescapi.utils.utils import ModelLoader
+
+WARMUP_ARTICLE_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'fixtures', 'warmup_article.json')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model-dir', required=True, help='checkpoint directory (e.g. /srv/model-25lang-all/)')
+    parser.add_argument('--bert-dir', default=None, help='BERT model directory (default: the hub model)')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4], help='numbers of workers to fork')
+    parser.add_argument('--features', default=None,
+                        help='JSON lines with the "lang" and "features" of articles (default: the warm-up article)')
+    parser.add_argument('--predictions', type=int, default=5, help='predictions per worker before measuring')
+    parser.add_argument('--threads', type=int, default=2, help='intra-op threads per worker')
+    parser.add_argument('--quantize', action='store_true', help='dynamic int8 quantization')
+    parser.add_argument('--per-worker', action='store_true', help='each worker loads its own model instead')
+    parser.add_argument('--no-pack', action='store_true', help="don't pack the master's weights before forking")
+    return parser.parse_args()
+
+
+def proc_mb(pid, field, path='status'):
+    """A kB field of /proc/<pid>/<path> (summed over its lines) in MB."""
+    with open(f'/proc/{pid}/{path}') as f:
+        return sum(int(line.split()[1]) for line in f if line.startswith(field + ':')) / 1024
+
+
+def pss_mb(pid):
+    try:
+        return proc_mb(pid, 'Pss', 'smaps_rollup')
+    except FileNotFoundError:  # kernels before 4.14
+        return proc_mb(pid, 'Pss', 'smaps')
+
+
+def load_items(path, predictions):
+    if path is not None:
+        items = list(read_feature_items(path))
+    else:
+        with open(WARMUP_ARTICLE_PATH, encoding='utf-8') as f:
+            article = json.load(f)
+        items = [{'sources': article['features']['first-paragraphs'],
+                  'descriptions': article['features']['descriptions'], 'tgt_lang': article['lang']}]
+    if not items:
+        raise SystemExit('no usable article in the features file')
+    return [items[i % len(items)] for i in range(predictions)]
+
+
+def new_loader(args, prefork):
+    loader = ModelLoader(num_threads=args.threads, quantize=args.quantize, bert_dir=args.bert_dir, prefork=prefork,
+                         pack=not args.no_pack)
+    loader.load_model(args.model_dir)
+    return loader
+
+
+def worker(args, loader, items):
+    if loader is None:
+        loader = new_loader(args, prefork=False)
+    else:
+        loader.after_fork()
+    for item in items:
+        loader.predict_batch([item])
+
+
+def measure(args, loader, items, num_workers):
+    """Fork `num_workers` workers and wait until each has made its predictions; returns the PSS of this process and
+    the (PSS, RSS) of each worker, in MB, measured while they are all alive."""
+    ready_r, ready_w = os.pipe()
+    done_r, done_w = os.pipe()
+    pids = []
+    for _ in range(num_workers):
+        pid = os.fork()
+        if pid == 0:
+            os.close(ready_r)
+            os.close(done_w)
+            code = 0
+            try:
+                worker(args, loader, items)
+                os.write(ready_w, b'.')
+                os.close(ready_w)
+                os.read(done_r, 1)  # stay alive (and mapped) until the parent has measured every worker
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            os._exit(code)
+        pids.append(pid)
+    os.close(ready_w)
+    os.close(done_r)
+
+    ready = 0
+    while ready < num_workers:
+        chunk = os.read(ready_r, num_workers - ready)
+        if not chunk:
+            break  # a worker failed
+        ready += len(chunk)
+    if ready == num_workers:
+        usage = [(pss_mb(pid), proc_mb(pid, 'VmRSS')) for pid in pids]
+        master = pss_mb(os.getpid())
+    os.close(done_w)
+    os.close(ready_r)
+    for pid in pids:
+        os.waitpid(pid, 0)
+    if ready < num_workers:
+        raise SystemExit(f'a worker failed with {num_workers} workers')
+    return master, usage
+
+
+def main():
+    args = parse_args()
+    items = load_items(args.features, args.predictions)
+    loader = None
+    if not args.per_worker:
+        loader = new_loader(args, prefork=True)
+        loader.predict_batch(items[:1])  # the master's warm-up prediction, single-threaded
+        gc.freeze()
+        print(f"master peak RSS while loading ({'not ' if args.no_pack else ''}packed): "
+              f"{proc_mb(os.getpid(), 'VmHWM'):.0f} MB")
+
+    print('workers\tmaster PSS (MB)\tworker PSS (MB)\tworker RSS (MB)\ttotal PSS (MB)')
+    for num_workers in args.workers:
+        master, usage = measure(args, loader, items, num_workers)
+        worker_pss = statistics.mean(pss for pss, _ in usage)
+        worker_rss = statistics.mean(rss for _, rss in usage)
+        total = master + sum(pss for pss, _ in usage)
+        print(f'{num_workers}\t{master:.0f}\t{worker_pss:.0f}\t{worker_rss:.0f}\t{total:.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""Accuracy, latency and memory of the dynamic int8 quantization mode (``ModelLoader(quantize=True)``).
+
+Decodes a fixed evaluation set -- a file of JSON lines as returned by ``/article`` or ``POST /articles`` -- with the
+float and the quantized model and reports how often the top description is unchanged (exact match), the change in
+its beam score, the median latency and the process RSS. Each mode loads in its own process so the memory numbers
+don't include the other model.
+
+    python -m artdescapi.benchmarks.quantization --model-dir /srv/model-25lang-all/ --features articles.jsonl
+"""
+import argparse
+import concurrent.futures
+import multiprocessing
+import resource
+import statistics
+import time
+
+import torch
+
+from artdescapi.benchmarks.common import read_feature_items
+from artdescapi.utils.utils import ModelLoader
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model-dir', required=True, help='checkpoint directory (e.g. /srv/model-25lang-all/)')
+    parser.add_argument('--features', required=True, help='JSON lines with the "lang" and "features" of articles')
+    parser.add_argument('--num-beams', type=int, default=2, help='beams (at least 2, for the sequence scores)')
+    parser.add_argument('--threads', type=int, default=None, help='torch intra-op threads')
+    return parser.parse_args()
+
+
+def rss_mb():
+    """Current resident set size in MB (from /proc where available, else the peak)."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_mode(model_dir, features, quantize, num_beams, threads):
+    """Decode the evaluation set with one mode; runs in a child process."""
+    start = time.perf_counter()
+    loader = ModelLoader(quantize=quantize)
+    loader.load_model(model_dir)
+    load_time = time.perf_counter() - start
+    if threads is not None:
+        torch.set_num_threads(threads)
+
+    outputs, scores, latencies = [], [], []
+    for item in read_feature_items(features):
+        lang = item['tgt_lang']
+        start = time.perf_counter()
+        generated = loader.generate_tokens([item], [lang], num_beams, return_dict_in_generate=True, output_scores=True)
+        latencies.append(time.perf_counter() - start)
+        outputs.append(loader.tokenizer.decode(generated.sequences[0], skip_special_tokens=True))
+        scores.append(float(generated.sequences_scores[0]))
+    return {'outputs': outputs, 'scores': scores, 'latencies': latencies, 'load_time': load_time,
+            'rss': rss_mb(), 'peak_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}
+
+
+def main():
+    args = parse_args()
+    if args.num_beams < 2:
+        raise SystemExit('--num-beams has to be at least 2')
+    results = {}
+    for name, quantize in (('fp32', False), ('int8', True)):
+        context = multiprocessing.get_context('spawn')
+        with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            results[name] = executor.submit(run_mode, args.model_dir, args.features, quantize, args.num_beams,
+                                            args.threads).result()
+    fp32, int8 = results['fp32'], results['int8']
+    if not fp32['outputs']:
+        raise SystemExit('no usable article in the features file')
+
+    matches = sum(a == b for a, b in zip(fp32['outputs'], int8['outputs']))
+    deltas = [b - a for a, b in zip(fp32['scores'], int8['scores'])]
+    print(f"articles: {len(fp32['outputs'])}, num_beams={args.num_beams}")
+    print(f"exact match: {matches}/{len(fp32['outputs'])} ({matches / len(fp32['outputs']):.2%})")
+    print(f'score delta (int8 - fp32): mean {statistics.mean(deltas):+.4f}, '
+          f'mean abs {statistics.mean(abs(d) for d in deltas):.4f}, max abs {max(abs(d) for d in deltas):.4f}')
+    print('mode\tload (s)\tmedian latency (ms)\tRSS (MB)\tpeak RSS (MB)')
+    for name, result in results.items():
+        print(f"{name}\t{result['load_time']:.1f}\t{statistics.median(result['latencies']) * 1000:.1f}\t"
+              f"{result['rss']:.0f}\t{result['peak_rss']:.0f}")
+    for fp32_output, int8_output in zip(fp32['outputs'], int8['outputs']):
+        if fp32_output != int8_output:
+            print(f'  {fp32_output!r} -> {int8_output!r}')
+
+
+if __name__ == '__main__':
+    main()
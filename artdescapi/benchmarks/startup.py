@@ -0,0 +1,83 @@
+"""Startup time of the serving models with and without fast init (and the memory-mapped checkpoint).
+
+Loads the description model and the BERT model the way ``ModelLoader.load_model`` does, once per mode, each time in
+a fresh process: ``from_pretrained`` with ``_fast_init`` on (weights allocated uninitialised, only those missing from
+the checkpoint randomly initialised) or off (every weight initialised, then overwritten), reading
+``pytorch_model.bin`` or, where the directory has one, ``pytorch_model.mmap``. Reports the load time of each model,
+the peak RSS and a checksum of the weights, which has to be the same for every mode.
+
+    python -m artdescapi.benchmarks.startup --model-dir /srv/model-25lang-all/ --bert-dir /srv/bert-multilingual/
+
+The first run of a mode also pays for reading the checkpoint from disk; later runs find it in the page cache.
+"""
+import argparse
+import concurrent.futures
+import multiprocessing
+import resource
+import statistics
+import time
+
+import torch
+
+from artdescapi.transformers import AutoConfig, BertModel, MBartForConditionalGeneration
+from artdescapi.utils.utils import bert_path
+
+MODES = (('slow init, .bin', False, False), ('fast init, .bin', True, False),
+         ('slow init, .mmap', False, True), ('fast init, .mmap', True, True))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model-dir', required=True, help='checkpoint directory (e.g. /srv/model-25lang-all/)')
+    parser.add_argument('--bert-dir', default=None, help=f'BERT model directory (default: {bert_path})')
+    parser.add_argument('--repeats', type=int, default=3, help='processes started per mode')
+    return parser.parse_args()
+
+
+def checksum(model):
+    with torch.no_grad():
+        tensors = [tensor for tensor in model.state_dict().values() if tensor.is_floating_point()]
+        return sum(float(tensor.double().sum()) for tensor in tensors)
+
+
+def load_once(model_dir, bert_dir, fast_init, use_mmap):
+    """Load both models in one mode; runs in a child process."""
+    start = time.perf_counter()
+    config = AutoConfig.from_pretrained(model_dir)
+    config.graph_embd_length = 128
+    model = MBartForConditionalGeneration.from_pretrained(model_dir, config=config, _fast_init=fast_init,
+                                                          use_mmap=use_mmap)
+    model_time = time.perf_counter() - start
+    start = time.perf_counter()
+    bert_model = BertModel.from_pretrained(bert_dir, _fast_init=fast_init, use_mmap=use_mmap)
+    bert_time = time.perf_counter() - start
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return {'model': model_time, 'bert': bert_time, 'peak_rss': peak_rss,
+            'checksum': (checksum(model), checksum(bert_model))}
+
+
+def main():
+    args = parse_args()
+    bert_dir = args.bert_dir or bert_path
+    context = multiprocessing.get_context('spawn')
+    print('mode\tmodel (s)\tBERT (s)\ttotal (s)\tpeak RSS (MB)')
+    checksums = {}
+    for name, fast_init, use_mmap in MODES:
+        runs = []
+        for _ in range(args.repeats):
+            with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                runs.append(executor.submit(load_once, args.model_dir, bert_dir, fast_init, use_mmap).result())
+        checksums[name] = runs[-1]['checksum']
+        model = statistics.median(run['model'] for run in runs)
+        bert = statistics.median(run['bert'] for run in runs)
+        peak_rss = max(run['peak_rss'] for run in runs)
+        print(f'{name}\t{model:.2f}\t{bert:.2f}\t{model + bert:.2f}\t{peak_rss:.0f}')
+
+    reference = checksums[MODES[0][0]]
+    for name, value in checksums.items():
+        if value != reference:
+            print(f'  weights differ with {name}: checksums {value} vs {reference}')
+
+
+if __name__ == '__main__':
+    main()
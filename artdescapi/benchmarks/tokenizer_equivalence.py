@@ -0,0 +1,108 @@
+"""Check that the fast (Rust) tokenizers give the same ids as the slow ones and measure the speedup.
+
+Tokenizes a paragraph in each of the 25 supported languages with the slow and fast MBart tokenizers (through
+``batch_encode_multilingual``, as ModelLoader does) and BERT tokenizers, reports every language whose ids differ and
+times both implementations on the whole corpus.
+
+    python -m artdescapi.benchmarks.tokenizer_equivalence --model-dir /srv/model-25lang-all/
+"""
+import argparse
+import statistics
+import time
+
+from artdescapi.transformers import BertTokenizer, BertTokenizerFast, MBartTokenizer, MBartTokenizerFast
+from artdescapi.utils.utils import bert_path, lang_dict, load_tokenizer
+
+# one first-paragraph-like text per supported language, covering Latin, Cyrillic, Arabic, CJK, Hangul, Devanagari,
+# Gujarati, Sinhala and Myanmar scripts plus the diacritics of the Latin-script languages
+CORPUS = {
+    'en': 'Clandonald is a hamlet in central Alberta, Canada within the County of Vermilion River.',
+    'fr': "Paris est la capitale de la France. Elle se situe au cœur d'un vaste bassin sédimentaire.",
+    'it': "Roma è la capitale d'Italia e il comune più popoloso della nazione, fondata secondo la tradizione nel 753 a.C.",
+    'es': 'Madrid es un municipio y ciudad de España, capital del Estado y de la Comunidad de Madrid.',
+    'de': 'Berlin ist die Hauptstadt und ein Land der Bundesrepublik Deutschland mit rund 3,7 Millionen Einwohnern.',
+    'nl': 'Amsterdam is de hoofdstad en grootste gemeente van Nederland, gelegen in de provincie Noord-Holland.',
+    'ja': '東京都は、日本の首都であり、関東地方に位置する都である。人口は約1400万人。',
+    'zh': '北京市，简称“京”，是中华人民共和国的首都，也是全国的政治、文化中心。',
+    'ko': '서울특별시는 대한민국의 수도이자 최대 도시로, 한강을 중심으로 펼쳐져 있다.',
+    'vi': 'Hà Nội là thủ đô của nước Cộng hòa xã hội chủ nghĩa Việt Nam, nằm ở đồng bằng sông Hồng.',
+    'ru': 'Москва́ — столица России, город федерального значения, крупнейший по численности населения город страны.',
+    'cs': 'Praha je hlavní a současně největší město České republiky, ležící na řece Vltavě.',
+    'fi': 'Helsinki on Suomen pääkaupunki ja maan väkirikkain kaupunki, joka sijaitsee Suomenlahden rannalla.',
+    'lt': 'Vilnius – Lietuvos sostinė ir didžiausias šalies miestas, įsikūręs Neries ir Vilnios santakoje.',
+    'lv': 'Rīga ir Latvijas galvaspilsēta un lielākā pilsēta, kas atrodas Daugavas krastos pie Rīgas līča.',
+    'et': 'Tallinn on Eesti pealinn ja suurim linn, mis asub Soome lahe lõunarannikul.',
+    'ar': 'القاهرة هي عاصمة جمهورية مصر العربية وأكبر مدنها، وتقع على ضفاف نهر النيل.',
+    'tr': 'İstanbul, Türkiye\'nin en kalabalık şehri ve ekonomik, kültürel ve tarihi merkezidir.',
+    'ro': 'București este capitala și cel mai mare oraș al României, situat pe malurile râului Dâmbovița.',
+    'kk': 'Астана — Қазақстан Республикасының астанасы, Есіл өзенінің жағасында орналасқан қала.',
+    'gu': 'અમદાવાદ ગુજરાત રાજ્યનું સૌથી મોટું શહેર છે અને સાબરમતી નદીના કિનારે વસેલું છે.',
+    'hi': 'नई दिल्ली भारत की राजधानी है और यह राष्ट्रीय राजधानी क्षेत्र दिल्ली का हिस्सा है।',
+    'si': 'කොළඹ ශ්‍රී ලංකාවේ විශාලතම නගරය වන අතර බටහිර පළාතේ පිහිටා ඇත.',
+    'my': 'ရန်ကုန်မြို့သည် မြန်မာနိုင်ငံ၏ အကြီးဆုံးမြို့ ဖြစ်သည်။',
+    'ne': 'काठमाडौं नेपालको राजधानी तथा सबैभन्दा ठूलो सहर हो, जुन काठमाडौं उपत्यकामा अवस्थित छ।',
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--model-dir', default='facebook/mbart-large-cc25',
+                        help='checkpoint directory or hub name with the MBart tokenizer files')
+    parser.add_argument('--repeats', type=int, default=20, help='timed runs per implementation')
+    parser.add_argument('--copies', type=int, default=1, help='repeat the corpus to tokenize more text per call')
+    return parser.parse_args()
+
+
+def timed(fn, repeats):
+    fn()
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def compare(name, slow_encode, fast_encode, repeats):
+    mismatches = [lang for lang in CORPUS if slow_encode([lang]) != fast_encode([lang])]
+    slow = timed(lambda: slow_encode(list(CORPUS)), repeats)
+    fast = timed(lambda: fast_encode(list(CORPUS)), repeats)
+    print(f'{name}\t{len(CORPUS) - len(mismatches)}/{len(CORPUS)}\t{slow * 1000:.2f}\t{fast * 1000:.2f}\t'
+          f'{slow / fast:.1f}x\t{",".join(mismatches) or "-"}')
+    return mismatches
+
+
+def main():
+    args = parse_args()
+    mbart_slow = MBartTokenizer.from_pretrained(args.model_dir)
+    mbart_fast = load_tokenizer(args.model_dir, MBartTokenizer, MBartTokenizerFast)
+    bert_slow = BertTokenizer.from_pretrained(bert_path)
+    bert_fast = load_tokenizer(bert_path, BertTokenizer, BertTokenizerFast)
+    if not mbart_fast.is_fast or not bert_fast.is_fast:
+        raise SystemExit('the tokenizers library is needed for the fast tokenizers')
+
+    def mbart_encode(tokenizer):
+        def encode(langs):
+            examples = [(CORPUS[lang], lang_dict[lang]) for lang in langs] * args.copies
+            encoded = tokenizer.batch_encode_multilingual(examples)
+            return {lang_code: enc['input_ids'] for lang_code, enc in encoded.items()}
+        return encode
+
+    def bert_encode(tokenizer):
+        def encode(langs):
+            return tokenizer([CORPUS[lang] for lang in langs] * args.copies, truncation=True)['input_ids']
+        return encode
+
+    print('tokenizer\tmatching\tslow (ms)\tfast (ms)\tspeedup\tmismatched languages')
+    mismatches = compare('mbart', mbart_encode(mbart_slow), mbart_encode(mbart_fast), args.repeats)
+    mismatches += compare('bert', bert_encode(bert_slow), bert_encode(bert_fast), args.repeats)
+    for lang in sorted(set(mismatches)):
+        print(f'\n{lang}: {CORPUS[lang]}')
+        print('  mbart slow:', mbart_slow.convert_ids_to_tokens(mbart_encode(mbart_slow)([lang])[lang_dict[lang]][0]))
+        print('  mbart fast:', mbart_fast.convert_ids_to_tokens(mbart_encode(mbart_fast)([lang])[lang_dict[lang]][0]))
+        print('  bert slow:', bert_slow.convert_ids_to_tokens(bert_encode(bert_slow)([lang])[0]))
+        print('  bert fast:', bert_fast.convert_ids_to_tokens(bert_encode(bert_fast)([lang])[0]))
+
+
+if __name__ == '__main__':
+    main()
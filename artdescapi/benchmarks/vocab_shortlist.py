@@ -0,0 +1,83 @@
+"""Quality and speed of decoding with the per-target-language vocabulary shortlists.
+
+Runs every article of a features file (JSON lines as returned by ``/article`` or ``POST /articles``, i.e. with
+``lang`` and ``features``) through the serving model twice: over the full vocabulary and over the target language's
+shortlist. Reports how often the full-vocabulary greedy choice (its argmax) falls outside the shortlist, per token and
+per description, how often the shortlisted output differs, and the median latency of both.
+
+    python -m artdescapi.benchmarks.vocab_shortlist --model-dir /srv/model-25lang-all/ \\
+        --shortlists /srv/api-endpoint/cache/vocab-shortlists.json --features articles.jsonl
+"""
+import argparse
+import collections
+import statistics
+import time
+
+import torch
+
+from artdescapi.benchmarks.common import read_feature_items
+from artdescapi.transformers import load_vocab_shortlists
+from artdescapi.utils.utils import ModelLoader
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model-dir', required=True, help='checkpoint directory (e.g. /srv/model-25lang-all/)')
+    parser.add_argument('--shortlists', required=True,
+                        help='JSON file built by artdescapi.utils.build_vocab_shortlists')
+    parser.add_argument('--features', required=True, help='JSON lines with the "lang" and "features" of articles')
+    parser.add_argument('--num-beams', type=int, default=1, help='beams for the output comparison')
+    parser.add_argument('--threads', type=int, default=None, help='torch intra-op threads')
+    return parser.parse_args()
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def main():
+    args = parse_args()
+    loader = ModelLoader(encoder_buckets=None, vocab_shortlists=load_vocab_shortlists(args.shortlists))
+    loader.load_model(args.model_dir)
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+    special_ids = set(loader.tokenizer.all_special_ids)
+
+    totals = collections.Counter()
+    outside_by_lang = collections.Counter()
+    times = {'full': [], 'shortlist': []}
+    for item in read_feature_items(args.features):
+        lang = item['tgt_lang']
+        shortlist = loader.vocab_shortlist([lang])
+        if shortlist is None:
+            continue
+        greedy = loader.generate_tokens([item], [lang], vocab_shortlist=None)[0].tolist()
+        outside = [token for token in greedy if token not in special_ids and token not in shortlist]
+        totals['articles'] += 1
+        totals['tokens'] += sum(token not in special_ids for token in greedy)
+        totals['outside tokens'] += len(outside)
+        totals['outside descriptions'] += len(outside) > 0
+        outside_by_lang[lang] += len(outside) > 0
+
+        full_time, full = timed(lambda: loader.generate_tokens([item], [lang], args.num_beams, vocab_shortlist=None))
+        short_time, short = timed(lambda: loader.generate_tokens([item], [lang], args.num_beams))
+        times['full'].append(full_time)
+        times['shortlist'].append(short_time)
+        totals['changed outputs'] += full[0].tolist() != short[0].tolist()
+
+    if totals['articles'] == 0:
+        raise SystemExit('no article of the features file has a shortlist for its language')
+    print(f"articles: {totals['articles']}")
+    print(f"full-vocabulary argmax outside the shortlist: {totals['outside tokens']}/{totals['tokens']} tokens "
+          f"({totals['outside tokens'] / max(1, totals['tokens']):.2%}), "
+          f"{totals['outside descriptions']} descriptions ({totals['outside descriptions'] / totals['articles']:.2%})")
+    print('  by language:', ', '.join(f'{lang} {n}' for lang, n in outside_by_lang.most_common() if n) or '-')
+    print(f"outputs changed by the shortlist (num_beams={args.num_beams}): {totals['changed outputs']}")
+    full, short = statistics.median(times['full']), statistics.median(times['shortlist'])
+    print(f'median latency: full {full * 1000:.1f} ms, shortlist {short * 1000:.1f} ms ({full / short:.2f}x)')
+
+
+if __name__ == '__main__':
+    main()
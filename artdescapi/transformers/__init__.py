@@ -83,6 +83,7 @@ _import_structure = {
     "feature_extraction_sequence_utils": ["BatchFeature", "SequenceFeatureExtractor"],
     "file_utils": [
         "CONFIG_NAME",
+        "MMAP_WEIGHTS_NAME",
         "MODEL_CARD_NAME",
         "PYTORCH_PRETRAINED_BERT_CACHE",
         "PYTORCH_TRANSFORMERS_CACHE",
@@ -415,6 +416,7 @@ if is_torch_available():
         "TextDatasetForNextSentencePrediction",
     ]
     _import_structure["generation_beam_search"] = ["BeamScorer", "BeamSearchScorer"]
+    _import_structure["generation_encoder_cache"] = ["EncoderOutputCache"]
     _import_structure["generation_logits_process"] = [
         "ForcedBOSTokenLogitsProcessor",
         "ForcedEOSTokenLogitsProcessor",
@@ -432,6 +434,7 @@ if is_torch_available():
         "TopKLogitsWarper",
         "TopPLogitsWarper",
     ]
+    _import_structure["generation_shortlist"] = ["VocabShortlist", "load_vocab_shortlists", "save_vocab_shortlists"]
     _import_structure["generation_stopping_criteria"] = [
         "MaxLengthCriteria",
         "MaxTimeCriteria",
@@ -1419,6 +1422,7 @@ if TYPE_CHECKING:
     # Files and general utilities
     from .file_utils import (
         CONFIG_NAME,
+        MMAP_WEIGHTS_NAME,
         MODEL_CARD_NAME,
         PYTORCH_PRETRAINED_BERT_CACHE,
         PYTORCH_TRANSFORMERS_CACHE,
@@ -1725,6 +1729,7 @@ if TYPE_CHECKING:
             TextDatasetForNextSentencePrediction,
         )
         from .generation_beam_search import BeamScorer, BeamSearchScorer
+        from .generation_encoder_cache import EncoderOutputCache
         from .generation_logits_process import (
             ForcedBOSTokenLogitsProcessor,
             ForcedEOSTokenLogitsProcessor,
@@ -1742,6 +1747,7 @@ if TYPE_CHECKING:
             TopKLogitsWarper,
             TopPLogitsWarper,
         )
+        from .generation_shortlist import VocabShortlist, load_vocab_shortlists, save_vocab_shortlists
         from .generation_stopping_criteria import (
             MaxLengthCriteria,
             MaxTimeCriteria,
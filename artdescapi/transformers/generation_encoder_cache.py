@@ -0,0 +1,161 @@
+# coding=utf-8
+# Copyright 2021 The HuggingFace Inc. team
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import torch
+
+from .modeling_outputs import BaseModelOutput
+
+
+class EncoderOutputCache:
+    r"""
+    Bounded cache of per-language encoder outputs for multi-source generation.
+
+    The encoder output of a source paragraph depends only on its language and token ids, so it can be reused whenever
+    the same paragraph is encoded again, e.g. when an article is requested for several target languages in a row.
+    Entries hold the :obj:`last_hidden_state` of one sequence without its padding, keyed by the language and a hash of
+    its token ids, and are evicted least-recently-used first once they take up more than :obj:`max_bytes`.
+
+    The cache is tied to the weights of the model that filled it and has to be :meth:`clear`-ed when they change.
+
+    Args:
+        max_bytes (:obj:`int`, `optional`, defaults to 256MB):
+            Upper bound on the memory taken by the cached tensors.
+        dtype (:obj:`torch.dtype`, `optional`):
+            Precision of the stored tensors, e.g. :obj:`torch.float16` to fit twice as many entries. Defaults to the
+            precision of the encoder.
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, dtype: Optional[torch.dtype] = None):
+        self.max_bytes = max_bytes
+        self.dtype = dtype
+        self.bytes_used = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(lang: str, input_ids: torch.LongTensor) -> Tuple[str, bytes]:
+        """Cache key of the unpadded token ids :obj:`input_ids` of one sequence in :obj:`lang`."""
+        return lang, hashlib.blake2b(input_ids.cpu().numpy().tobytes(), digest_size=16).digest()
+
+    def get(self, key) -> Optional[torch.Tensor]:
+        with self._lock:
+            hidden_state = self._entries.get(key)
+            if hidden_state is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return hidden_state
+
+    def put(self, key, hidden_state: torch.Tensor) -> torch.Tensor:
+        """Cache :obj:`hidden_state` and return it as stored, i.e. in the cache's precision."""
+        hidden_state = hidden_state.detach().to(self.dtype or hidden_state.dtype).clone()
+        size = self._size(hidden_state)
+        if size > self.max_bytes:
+            return hidden_state
+        with self._lock:
+            if key in self._entries:
+                self.bytes_used -= self._size(self._entries.pop(key))
+            self._entries[key] = hidden_state
+            self.bytes_used += size
+            while self.bytes_used > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.bytes_used -= self._size(evicted)
+        return hidden_state
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes_used = 0
+
+    def stats(self) -> Dict[str, Optional[float]]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes_used,
+                "max-bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit-rate": self.hits / lookups if lookups else None,
+            }
+
+    @staticmethod
+    def _size(hidden_state):
+        return hidden_state.element_size() * hidden_state.nelement()
+
+    def encode(self, encoder, input_ids, attention_mask, language_mask=None, num_buckets=1, **encoder_kwargs):
+        r"""
+        Per-language encoder outputs like :meth:`~transformers.MBartEncoder.forward_packed`, encoding only the rows
+        that are not cached and caching those that had to be encoded.
+
+        Sequences are assumed to be right-padded, which is what the tokenizers produce. Only
+        :obj:`last_hidden_state` is returned; attentions and hidden states of cached rows aren't kept.
+
+        Returns:
+            :obj:`Dict[str, BaseModelOutput]` with an entry for every language that at least one item has.
+        """
+        lengths = {}
+        cached = {}
+        to_encode = {}
+        for lang, ids in input_ids.items():
+            if ids is None:
+                continue
+            mask = attention_mask[lang] if attention_mask[lang] is not None else torch.ones_like(ids)
+            present = language_mask[lang].bool() if language_mask is not None else mask.any(dim=-1)
+            lengths[lang] = mask.sum(dim=-1).tolist()
+            cached[lang] = {}
+            to_encode[lang] = torch.zeros_like(present, dtype=torch.long)
+            for row in present.nonzero(as_tuple=True)[0].tolist():
+                key = self.key(lang, ids[row, : lengths[lang][row]])
+                hidden_state = self.get(key)
+                if hidden_state is None:
+                    to_encode[lang][row] = 1
+                    cached[lang][row] = key
+                else:
+                    cached[lang][row] = hidden_state
+
+        if any(rows.any() for rows in to_encode.values()):
+            encoded = encoder.forward_packed(
+                input_ids, attention_mask, num_buckets=num_buckets, language_mask=to_encode, **encoder_kwargs
+            )
+        else:
+            encoded = {}
+
+        encoder_outputs = {}
+        for lang, rows in cached.items():
+            if lang in encoded:
+                last_hidden_state = encoded[lang].last_hidden_state
+            elif len(rows) > 0:
+                last_hidden_state = torch.zeros(
+                    input_ids[lang].shape + (encoder.config.d_model,), dtype=encoder.dtype, device=input_ids[lang].device
+                )
+            else:
+                continue
+            for row, entry in rows.items():
+                length = lengths[lang][row]
+                if not isinstance(entry, torch.Tensor):
+                    entry = self.put(entry, last_hidden_state[row, :length])
+                # fresh rows are rounded to the cached precision too, so outputs don't depend on what was cached
+                last_hidden_state[row, :length] = entry.to(last_hidden_state.dtype)
+            encoder_outputs[lang] = BaseModelOutput(last_hidden_state=last_hidden_state)
+        return encoder_outputs
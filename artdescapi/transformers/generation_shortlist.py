@@ -0,0 +1,115 @@
+# coding=utf-8
+# Copyright 2021 The HuggingFace Inc. team
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import itertools
+import json
+import threading
+from typing import Dict, Iterable, Optional
+
+import torch
+import torch.nn.functional as F
+
+
+class VocabShortlist:
+    r"""
+    Subset of the vocabulary that generation is restricted to, e.g. the tokens seen in descriptions of one target
+    language.
+
+    With a shortlist, the output projection of a decoding step only multiplies the hidden state by the rows of
+    :obj:`lm_head` of the shortlisted tokens; the other tokens get a logit of :obj:`-inf`, so logits processors and the
+    search keep working on full-vocabulary ids and never pick a token outside the shortlist. The sliced projection is
+    kept between calls and rebuilt whenever the model's weights change; an int8 :obj:`lm_head` is sliced dequantized.
+
+    Args:
+        token_ids (:obj:`Iterable[int]`):
+            Ids of the tokens that can be generated. Special tokens (e.g. :obj:`eos_token_id` and the language codes)
+            have to be part of it to be generated.
+    """
+
+    def __init__(self, token_ids: Iterable[int]):
+        self.token_ids = torch.unique(torch.as_tensor(list(token_ids), dtype=torch.long))
+        self._projection = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self.token_ids.shape[0]
+
+    def __contains__(self, token_id):
+        index = torch.searchsorted(self.token_ids, torch.tensor([int(token_id)]))
+        return bool(index < len(self) and self.token_ids[index] == int(token_id))
+
+    def union(self, *others: "VocabShortlist") -> "VocabShortlist":
+        """Shortlist of the tokens of this and :obj:`others`, e.g. for a batch with several target languages."""
+        return VocabShortlist(torch.cat([self.token_ids] + [other.token_ids for other in others]).tolist())
+
+    def project(
+        self, hidden_states: torch.Tensor, lm_head: torch.nn.Linear, final_logits_bias: Optional[torch.Tensor] = None
+    ) -> torch.Tensor:
+        """
+        :obj:`lm_head(hidden_states) + final_logits_bias` computed for the shortlisted tokens only, as full-vocabulary
+        logits that are :obj:`-inf` for every other token.
+        """
+        weight, bias = self._sliced(lm_head, final_logits_bias)
+        logits = F.linear(hidden_states, weight, bias.to(hidden_states.dtype) if bias is not None else None)
+        full = logits.new_full(hidden_states.shape[:-1] + (lm_head.out_features,), float("-inf"))
+        full[..., self.token_ids.to(full.device)] = logits
+        return full
+
+    def _sliced(self, lm_head, final_logits_bias):
+        # dynamically quantized heads (``torch.nn.quantized.dynamic.Linear``) expose their weight through a method
+        quantized = callable(lm_head.weight)
+        key = (
+            lm_head,
+            None if quantized else lm_head.weight.data_ptr(),
+            None if final_logits_bias is None else final_logits_bias.data_ptr(),
+        )
+        with self._lock:
+            if self._projection is None or self._projection[0] != key:
+                weight = lm_head.weight().dequantize() if quantized else lm_head.weight.detach()
+                token_ids = self.token_ids.to(weight.device)
+                sliced_bias = None if final_logits_bias is None else final_logits_bias[0].index_select(0, token_ids)
+                self._projection = (key, weight.index_select(0, token_ids), sliced_bias)
+            return self._projection[1:]
+
+    @classmethod
+    def from_corpus(
+        cls, tokenizer, texts: Iterable[str], min_count: int = 1, batch_size: int = 1000
+    ) -> "VocabShortlist":
+        """
+        Shortlist of the tokens that :obj:`tokenizer` produces at least :obj:`min_count` times over :obj:`texts`, plus
+        all of the tokenizer's special tokens.
+        """
+        counts = collections.Counter()
+        texts = iter(texts)
+        batch = list(itertools.islice(texts, batch_size))
+        while batch:
+            for ids in tokenizer(batch, add_special_tokens=False)["input_ids"]:
+                counts.update(ids)
+            batch = list(itertools.islice(texts, batch_size))
+        token_ids = [token for token, count in counts.items() if count >= min_count]
+        return cls(token_ids + list(tokenizer.all_special_ids))
+
+
+def save_vocab_shortlists(path: str, shortlists: Dict[str, VocabShortlist]):
+    """Save one shortlist per language (e.g. ``{"en": ..., "fr": ...}``) as a JSON file."""
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({lang: shortlist.token_ids.tolist() for lang, shortlist in shortlists.items()}, f)
+
+
+def load_vocab_shortlists(path: str) -> Dict[str, VocabShortlist]:
+    """Load the shortlists saved by :func:`save_vocab_shortlists`."""
+    with open(path, encoding="utf-8") as f:
+        return {lang: VocabShortlist(token_ids) for lang, token_ids in json.load(f).items()}
@@ -52,6 +52,15 @@ from .modeling_outputs import BaseModelOutput
 logger = logging.get_logger(__name__)
 
 
+def masked_mean_pooling(hidden_states: torch.Tensor, attention_mask: torch.Tensor) -> torch.Tensor:
+    """
+    Mean of :obj:`hidden_states` of shape :obj:`(batch_size, seq_len, hidden_size)` over the sequence, leaving out the
+    positions where :obj:`attention_mask` is 0 so that padding doesn't change the result. Rows without any token give 0.
+    """
+    mask = attention_mask.unsqueeze(-1).to(hidden_states.dtype)
+    return (hidden_states * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1)
+
+
 @dataclass
 class GreedySearchDecoderOnlyOutput(ModelOutput):
     """
@@ -408,22 +417,62 @@ class GenerationMixin:
                 attention_mask[lang] = input_ids[target_lang].new_ones((input_ids[target_lang].shape[0],1))
                 
         return attention_mask
+
+    @staticmethod
+    def _prepare_language_mask_for_generation(input_ids, attention_mask) -> Dict[str, torch.LongTensor]:
+        # an item has a language when its row for that language holds at least one non-padding token
+        language_mask = {}
+        for lang, mask in attention_mask.items():
+            if input_ids[lang] is None:
+                language_mask[lang] = mask.new_zeros((mask.shape[0],))
+            else:
+                language_mask[lang] = mask.any(dim=-1).long()
+        return language_mask
     
 
     def _prepare_bert_outputs(self, target_lang, bert_inputs, model_kwargs):
-        bert_outputs_list = []
-        for lang, bert_in in bert_inputs.items():
-            bert_outs = self.model_bert(**bert_in)
-            bert_outs = torch.mean(bert_outs.last_hidden_state,dim=1)
-            bert_outputs_list.append(bert_outs)
-        if len(bert_outputs_list) == 0:
-            bert_outputs = torch.zeros((1,768), device=model_kwargs["attention_mask"][target_lang[0:2]].device)
-        else:
-            bert_outputs = torch.mean(torch.stack(bert_outputs_list), dim=0)
-        return bert_outputs
+        return self._encode_bert_inputs(bert_inputs, model_kwargs["attention_mask"][target_lang[0:2]].device)
+
+    def _encode_bert_inputs(self, bert_inputs, device):
+        """
+        Embed the descriptions in ``bert_inputs`` (a dict of per-language tokenizer outputs) with a single padded
+        ``model_bert`` call, mean-pool each over its non-padded tokens and average over the languages each item has: a
+        row without any token (attention mask all zeros) counts as a missing description.
+        """
+        bert_inputs = [bert_in for bert_in in bert_inputs.values() if bert_in is not None]
+        if len(bert_inputs) == 0:
+            return torch.zeros((1, 768), device=device)
+        max_len = max(bert_in["input_ids"].shape[1] for bert_in in bert_inputs)
+        packed = {
+            key: torch.cat([F.pad(bert_in[key], (0, max_len - bert_in[key].shape[1])) for bert_in in bert_inputs])
+            for key in bert_inputs[0].keys()
+        }
+        pooled = masked_mean_pooling(self.model_bert(**packed).last_hidden_state, packed["attention_mask"])
+        pooled = pooled.view(len(bert_inputs), -1, pooled.shape[-1])
+        present = packed["attention_mask"].any(dim=-1).view(len(bert_inputs), -1, 1).to(pooled.dtype)
+        return (pooled * present).sum(dim=0) / present.sum(dim=0).clamp(min=1)
+
+    def _prepare_fused_encoder_outputs_for_generation(self, model_kwargs) -> ModelOutput:
+        # the fused memory depends only on the encoder side, so it is built once here instead of at every step
+        return self.fuse_encoder_outputs(
+            model_kwargs["encoder_outputs"],
+            model_kwargs["attention_mask"],
+            model_kwargs["main_lang"],
+            graph_embeddings=model_kwargs["graph_embeddings"],
+            bert_outputs=model_kwargs["bert_outputs"],
+            output_attentions=model_kwargs["output_attentions"],
+            language_mask=model_kwargs.get("language_mask"),
+        )
 
     def _prepare_encoder_decoder_kwargs_for_generation(
-        self, target_lang, input_ids: torch.LongTensor, baseline, mask_text, model_kwargs
+        self,
+        target_lang,
+        input_ids: torch.LongTensor,
+        baseline,
+        mask_text,
+        model_kwargs,
+        encoder_buckets=None,
+        encoder_cache=None,
     ) -> Dict[str, Any]:
         if baseline:
             if "encoder_outputs" not in model_kwargs:
@@ -437,6 +486,8 @@ class GenerationMixin:
                 attention_mask = attention_mask[target_lang]
                 encoder_kwargs.pop("graph_embeddings")
                 encoder_kwargs.pop("bert_inputs")
+                encoder_kwargs.pop("bert_outputs", None)
+                encoder_kwargs.pop("language_mask", None)
                 
                 model_kwargs["encoder_outputs"]: ModelOutput = encoder(input_ids[target_lang], attention_mask=attention_mask, return_dict=True, **encoder_kwargs)
             return model_kwargs
@@ -452,12 +503,33 @@ class GenerationMixin:
                 encoder_kwargs.pop("target_lang")
                 encoder_kwargs.pop("graph_embeddings")
                 encoder_kwargs.pop("bert_inputs")
+                encoder_kwargs.pop("bert_outputs", None)
+                language_mask = encoder_kwargs.pop("language_mask", None)
                 
                 lang_out = torch.ones((attention_mask[target_lang].shape[0],1,1), device=attention_mask[target_lang].device)
                 lang_out = expand(lang_out)
+                if encoder_cache is not None:
+                    # only the paragraphs that aren't cached go through the encoder
+                    packed_outputs = encoder_cache.encode(
+                        encoder,
+                        input_ids,
+                        attention_mask,
+                        language_mask=language_mask,
+                        num_buckets=encoder_buckets or len(input_ids),
+                        **encoder_kwargs,
+                    )
+                elif encoder_buckets is not None:
+                    # one padded encoder call per length bucket instead of one call per language
+                    packed_outputs = encoder.forward_packed(
+                        input_ids, attention_mask, num_buckets=encoder_buckets, language_mask=language_mask, **encoder_kwargs
+                    )
+                else:
+                    packed_outputs = {}
                 encoder_outputs = {}
                 for lang, inputs in input_ids.items():
-                    if inputs is not None:
+                    if lang in packed_outputs:
+                        enc_out = packed_outputs[lang]
+                    elif inputs is not None and encoder_buckets is None and encoder_cache is None:
                         enc_out = encoder(inputs, attention_mask=attention_mask[lang], return_dict=True, **encoder_kwargs)
                     else:
                         enc_out = BaseModelOutput(
@@ -548,6 +620,27 @@ class GenerationMixin:
                 mask = mask.index_select(0, expanded_return_idx)
                 attention_mask[lang] = mask
             model_kwargs["attention_mask"] = attention_mask
+
+        # beams of the same item share the fused memory, so it only has to be expanded and never reordered
+        fused_encoder_outputs = model_kwargs.get("fused_encoder_outputs")
+        if fused_encoder_outputs is not None:
+            if fused_encoder_outputs.last_hidden_state is not None:
+                fused_encoder_outputs.last_hidden_state = fused_encoder_outputs.last_hidden_state.index_select(
+                    0, expanded_return_idx
+                )
+            fused_encoder_outputs.attention_mask = fused_encoder_outputs.attention_mask.index_select(
+                0, expanded_return_idx
+            )
+            model_kwargs["fused_encoder_outputs"] = fused_encoder_outputs
+
+        language_mask = model_kwargs.get("language_mask")
+        if language_mask is not None:
+            for lang, mask in language_mask.items():
+                language_mask[lang] = mask.index_select(0, expanded_return_idx)
+            model_kwargs["language_mask"] = language_mask
+
+        if isinstance(model_kwargs.get("main_lang"), list):
+            model_kwargs["main_lang"] = [model_kwargs["main_lang"][i] for i in expanded_return_idx.tolist()]
         
         if is_encoder_decoder:
             assert encoder_outputs is not None
@@ -577,6 +670,40 @@ class GenerationMixin:
   
         return input_ids, model_kwargs
 
+    @staticmethod
+    def _expand_inputs_for_targets(
+        batch_size: int, target_langs: List[str], decoder_start_token_id: List[int], model_kwargs
+    ) -> Tuple[torch.LongTensor, Dict[str, Any]]:
+        """
+        Repeats every item once per target language (item-major) after the encoders have run on the items: the
+        encoder-side inputs are shared, while each row gets its target's paragraph as fusion query (``main_lang``) and
+        its target's decoder start token.
+        """
+        if not isinstance(decoder_start_token_id, (list, tuple)) or len(decoder_start_token_id) != len(target_langs):
+            raise ValueError("`decoder_start_token_id` needs one token id per language of `target_langs`.")
+        attention_mask = model_kwargs["attention_mask"]
+        device = next(mask.device for mask in attention_mask.values() if mask is not None)
+        index = torch.arange(batch_size, device=device).repeat_interleave(len(target_langs))
+
+        for lang, mask in attention_mask.items():
+            if mask is not None:
+                attention_mask[lang] = mask.index_select(0, index)
+        language_mask = model_kwargs.get("language_mask")
+        if language_mask is not None:
+            for lang, mask in language_mask.items():
+                language_mask[lang] = mask.index_select(0, index)
+        for lang, enc_out in model_kwargs["encoder_outputs"].items():
+            enc_out["last_hidden_state"] = enc_out.last_hidden_state.index_select(0, index)
+        for name in ("graph_embeddings", "bert_outputs"):
+            # per-(item, target) rows, e.g. descriptions that leave out each target's language, are already expanded
+            value = model_kwargs.get(name)
+            if value is not None and value.shape[0] == batch_size:
+                model_kwargs[name] = value.index_select(0, index)
+        model_kwargs["main_lang"] = [lang[0:2] for lang in target_langs] * batch_size
+
+        decoder_input_ids = torch.tensor(decoder_start_token_id, dtype=torch.long, device=device).repeat(batch_size)
+        return decoder_input_ids.unsqueeze(-1), model_kwargs
+
     @staticmethod
     def _init_sequence_length_for_generation(
         input_ids: torch.LongTensor, max_length: int
@@ -795,6 +922,11 @@ class GenerationMixin:
         main_lang: Optional[str] = None,
         baseline = False,
         mask_text = False,
+        cache_fusion = True,
+        encoder_buckets = None,
+        encoder_cache = None,
+        target_langs: Optional[List[str]] = None,
+        vocab_shortlist = None,
         **model_kwargs,
     ) -> Union[GreedySearchOutput, SampleOutput, BeamSearchOutput, BeamSampleOutput, torch.LongTensor]:
         r"""
@@ -902,6 +1034,27 @@ class GenerationMixin:
                 crash. Note that using ``remove_invalid_values`` can slow down generation.
             synced_gpus (:obj:`bool`, `optional`, defaults to :obj:`False`):
                 Whether to continue running the while loop until max_length (needed for ZeRO stage 3)
+            cache_fusion (:obj:`bool`, `optional`, defaults to :obj:`True`):
+                For multi-source models that implement ``fuse_encoder_outputs``, whether to fuse the per-language
+                encoder outputs once before decoding and reuse the result at every step, instead of recomputing the
+                fusion inside every decoder call.
+            encoder_buckets (:obj:`int`, `optional`):
+                For multi-source models, encode all source languages as padded batches instead of running the encoder
+                once per language. The languages are sorted by length and split into this many buckets, each encoded
+                with a single call. :obj:`None` keeps one encoder call per language.
+            encoder_cache (:class:`~transformers.EncoderOutputCache`, `optional`):
+                For multi-source models, a cache of per-language encoder outputs: source paragraphs that were encoded
+                before (by any earlier call, whatever its target language) are taken from it instead of re-encoded.
+            target_langs (:obj:`List[str]`, `optional`):
+                For multi-source models, decode every item into each of these languages (e.g. ``["en_XX", "fr_XX"]``)
+                in one batched search. The encoders run once per item; only the fusion and the decoder run per target.
+                :obj:`decoder_start_token_id` must then be a list with the start token of each target, and the
+                returned sequences are ordered by item, then target, then returned sequence. :obj:`bert_outputs` may
+                hold one row per item or one per (item, target).
+            vocab_shortlist (:class:`~transformers.VocabShortlist`, `optional`):
+                Only compute the output projection for the tokens of this shortlist, e.g. those of the target language,
+                and never generate any other token. With several :obj:`target_langs`, pass the union of their
+                shortlists.
 
             model_kwargs:
                 Additional model specific kwargs will be forwarded to the :obj:`forward` function of the model. If the
@@ -1021,6 +1174,11 @@ class GenerationMixin:
         model_kwargs["attention_mask"] = self._prepare_attention_mask_for_generation(
             tgt, input_ids, pad_token_id, eos_token_id
         )
+        if not baseline and model_kwargs.get("language_mask") is None:
+            # items of a batch may have different sets of source languages
+            model_kwargs["language_mask"] = self._prepare_language_mask_for_generation(
+                input_ids, model_kwargs["attention_mask"]
+            )
 
         # special case if pad_token_id is not defined
         if pad_token_id is None and eos_token_id is not None:
@@ -1032,11 +1190,22 @@ class GenerationMixin:
 
         if self.config.is_encoder_decoder:
             # add encoder_outputs to model_kwargs
-            model_kwargs = self._prepare_encoder_decoder_kwargs_for_generation(tgt, input_ids, baseline, mask_text, model_kwargs)
+            model_kwargs = self._prepare_encoder_decoder_kwargs_for_generation(
+                tgt,
+                input_ids,
+                baseline,
+                mask_text,
+                model_kwargs,
+                encoder_buckets=encoder_buckets,
+                encoder_cache=encoder_cache,
+            )
 
             # set input_ids as decoder_input_ids
             if "decoder_input_ids" in model_kwargs:
                 input_ids = model_kwargs.pop("decoder_input_ids")
+            elif target_langs is not None:
+                # built in `_expand_inputs_for_targets` below, one row per (item, target)
+                batch_size = next(ids.shape[0] for ids in input_ids.values() if ids is not None)
             else:
                 input_ids = self._prepare_decoder_input_ids_for_generation(
                     tgt, input_ids, model_kwargs, decoder_start_token_id=decoder_start_token_id, bos_token_id=bos_token_id
@@ -1051,13 +1220,26 @@ class GenerationMixin:
             model_kwargs["bert_outputs"] = bert_outputs
             
         else:
-            model_kwargs["bert_outputs"] = None
+            # callers that batch several items pass one precomputed description vector per item
+            model_kwargs["bert_outputs"] = model_kwargs.get("bert_outputs")
         
         if main_lang is None:
             model_kwargs["main_lang"] = target_lang
         else:
             model_kwargs["main_lang"] = main_lang
 
+        if target_langs is not None:
+            input_ids, model_kwargs = self._expand_inputs_for_targets(
+                batch_size, target_langs, decoder_start_token_id, model_kwargs
+            )
+
+        if vocab_shortlist is not None:
+            # set after the encoder has run: it is a decoder-only argument
+            model_kwargs["vocab_shortlist"] = vocab_shortlist
+
+        if cache_fusion and not baseline and hasattr(self, "fuse_encoder_outputs"):
+            model_kwargs["fused_encoder_outputs"] = self._prepare_fused_encoder_outputs_for_generation(model_kwargs)
+
         if input_ids.shape[-1] >= max_length:
             input_ids_string = "decoder_input_ids" if self.config.is_encoder_decoder else "input_ids"
             logger.warning(
@@ -0,0 +1,146 @@
+# coding=utf-8
+# Copyright 2021 The HuggingFace Inc. team
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Memory-mapped checkpoints: a flat file of aligned tensors that :func:`load_mmap_checkpoint` wraps without copying.
+
+Layout: the 8-byte magic ``TORCHMM1``, the little-endian uint64 length of a JSON header mapping every tensor name to
+its dtype, shape and offset, then the tensor data, starting at the first multiple of 64 bytes after the header, with
+every tensor also 64-byte aligned. Tensors sharing storage (tied weights) are stored once.
+"""
+
+import json
+import os
+import struct
+from collections import OrderedDict
+from typing import Dict, List
+
+import numpy as np
+import torch
+from torch import nn
+
+
+MMAP_MAGIC = b"TORCHMM1"
+MMAP_ALIGNMENT = 64
+
+
+def _align(offset: int) -> int:
+    return (offset + MMAP_ALIGNMENT - 1) // MMAP_ALIGNMENT * MMAP_ALIGNMENT
+
+
+def save_mmap_checkpoint(state_dict: Dict[str, torch.Tensor], path: str):
+    """
+    Write :obj:`state_dict` to :obj:`path` in the memory-mapped checkpoint format, e.g. to convert a
+    ``pytorch_model.bin`` with ``save_mmap_checkpoint(torch.load(bin_path), mmap_path)``.
+    """
+    entries = OrderedDict()
+    arrays = []
+    stored = {}  # (data_ptr, dtype, shape, stride) -> offset, so tied tensors are written once
+    size = 0
+    for name, tensor in state_dict.items():
+        tensor = tensor.detach().cpu()
+        key = (tensor.data_ptr(), tensor.dtype, tuple(tensor.shape), tensor.stride())
+        array = tensor.contiguous().numpy()
+        if key not in stored:
+            stored[key] = _align(size)
+            arrays.append((stored[key], array))
+            size = stored[key] + array.nbytes
+        entries[name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": stored[key]}
+
+    header = json.dumps(entries).encode("utf-8")
+    data_start = _align(len(MMAP_MAGIC) + 8 + len(header))
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MMAP_MAGIC)
+        f.write(struct.pack("<Q", len(header)))
+        f.write(header)
+        for offset, array in arrays:
+            f.seek(data_start + offset)
+            f.write(array.tobytes())
+        f.truncate(data_start + size)
+    os.replace(tmp_path, path)
+
+
+def load_mmap_checkpoint(path: str) -> Dict[str, torch.Tensor]:
+    """
+    The tensors of the memory-mapped checkpoint at :obj:`path`, backed by a copy-on-write mapping of the file: nothing
+    is read until a tensor is used, and processes loading the same file share its pages in the page cache until they
+    write to them.
+    """
+    with open(path, "rb") as f:
+        if f.read(len(MMAP_MAGIC)) != MMAP_MAGIC:
+            raise ValueError(f"{path} is not a memory-mapped checkpoint")
+        (header_size,) = struct.unpack("<Q", f.read(8))
+        entries = json.loads(f.read(header_size).decode("utf-8"))
+    data_start = _align(len(MMAP_MAGIC) + 8 + header_size)
+
+    buffer = np.memmap(path, dtype=np.uint8, mode="c")
+    state_dict = OrderedDict()
+    for name, entry in entries.items():
+        dtype = np.dtype(entry["dtype"])
+        start = data_start + entry["offset"]
+        nbytes = int(np.prod(entry["shape"], dtype=np.int64)) * dtype.itemsize
+        state_dict[name] = torch.from_numpy(buffer[start : start + nbytes].view(dtype).reshape(entry["shape"]))
+    return state_dict
+
+
+def assign_from_state_dict(
+    module: nn.Module,
+    state_dict: Dict[str, torch.Tensor],
+    prefix: str,
+    missing_keys: List[str],
+    unexpected_keys: List[str],
+    error_msgs: List[str],
+):
+    """
+    Like :meth:`torch.nn.Module._load_from_state_dict` (strict), but makes the module's own parameters and persistent
+    buffers point at the tensors of :obj:`state_dict` instead of copying them in, so memory-mapped weights stay
+    shared. Tensors are only copied when their dtype differs from the module's.
+    """
+    non_persistent = getattr(module, "_non_persistent_buffers_set", set())
+    local_names = set()
+    for name, param in module._parameters.items():
+        if param is None:
+            continue
+        local_names.add(name)
+        value = _checked_value(state_dict, prefix + name, param, missing_keys, error_msgs)
+        if value is not None:
+            module._parameters[name] = nn.Parameter(value.to(param.dtype), requires_grad=param.requires_grad)
+    for name, buf in module._buffers.items():
+        if buf is None or name in non_persistent:
+            continue
+        local_names.add(name)
+        value = _checked_value(state_dict, prefix + name, buf, missing_keys, error_msgs)
+        if value is not None:
+            module._buffers[name] = value.to(buf.dtype)
+
+    for key in state_dict.keys():
+        if key.startswith(prefix):
+            input_name = key[len(prefix) :].split(".", 1)[0]
+            if input_name not in module._modules and input_name not in local_names:
+                unexpected_keys.append(key)
+
+
+def _checked_value(state_dict, key, current, missing_keys, error_msgs):
+    if key not in state_dict:
+        missing_keys.append(key)
+        return None
+    value = state_dict[key]
+    if value.shape != current.shape:
+        error_msgs.append(
+            f"size mismatch for {key}: copying a param with shape {value.shape} from checkpoint, "
+            f"the shape in current model is {current.shape}."
+        )
+        return None
+    return value
@@ -243,6 +243,27 @@ class BaseModelOutputWithPastAndCrossAttentions(ModelOutput):
     cross_attentions: Optional[Tuple[torch.FloatTensor]] = None
 
 
+@dataclass
+class FusedEncoderOutput(ModelOutput):
+    """
+    Base class for the decoder memory of multi-source models, i.e. the per-language encoder outputs after they have
+    been fused together with any extra (graph, description) columns. The memory does not depend on the decoder input,
+    so it can be computed once per :obj:`generate` call and reused at every decoding step.
+
+    Args:
+        last_hidden_state (:obj:`torch.FloatTensor` of shape :obj:`(batch_size, sequence_length, hidden_size)`):
+            Fused sequence of hidden-states the decoder cross-attends to.
+        attention_mask (:obj:`torch.LongTensor` of shape :obj:`(batch_size, sequence_length)`, `optional`):
+            Mask matching :obj:`last_hidden_state`, including the columns added for the extra embeddings.
+        main_last_hidden_state (:obj:`torch.FloatTensor` of shape :obj:`(batch_size, sequence_length, hidden_size)`, `optional`):
+            Encoder output of each item's main language, onto which the other languages were fused.
+    """
+
+    last_hidden_state: torch.FloatTensor = None
+    attention_mask: Optional[torch.Tensor] = None
+    main_last_hidden_state: Optional[torch.FloatTensor] = None
+
+
 @dataclass
 class Seq2SeqModelOutput(ModelOutput):
     """
@@ -17,7 +17,9 @@
 import inspect
 import os
 import re
+import threading
 import warnings
+from contextlib import contextmanager
 from dataclasses import dataclass
 from typing import Any, Callable, Dict, List, Optional, Set, Tuple, Union
 
@@ -30,6 +32,7 @@ from .activations import get_activation
 from .configuration_utils import PretrainedConfig
 from .file_utils import (
     DUMMY_INPUTS,
+    MMAP_WEIGHTS_NAME,
     TF2_WEIGHTS_NAME,
     TF_WEIGHTS_NAME,
     WEIGHTS_NAME,
@@ -42,6 +45,7 @@ from .file_utils import (
 )
 from .generation_utils import GenerationMixin
 from .integrations import is_deepspeed_zero3_enabled
+from .modeling_mmap_utils import assign_from_state_dict, load_mmap_checkpoint, save_mmap_checkpoint
 from .utils import logging
 
 
@@ -61,6 +65,63 @@ except ImportError:
             return input
 
 
+# `torch.nn.init` functions that layers call from their constructor (`reset_parameters`); they are made no-ops while
+# a model is built by a fast `from_pretrained`, since the checkpoint overwrites the weights right after.
+TORCH_INIT_FUNCTIONS = {
+    name: getattr(nn.init, name)
+    for name in (
+        "uniform_",
+        "normal_",
+        "trunc_normal_",
+        "constant_",
+        "xavier_uniform_",
+        "xavier_normal_",
+        "kaiming_uniform_",
+        "kaiming_normal_",
+        "uniform",
+        "normal",
+        "xavier_uniform",
+        "xavier_normal",
+        "kaiming_uniform",
+        "kaiming_normal",
+    )
+    if hasattr(nn.init, name)
+}
+
+_no_init_weights_lock = threading.Lock()
+_no_init_weights_depth = 0
+
+
+def _skip_init(tensor, *args, **kwargs):
+    return tensor
+
+
+@contextmanager
+def no_init_weights(_enable: bool = True):
+    """
+    Context manager in which models are built with uninitialized weights: :meth:`PreTrainedModel.init_weights` and
+    the :obj:`torch.nn.init` functions do nothing. The flag is process-wide, so other threads shouldn't build models
+    they mean to train from scratch meanwhile.
+    """
+    global _no_init_weights_depth
+    if not _enable:
+        yield
+        return
+    with _no_init_weights_lock:
+        _no_init_weights_depth += 1
+        if _no_init_weights_depth == 1:
+            for name in TORCH_INIT_FUNCTIONS:
+                setattr(nn.init, name, _skip_init)
+    try:
+        yield
+    finally:
+        with _no_init_weights_lock:
+            _no_init_weights_depth -= 1
+            if _no_init_weights_depth == 0:
+                for name, init_function in TORCH_INIT_FUNCTIONS.items():
+                    setattr(nn.init, name, init_function)
+
+
 def find_pruneable_heads_and_indices(
     heads: List[int], n_heads: int, head_size: int, already_pruned_heads: Set[int]
 ) -> Tuple[Set[int], torch.LongTensor]:
@@ -765,8 +826,9 @@ class PreTrainedModel(nn.Module, ModuleUtilsMixin, GenerationMixin):
         """
         Initializes and prunes weights if needed.
         """
-        # Initialize weights
-        self.apply(self._init_weights)
+        # Initialize weights, unless the model is built to be loaded from a checkpoint (see `no_init_weights`)
+        if _no_init_weights_depth == 0:
+            self.apply(self._init_weights)
 
         # Prune heads if needed
         if self.config.pruned_heads:
@@ -775,6 +837,36 @@ class PreTrainedModel(nn.Module, ModuleUtilsMixin, GenerationMixin):
         # Tie weights if needed
         self.tie_weights()
 
+    def _init_missing_weights(self, missing_keys: List[str]):
+        """
+        Initializes the modules owning the parameters named in :obj:`missing_keys`, i.e. the weights a fast
+        :meth:`from_pretrained` left uninitialized because the checkpoint doesn't have them. Parameters tied to a
+        loaded one (e.g. the output embeddings) are skipped, and the loaded tensors of these modules are kept.
+        """
+        state_dict = self.state_dict(keep_vars=True)
+        missing_keys = set(missing_keys)
+        loaded = {tensor.data_ptr() for key, tensor in state_dict.items() if key not in missing_keys}
+        uninitialized = {
+            name
+            for name, param in self.named_parameters()
+            if name in missing_keys and param.data_ptr() not in loaded
+        }
+        modules = dict(self.named_modules())
+        for module_name in sorted({name.rpartition(".")[0] for name in uninitialized}):
+            module = modules[module_name]
+            prefix = module_name + "." if module_name else ""
+            kept = {
+                name: tensor.detach().clone()
+                for name, tensor in list(module._parameters.items()) + list(module._buffers.items())
+                if tensor is not None and prefix + name not in uninitialized
+            }
+            if hasattr(module, "reset_parameters"):
+                module.reset_parameters()
+            self._init_weights(module)
+            with torch.no_grad():
+                for name, tensor in kept.items():
+                    getattr(module, name).copy_(tensor)
+
     def prune_heads(self, heads_to_prune: Dict[int, List[int]]):
         """
         Prunes heads of the base model.
@@ -798,6 +890,7 @@ class PreTrainedModel(nn.Module, ModuleUtilsMixin, GenerationMixin):
         save_config: bool = True,
         state_dict: Optional[dict] = None,
         save_function: Callable = torch.save,
+        save_mmap: bool = False,
     ):
         """
         Save a model and its configuration file to a directory, so that it can be re-loaded using the
@@ -817,6 +910,9 @@ class PreTrainedModel(nn.Module, ModuleUtilsMixin, GenerationMixin):
             save_function (:obj:`Callable`):
                 The function to use to save the state dictionary. Useful on distributed training like TPUs when one
                 need to replace :obj:`torch.save` by another method.
+            save_mmap (:obj:`bool`, `optional`, defaults to :obj:`False`):
+                Whether or not to also save the weights as a memory-mapped checkpoint (``pytorch_model.mmap``). One
+                already in :obj:`save_directory` is always rewritten, as it is loaded instead of ``pytorch_model.bin``.
         """
         if os.path.isfile(save_directory):
             logger.error(f"Provided path ({save_directory}) should be a directory, not a file")
@@ -847,6 +943,11 @@ class PreTrainedModel(nn.Module, ModuleUtilsMixin, GenerationMixin):
 
         logger.info(f"Model weights saved in {output_model_file}")
 
+        mmap_model_file = os.path.join(save_directory, MMAP_WEIGHTS_NAME)
+        if save_mmap or os.path.isfile(mmap_model_file):
+            save_mmap_checkpoint(state_dict, mmap_model_file)
+            logger.info(f"Model weights saved in {mmap_model_file}")
+
     @classmethod
     def from_pretrained(cls, pretrained_model_name_or_path: Optional[Union[str, os.PathLike]], *model_args, **kwargs):
         r"""
@@ -931,6 +1032,15 @@ class PreTrainedModel(nn.Module, ModuleUtilsMixin, GenerationMixin):
                 Mirror source to accelerate downloads in China. If you are from China and have an accessibility
                 problem, you can set this option to resolve it. Note that we do not guarantee the timeliness or safety.
                 Please refer to the mirror site for more information.
+            _fast_init(:obj:`bool`, `optional`, defaults to :obj:`True`):
+                Build the model with uninitialized weights and only run the random initialization for the weights
+                missing from the checkpoint, instead of initializing all of them just to overwrite them. Only used
+                when loading a PyTorch checkpoint without DeepSpeed.
+            use_mmap (:obj:`bool`, `optional`, defaults to :obj:`True`):
+                If the model directory has a memory-mapped checkpoint (``pytorch_model.mmap``, see
+                :func:`~transformers.modeling_mmap_utils.save_mmap_checkpoint`), load it instead of
+                ``pytorch_model.bin``: its tensors become the model's parameters without being copied, so processes
+                loading the same file share one copy of the weights in the page cache.
             kwargs (remaining dictionary of keyword arguments, `optional`):
                 Can be used to update the configuration object (after it being loaded) and initiate the model (e.g.,
                 :obj:`output_attentions=True`). Behaves differently depending on whether a ``config`` is provided or
@@ -975,6 +1085,8 @@ class PreTrainedModel(nn.Module, ModuleUtilsMixin, GenerationMixin):
         use_auth_token = kwargs.pop("use_auth_token", None)
         revision = kwargs.pop("revision", None)
         mirror = kwargs.pop("mirror", None)
+        use_mmap = kwargs.pop("use_mmap", True)
+        _fast_init = kwargs.pop("_fast_init", True)
         from_pipeline = kwargs.pop("_from_pipeline", None)
         from_auto_class = kwargs.pop("_from_auto", False)
 
@@ -1017,6 +1129,9 @@ class PreTrainedModel(nn.Module, ModuleUtilsMixin, GenerationMixin):
                 elif from_tf and os.path.isfile(os.path.join(pretrained_model_name_or_path, TF2_WEIGHTS_NAME)):
                     # Load from a TF 2.0 checkpoint in priority if from_tf
                     archive_file = os.path.join(pretrained_model_name_or_path, TF2_WEIGHTS_NAME)
+                elif use_mmap and os.path.isfile(os.path.join(pretrained_model_name_or_path, MMAP_WEIGHTS_NAME)):
+                    # Load from a memory-mapped checkpoint
+                    archive_file = os.path.join(pretrained_model_name_or_path, MMAP_WEIGHTS_NAME)
                 elif os.path.isfile(os.path.join(pretrained_model_name_or_path, WEIGHTS_NAME)):
                     # Load from a PyTorch checkpoint
                     archive_file = os.path.join(pretrained_model_name_or_path, WEIGHTS_NAME)
@@ -1074,6 +1189,10 @@ class PreTrainedModel(nn.Module, ModuleUtilsMixin, GenerationMixin):
 
         # Instantiate model.
 
+        # the weights are loaded right after, so only those missing from the checkpoint get initialized below; ZeRO-3
+        # partitions the parameters as they are built, and TF checkpoints are loaded into an initialized model
+        _fast_init = _fast_init and not from_tf and not is_deepspeed_zero3_enabled()
+
         if is_deepspeed_zero3_enabled():
             import deepspeed
 
@@ -1082,11 +1201,22 @@ class PreTrainedModel(nn.Module, ModuleUtilsMixin, GenerationMixin):
             with deepspeed.zero.Init():
                 model = cls(config, *model_args, **model_kwargs)
         else:
-            model = cls(config, *model_args, **model_kwargs)
+            with no_init_weights(_enable=_fast_init):
+                model = cls(config, *model_args, **model_kwargs)
 
+        # memory-mapped tensors are assigned to the model as they are instead of being copied into its parameters
+        zero_copy = (
+            state_dict is None
+            and not from_tf
+            and resolved_archive_file is not None
+            and resolved_archive_file.endswith(MMAP_WEIGHTS_NAME)
+        )
         if state_dict is None and not from_tf:
             try:
-                state_dict = torch.load(resolved_archive_file, map_location="cpu")
+                if zero_copy:
+                    state_dict = load_mmap_checkpoint(resolved_archive_file)
+                else:
+                    state_dict = torch.load(resolved_archive_file, map_location="cpu")
             except Exception:
                 raise OSError(
                     f"Unable to load weights from pytorch checkpoint file for '{pretrained_model_name_or_path}' "
@@ -1150,6 +1280,8 @@ class PreTrainedModel(nn.Module, ModuleUtilsMixin, GenerationMixin):
                     with deepspeed.zero.GatheredParameters(list(module.parameters(recurse=False)), modifier_rank=0):
                         if torch.distributed.get_rank() == 0:
                             module._load_from_state_dict(*args)
+                elif zero_copy:
+                    assign_from_state_dict(module, state_dict, prefix, missing_keys, unexpected_keys, error_msgs)
                 else:
                     module._load_from_state_dict(*args)
 
@@ -1168,12 +1300,19 @@ class PreTrainedModel(nn.Module, ModuleUtilsMixin, GenerationMixin):
 
             load(model_to_load, prefix=start_prefix)
 
+            # names in `model` of the weights the checkpoint doesn't have, before some are dropped from the warning
+            uninitialized_keys = [key[len(start_prefix) :] for key in missing_keys]
+            if model_to_load is not model:
+                uninitialized_keys = [f"{cls.base_model_prefix}.{key}" for key in uninitialized_keys]
+
             if model.__class__.__name__ != model_to_load.__class__.__name__:
                 base_model_state_dict = model_to_load.state_dict().keys()
                 head_model_state_dict_without_base_prefix = [
                     key.split(cls.base_model_prefix + ".")[-1] for key in model.state_dict().keys()
                 ]
-                missing_keys.extend(head_model_state_dict_without_base_prefix - base_model_state_dict)
+                head_keys = head_model_state_dict_without_base_prefix - base_model_state_dict
+                missing_keys.extend(head_keys)
+                uninitialized_keys.extend(head_keys)
 
             # Some models may have keys that are not in the state by design, removing them before needlessly warning
             # the user.
@@ -1213,6 +1352,8 @@ class PreTrainedModel(nn.Module, ModuleUtilsMixin, GenerationMixin):
                 raise RuntimeError(f"Error(s) in loading state_dict for {model.__class__.__name__}:\n\t{error_msg}")
         # make sure token embedding weights are still tied if needed
         model.tie_weights()
+        if _fast_init:
+            model._init_missing_weights(uninitialized_keys)
 
         # Set model in evaluation mode to deactivate DropOut modules by default
         model.eval()
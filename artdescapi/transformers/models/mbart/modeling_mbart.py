@@ -16,7 +16,7 @@
 import copy
 import math
 import random
-from typing import Optional, Tuple
+from typing import Dict, List, Optional, Tuple, Union
 import torch
 import torch.nn.functional as F
 import torch.utils.checkpoint
@@ -35,6 +35,7 @@ from ...modeling_outputs import (
     BaseModelOutput,
     BaseModelOutputWithPastAndCrossAttentions,
     CausalLMOutputWithCrossAttentions,
+    FusedEncoderOutput,
     Seq2SeqLMOutput,
     Seq2SeqModelOutput,
     Seq2SeqQuestionAnsweringModelOutput,
@@ -108,6 +109,23 @@ def _expand_mask(mask: torch.Tensor, dtype: torch.dtype, tgt_len: Optional[int]
     return inverted_mask.masked_fill(inverted_mask.bool(), torch.finfo(dtype).min)
 
 
+def _select_main_lang(per_lang: Dict[str, torch.Tensor], main_lang: Union[str, List[str]]) -> torch.Tensor:
+    """
+    Returns `per_lang[main_lang]`, or for a list with one main language per item, the batch made of each item's row
+    from its own language, right-padded with zeros to the longest of them. Tensors are `[bsz, seq_len, ...]`.
+    """
+    if isinstance(main_lang, str):
+        return per_lang[main_lang]
+    langs = sorted(set(main_lang))
+    first = per_lang[langs[0]]
+    max_len = max(per_lang[lang].shape[1] for lang in langs)
+    selected = first.new_zeros((len(main_lang), max_len) + tuple(first.shape[2:]))
+    for lang in langs:
+        rows = torch.tensor([i for i, l in enumerate(main_lang) if l == lang], device=first.device)
+        selected[rows, : per_lang[lang].shape[1]] = per_lang[lang].index_select(0, rows)
+    return selected
+
+
 # Copied from transformers.models.bart.modeling_bart.BartLearnedPositionalEmbedding with Bart->MBart
 class MBartLearnedPositionalEmbedding(nn.Embedding):
     """
@@ -817,6 +835,103 @@ class MBartEncoder(MBartPreTrainedModel):
             last_hidden_state=hidden_states, hidden_states=encoder_states, attentions=all_attentions
         )
 
+    def forward_packed(
+        self,
+        input_ids,
+        attention_mask,
+        num_buckets=1,
+        language_mask=None,
+        head_mask=None,
+        output_attentions=None,
+        output_hidden_states=None,
+    ):
+        r"""
+        Encodes the sources of several languages with as few encoder calls as possible. The languages present in
+        :obj:`input_ids` are sorted by length, split into :obj:`num_buckets` groups, right-padded to the longest
+        sequence of their group and encoded as one batch per group. The results are sliced back to the original
+        lengths, so callers get the same per-language outputs as when calling the encoder once per language.
+
+        Args:
+            input_ids (:obj:`Dict[str, torch.LongTensor]`):
+                Per-language input ids of shape :obj:`(batch_size, sequence_length)`, :obj:`None` for missing
+                languages.
+            attention_mask (:obj:`Dict[str, torch.Tensor]`):
+                Per-language attention masks matching :obj:`input_ids`.
+            num_buckets (:obj:`int`, `optional`, defaults to 1):
+                Number of length buckets, i.e. encoder calls. More buckets mean less padding but smaller batches.
+            language_mask (:obj:`Dict[str, torch.LongTensor]`, `optional`):
+                Per-language presence mask of shape :obj:`(batch_size,)`. Rows of items that do not have a language
+                are not encoded; their outputs are zeros.
+
+        Returns:
+            :obj:`Dict[str, BaseModelOutput]` with an entry for every language that at least one item has, in the
+            order of :obj:`input_ids`.
+        """
+        present_rows = {}
+        for lang, ids in input_ids.items():
+            if ids is None:
+                continue
+            if language_mask is None:
+                present_rows[lang] = None
+            elif language_mask[lang].all():
+                present_rows[lang] = None
+            elif language_mask[lang].any():
+                present_rows[lang] = language_mask[lang].nonzero(as_tuple=True)[0]
+        langs = sorted(present_rows, key=lambda lang: input_ids[lang].shape[-1])
+        if len(langs) == 0:
+            return {}
+        num_buckets = max(1, min(num_buckets, len(langs)))
+        bucket_size = math.ceil(len(langs) / num_buckets)
+
+        def unpack(tensor, rows, lang):
+            # scatter the rows of one language back to a full batch, zeros for the items without it
+            if present_rows[lang] is None:
+                return tensor[rows]
+            full = tensor.new_zeros((input_ids[lang].shape[0],) + tensor.shape[1:])
+            full[present_rows[lang]] = tensor[rows]
+            return full
+
+        packed_outputs = {}
+        for start in range(0, len(langs), bucket_size):
+            bucket = langs[start : start + bucket_size]
+            max_len = input_ids[bucket[-1]].shape[-1]
+            packed_ids, packed_mask = [], []
+            for lang in bucket:
+                ids = input_ids[lang]
+                mask = attention_mask[lang] if attention_mask[lang] is not None else torch.ones_like(ids)
+                if present_rows[lang] is not None:
+                    ids = ids.index_select(0, present_rows[lang])
+                    mask = mask.index_select(0, present_rows[lang])
+                packed_ids.append(F.pad(ids, (0, max_len - ids.shape[-1]), value=self.padding_idx))
+                packed_mask.append(F.pad(mask, (0, max_len - mask.shape[-1]), value=0))
+
+            outputs = self(
+                input_ids=torch.cat(packed_ids, dim=0),
+                attention_mask=torch.cat(packed_mask, dim=0),
+                head_mask=head_mask,
+                output_attentions=output_attentions,
+                output_hidden_states=output_hidden_states,
+                return_dict=True,
+            )
+
+            # scatter the rows of the packed batch back to their languages
+            offset = 0
+            for lang, ids in zip(bucket, packed_ids):
+                seq_len = input_ids[lang].shape[-1]
+                rows = slice(offset, offset + ids.shape[0])
+                packed_outputs[lang] = BaseModelOutput(
+                    last_hidden_state=unpack(outputs.last_hidden_state[:, :seq_len], rows, lang),
+                    hidden_states=tuple(unpack(h[:, :seq_len], rows, lang) for h in outputs.hidden_states)
+                    if outputs.hidden_states is not None
+                    else None,
+                    attentions=tuple(unpack(a[:, :, :seq_len, :seq_len], rows, lang) for a in outputs.attentions)
+                    if outputs.attentions is not None
+                    else None,
+                )
+                offset += ids.shape[0]
+
+        return {lang: packed_outputs[lang] for lang in input_ids if lang in packed_outputs}
+
 
 class MBartDecoder(MBartPreTrainedModel):
     """
@@ -1262,6 +1377,98 @@ class MBartModel(MBartPreTrainedModel):
     def get_expand(self):
         return self.expand
 
+    def fuse_encoder_outputs(
+        self,
+        encoder_outputs,
+        attention_mask,
+        main_lang,
+        graph_embeddings=None,
+        bert_outputs=None,
+        output_attentions=False,
+        language_mask=None,
+    ):
+        r"""
+        Fuses the per-language encoder outputs into the memory the decoder cross-attends to: every language is mapped
+        onto the :obj:`main_lang` queries and averaged, then the graph and description columns are appended.
+        :obj:`main_lang` can also be a list with one language per item, e.g. when decoding into several targets.
+
+        With a per-item :obj:`language_mask` (``language_mask[lang]`` of shape :obj:`(batch_size,)`), each item only
+        averages over the languages it has; languages that no item has are skipped altogether.
+
+        Returns:
+            :class:`~transformers.modeling_outputs.FusedEncoderOutput`
+        """
+        enc_outputs = None
+        query_main = None
+        attn_mask = _select_main_lang(attention_mask, main_lang)
+        if len(encoder_outputs) != 0:
+            key, query, mask = None, None, None
+            enc_outputs_list = []
+            lang_weights = []
+
+            query_main = _select_main_lang({lang: outputs[0] for lang, outputs in encoder_outputs.items()}, main_lang)
+
+            for lang, key in encoder_outputs.items():
+                if language_mask is not None:
+                    if not language_mask[lang].any():
+                        continue
+                    lang_weights.append(language_mask[lang])
+                key = key[0]
+                mask = attention_mask[lang]
+                query = query_main
+
+                # keep padded source positions out of the mapping so padded batches match per-item results
+                mask = _expand_mask(mask, key.dtype, tgt_len=query.shape[1])
+
+                enc_outputs, att_weight, _ = self.mapping(hidden_states=query, key_value_states=key, attention_mask=mask, output_attentions=output_attentions)
+                enc_outputs = enc_outputs + query
+                enc_outputs = self.norm(enc_outputs)
+
+                residual = enc_outputs
+                enc_outputs = self.activation_fn(self.fc1(enc_outputs))
+                enc_outputs = F.dropout(enc_outputs, p=self.activation_dropout, training=self.training)
+                enc_outputs = self.fc2(enc_outputs)
+                enc_outputs = F.dropout(enc_outputs, p=self.dropout, training=self.training)
+                enc_outputs = residual + enc_outputs
+                enc_outputs = self.final_layer_norm(enc_outputs)
+
+                enc_outputs_list.append(enc_outputs)
+
+            if language_mask is None:
+                enc_outputs = torch.mean(torch.stack(enc_outputs_list), dim=0)
+            else:
+                # (num_langs, batch_size, 1, 1): average each item over the languages it actually has
+                lang_weights = torch.stack(lang_weights).to(query_main.dtype)[:, :, None, None]
+                enc_outputs = (torch.stack(enc_outputs_list) * lang_weights).sum(dim=0) / lang_weights.sum(dim=0).clamp(min=1)
+
+        #add graph embedding
+        if graph_embeddings is not None:
+            graph_embeddings_mapped = self.graph_mapping(graph_embeddings)
+            graph_embeddings_mapped = torch.reshape(graph_embeddings_mapped, shape=(graph_embeddings_mapped.shape[0],1,graph_embeddings_mapped.shape[1]))
+            if enc_outputs is None:
+                enc_outputs = graph_embeddings_mapped
+                attn_mask = torch.ones((attn_mask.shape[0], 1), device=enc_outputs.device)
+            else:
+                enc_outputs = torch.cat((enc_outputs,graph_embeddings_mapped), 1)
+                new_mask_column = torch.ones((attn_mask.shape[0], 1), device=enc_outputs.device)
+                attn_mask = torch.cat((attn_mask, new_mask_column), dim=1)
+
+        #adding summary embedding
+        if bert_outputs is not None:
+            bert_outputs = self.bert_mapping(bert_outputs)
+            bert_outputs = torch.reshape(bert_outputs, shape=(bert_outputs.shape[0], 1, bert_outputs.shape[1]))
+            if enc_outputs is None:
+                enc_outputs = bert_outputs
+                attn_mask = torch.ones((attn_mask.shape[0], 1), device=enc_outputs.device)
+            else:
+                enc_outputs = torch.cat((enc_outputs, bert_outputs), 1)
+                new_mask_column = torch.ones((attn_mask.shape[0], 1), device=enc_outputs.device)
+                attn_mask = torch.cat((attn_mask, new_mask_column), dim=1)
+
+        return FusedEncoderOutput(
+            last_hidden_state=enc_outputs, attention_mask=attn_mask, main_last_hidden_state=query_main
+        )
+
     @add_start_docstrings_to_model_forward(MBART_INPUTS_DOCSTRING)
     @add_code_sample_docstrings(
         tokenizer_class=_TOKENIZER_FOR_DOC,
@@ -1289,6 +1496,9 @@ class MBartModel(MBartPreTrainedModel):
         main_lang=None,
         graph_embeddings=None,
         bert_outputs=None,
+        fused_encoder_outputs=None,
+        encoder_buckets=None,
+        language_mask=None,
     ):
         output_attentions = output_attentions if output_attentions is not None else self.config.output_attentions
         output_hidden_states = (
@@ -1305,13 +1515,29 @@ class MBartModel(MBartPreTrainedModel):
         assert(target_lang is not None)
         assert(main_lang is not None)
 
-        lang_out = torch.ones((attention_mask[main_lang].shape[0],1,1), device=attention_mask[main_lang].device)
-        lang_out = self.expand(lang_out)
+        if encoder_outputs is None and fused_encoder_outputs is None:
+            main_mask = _select_main_lang(attention_mask, main_lang)
+            lang_out = torch.ones((main_mask.shape[0],1,1), device=main_mask.device)
+            lang_out = self.expand(lang_out)
+
+            if encoder_buckets is not None:
+                packed_outputs = self.encoder.forward_packed(
+                    input_ids,
+                    attention_mask,
+                    num_buckets=encoder_buckets,
+                    language_mask=language_mask,
+                    head_mask=head_mask,
+                    output_attentions=output_attentions,
+                    output_hidden_states=output_hidden_states,
+                )
+            else:
+                packed_outputs = {}
 
-        if encoder_outputs is None:
             encoder_outputs = {}
             for lang, input_ids_val in input_ids.items():
-                if input_ids_val is not None:
+                if lang in packed_outputs:
+                    encoder_outputs_val = packed_outputs[lang]
+                elif input_ids_val is not None and encoder_buckets is None:
                     encoder_outputs_val = self.encoder(
                         input_ids=input_ids_val,
                         attention_mask=attention_mask[lang],
@@ -1329,7 +1555,7 @@ class MBartModel(MBartPreTrainedModel):
                     )
                 encoder_outputs[lang] = encoder_outputs_val
         # If the user passed a tuple for encoder_outputs, we wrap it in a BaseModelOutput when return_dict=False
-        elif return_dict:
+        elif encoder_outputs is not None and return_dict:
             for key, encoder_outputs_val in encoder_outputs.items():
                 if not isinstance(encoder_outputs_val, BaseModelOutput):
                     encoder_outputs_val = BaseModelOutput(
@@ -1339,61 +1565,20 @@ class MBartModel(MBartPreTrainedModel):
                     )
                     encoder_outputs[key] = encoder_outputs_val
 
-        enc_outputs = None
-        attn_mask = attention_mask[main_lang]
-        if len(encoder_outputs) != 0:
-            key, query, mask = None, None, None
-            enc_outputs_list = []
-
-            query_main = encoder_outputs[main_lang][0]
-
-            for lang, key in encoder_outputs.items():
-                key = key[0]
-                mask = attention_mask[lang]
-                query = query_main
-
-                mask = 1.0 - mask
-
-                enc_outputs, att_weight, _ = self.mapping(hidden_states=query, key_value_states=key, output_attentions=output_attentions)
-                enc_outputs = enc_outputs + query
-                enc_outputs = self.norm(enc_outputs)
-
-                residual = enc_outputs
-                enc_outputs = self.activation_fn(self.fc1(enc_outputs))
-                enc_outputs = F.dropout(enc_outputs, p=self.activation_dropout, training=self.training)
-                enc_outputs = self.fc2(enc_outputs)
-                enc_outputs = F.dropout(enc_outputs, p=self.dropout, training=self.training)
-                enc_outputs = residual + enc_outputs
-                enc_outputs = self.final_layer_norm(enc_outputs)
-
-                enc_outputs_list.append(enc_outputs)
-
-            
-            enc_outputs = torch.mean(torch.stack(enc_outputs_list), dim=0)
-
-        #add graph embedding
-        if graph_embeddings is not None:
-            graph_embeddings_mapped = self.graph_mapping(graph_embeddings)
-            graph_embeddings_mapped = torch.reshape(graph_embeddings_mapped, shape=(graph_embeddings_mapped.shape[0],1,graph_embeddings_mapped.shape[1]))
-            if enc_outputs is None:
-                enc_outputs = graph_embeddings_mapped
-                attn_mask = torch.ones((attn_mask.shape[0], 1), device=enc_outputs.device)
-            else:
-                enc_outputs = torch.cat((enc_outputs,graph_embeddings_mapped), 1)
-                new_mask_column = torch.ones((attn_mask.shape[0], 1), device=enc_outputs.device)
-                attn_mask = torch.cat((attn_mask, new_mask_column), dim=1)
-
-        #adding summary embedding
-        if bert_outputs is not None:
-            bert_outputs = self.bert_mapping(bert_outputs)
-            bert_outputs = torch.reshape(bert_outputs, shape=(bert_outputs.shape[0], 1, bert_outputs.shape[1]))
-            if enc_outputs is None:
-                enc_outputs = bert_outputs
-                attn_mask = torch.ones((attn_mask.shape[0], 1), device=enc_outputs.device)
-            else:
-                enc_outputs = torch.cat((enc_outputs, bert_outputs), 1)
-                new_mask_column = torch.ones((attn_mask.shape[0], 1), device=enc_outputs.device)
-                attn_mask = torch.cat((attn_mask, new_mask_column), dim=1)
+        # the fused memory only depends on the encoder side, so generation computes it once and passes it back in
+        fused_in_call = fused_encoder_outputs is None
+        if fused_in_call:
+            fused_encoder_outputs = self.fuse_encoder_outputs(
+                encoder_outputs,
+                attention_mask,
+                main_lang,
+                graph_embeddings=graph_embeddings,
+                bert_outputs=bert_outputs,
+                output_attentions=output_attentions,
+                language_mask=language_mask,
+            )
+        enc_outputs = fused_encoder_outputs.last_hidden_state
+        attn_mask = fused_encoder_outputs.attention_mask
 
         # decoder outputs consists of (dec_features, past_key_value, dec_hidden, dec_attn)
         decoder_outputs = self.decoder(
@@ -1414,10 +1599,15 @@ class MBartModel(MBartPreTrainedModel):
         if not return_dict:
             return decoder_outputs + encoder_outputs
 
-        if len(encoder_outputs) != 0:
+        if encoder_outputs is not None and len(encoder_outputs) != 0 and isinstance(main_lang, str):
             enc_last_hidden_state = encoder_outputs[main_lang].last_hidden_state
             enc_hidden_states = encoder_outputs[main_lang].hidden_states
             enc_attentions = encoder_outputs[main_lang].attentions
+        elif encoder_outputs is not None and len(encoder_outputs) != 0:
+            # selected once by the fusion; a fused memory passed back in (generation) may have been expanded since
+            enc_last_hidden_state = fused_encoder_outputs.main_last_hidden_state if fused_in_call else None
+            enc_hidden_states = None
+            enc_attentions = None
         else:
             enc_last_hidden_state = None
             enc_hidden_states = None
@@ -1630,6 +1820,9 @@ class MBartForConditionalGeneration(MBartPreTrainedModel):
     def get_model_bert(self):
         return self.model_bert
 
+    def fuse_encoder_outputs(self, encoder_outputs, attention_mask, main_lang, **kwargs):
+        return self.model.fuse_encoder_outputs(encoder_outputs, attention_mask, main_lang, **kwargs)
+
     def resize_token_embeddings(self, new_num_tokens: int) -> nn.Embedding:
         new_embeddings = super().resize_token_embeddings(new_num_tokens)
         self._resize_final_logits_bias(new_num_tokens)
@@ -1675,12 +1868,18 @@ class MBartForConditionalGeneration(MBartPreTrainedModel):
         graph_embeddings=None,
         bert_inputs=None,
         bert_outputs=None,
+        fused_encoder_outputs=None,
+        encoder_buckets=None,
+        language_mask=None,
+        vocab_shortlist=None,
     ):
         r"""
         labels (:obj:`torch.LongTensor` of shape :obj:`(batch_size, sequence_length)`, `optional`):
             Labels for computing the masked language modeling loss. Indices should either be in ``[0, ...,
             config.vocab_size]`` or -100 (see ``input_ids`` docstring). Tokens with indices set to ``-100`` are ignored
             (masked), the loss is only computed for the tokens with labels in ``[0, ..., config.vocab_size]``.
+        vocab_shortlist (:class:`~transformers.VocabShortlist`, `optional`):
+            Only project onto the shortlisted tokens; the logits of all other tokens are ``-inf``.
 
         Returns:
 
@@ -1693,16 +1892,8 @@ class MBartForConditionalGeneration(MBartPreTrainedModel):
             if decoder_input_ids is None:
                 decoder_input_ids = shift_tokens_right(labels, self.config.pad_token_id)
 
-        bert_outputs_list = []
-        if (bert_outputs is None) and (self.model_bert is not None):
-            for lang, bert_in in bert_inputs.items():
-                bert_outs = self.model_bert(**bert_in)
-                bert_outs = torch.mean(bert_outs.last_hidden_state,dim=1)
-                bert_outputs_list.append(bert_outs)
-            if len(bert_outputs_list) == 0:
-                bert_outputs = torch.zeros((1,768), device=attention_mask[target_lang[0:2]].device)
-            else:
-                bert_outputs = torch.mean(torch.stack(bert_outputs_list), dim=0)
+        if (bert_outputs is None) and (self.model_bert is not None) and (fused_encoder_outputs is None):
+            bert_outputs = self._encode_bert_inputs(bert_inputs, attention_mask[target_lang[0:2]].device)
 
 
         outputs = self.model(
@@ -1724,8 +1915,14 @@ class MBartForConditionalGeneration(MBartPreTrainedModel):
             main_lang=main_lang,
             graph_embeddings=graph_embeddings,
             bert_outputs=bert_outputs,
+            fused_encoder_outputs=fused_encoder_outputs,
+            encoder_buckets=encoder_buckets,
+            language_mask=language_mask,
         )
-        lm_logits = self.lm_head(outputs[0]) + self.final_logits_bias
+        if vocab_shortlist is not None:
+            lm_logits = vocab_shortlist.project(outputs[0], self.lm_head, self.final_logits_bias)
+        else:
+            lm_logits = self.lm_head(outputs[0]) + self.final_logits_bias
 
         masked_lm_loss = None
         if labels is not None:
@@ -1767,6 +1964,9 @@ class MBartForConditionalGeneration(MBartPreTrainedModel):
             "graph_embeddings": kwargs["graph_embeddings"],
             "bert_inputs": kwargs["bert_inputs"],
             "bert_outputs": kwargs["bert_outputs"],
+            "fused_encoder_outputs": kwargs.get("fused_encoder_outputs"),
+            "language_mask": kwargs.get("language_mask"),
+            "vocab_shortlist": kwargs.get("vocab_shortlist"),
         }
 
     def prepare_decoder_input_ids_from_labels(self, labels: torch.Tensor):
@@ -2139,17 +2339,9 @@ class MBartFourDecodersConditional(MBartPreTrainedModel):
             if decoder_input_ids is None:
                 decoder_input_ids = shift_tokens_right(labels, self.config.pad_token_id)
 
-        bert_outputs_list = []
         if (bert_outputs is None):
             if bert_inputs is not None:
-                for lang, bert_in in bert_inputs.items():
-                    bert_outs = self.model_bert(**bert_in)
-                    bert_outs = torch.mean(bert_outs.last_hidden_state,dim=1)
-                    bert_outputs_list.append(bert_outs)
-                if len(bert_outputs_list) == 0:
-                    bert_outputs = torch.zeros((1,768), device=attention_mask[target_lang[0:2]].device)
-                else:
-                    bert_outputs = torch.mean(torch.stack(bert_outputs_list), dim=0)
+                bert_outputs = self._encode_bert_inputs(bert_inputs, attention_mask[target_lang[0:2]].device)
             else:
                 bert_outputs = None
 
@@ -14,8 +14,9 @@
 # limitations under the License.
 
 from contextlib import contextmanager
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple, Union
 
+from ...file_utils import PaddingStrategy, TensorType
 from ...tokenization_utils import BatchEncoding
 from ...utils import logging
 from ..xlm_roberta.tokenization_xlm_roberta import XLMRobertaTokenizer
@@ -198,6 +199,59 @@ class MBartTokenizer(XLMRobertaTokenizer):
         self.tgt_lang = tgt_lang
         return super().prepare_seq2seq_batch(src_texts, tgt_texts, **kwargs)
 
+    def batch_encode_multilingual(
+        self,
+        examples: List[Tuple[str, str]],
+        padding: Union[bool, str, PaddingStrategy] = True,
+        truncation: bool = True,
+        max_length: Optional[int] = None,
+        return_tensors: Optional[Union[str, TensorType]] = None,
+    ) -> Dict[str, BatchEncoding]:
+        """
+        Tokenize source texts in several languages with a single call, without changing :obj:`src_lang`.
+
+        All texts are tokenized together in one batch, then grouped by language and given that language's
+        special tokens, so the cost scales with the amount of text rather than with the number of languages. Since the
+        tokenizer's state is left untouched, this is also safe to call from several threads at once.
+
+        Args:
+            examples (:obj:`List[Tuple[str, str]]`):
+                ``(text, src_lang)`` pairs, e.g. ``[("UN Chief Says There Is No Plan", "en_XX"), ("Şeful ONU declară",
+                "ro_RO")]``.
+            padding (:obj:`bool`, :obj:`str` or :class:`~transformers.file_utils.PaddingStrategy`, `optional`, defaults to :obj:`True`):
+                Padding applied within each language, as in :meth:`~transformers.PreTrainedTokenizerBase.pad`.
+            truncation (:obj:`bool`, `optional`, defaults to :obj:`True`):
+                Whether to truncate texts so that, with their special tokens, they fit in :obj:`max_length`.
+            max_length (:obj:`int`, `optional`):
+                Maximum length of an encoded text, special tokens included. Defaults to :obj:`model_max_length`.
+            return_tensors (:obj:`str` or :class:`~transformers.file_utils.TensorType`, `optional`):
+                If set, return tensors instead of lists of python integers, e.g. ``"pt"`` for PyTorch.
+
+        Returns:
+            :obj:`Dict[str, BatchEncoding]`: For each source language in :obj:`examples` (in order of first
+            appearance), the ``input_ids`` and ``attention_mask`` of its texts in input order, formatted as ``X [eos,
+            src_lang_code]`` like :obj:`src_lang` would give.
+        """
+        if len(examples) == 0:
+            return {}
+        if max_length is None:
+            max_length = self.model_max_length
+        suffix_length = 2  # [eos, src_lang_code]
+        encoded = self(
+            [text for text, _ in examples],
+            add_special_tokens=False,
+            truncation=truncation,
+            max_length=max_length - suffix_length if truncation else None,
+        )["input_ids"]
+
+        rows = {}
+        for ids, (_, src_lang) in zip(encoded, examples):
+            rows.setdefault(src_lang, []).append(ids + [self.eos_token_id, self.convert_tokens_to_ids(src_lang)])
+        return {
+            src_lang: self.pad({"input_ids": lang_rows}, padding=padding, return_tensors=return_tensors)
+            for src_lang, lang_rows in rows.items()
+        }
+
     @contextmanager
     def as_target_tokenizer(self):
         """
@@ -123,6 +123,11 @@ class BeamSearchScorer:
         requires_backends(self, ["torch"])
 
 
+class EncoderOutputCache:
+    def __init__(self, *args, **kwargs):
+        requires_backends(self, ["torch"])
+
+
 class ForcedBOSTokenLogitsProcessor:
     def __init__(self, *args, **kwargs):
         requires_backends(self, ["torch"])
@@ -198,6 +203,19 @@ class TopPLogitsWarper:
         requires_backends(self, ["torch"])
 
 
+class VocabShortlist:
+    def __init__(self, *args, **kwargs):
+        requires_backends(self, ["torch"])
+
+
+def load_vocab_shortlists(*args, **kwargs):
+    requires_backends(load_vocab_shortlists, ["torch"])
+
+
+def save_vocab_shortlists(*args, **kwargs):
+    requires_backends(save_vocab_shortlists, ["torch"])
+
+
 class MaxLengthCriteria:
     def __init__(self, *args, **kwargs):
         requires_backends(self, ["torch"])
@@ -0,0 +1,72 @@
+import concurrent.futures
+import queue
+import threading
+import time
+
+
+class BatchScheduler:
+	"""Micro-batches concurrent predictions in front of a ModelLoader.
+
+	Requests that arrive within `max_wait` seconds of the first queued one (up to `max_batch_size` of them) are run
+	together through a single `predict_batch` call on a background thread; each caller blocks until its own output
+	is ready. With `workers` > 1, that many batches can be in `predict_batch` at once. `predict_batch` is called with
+	`return_exceptions=True`, so that an item that fails only fails its own caller.
+	"""
+
+	def __init__(self, predict_batch, max_batch_size=8, max_wait=0.01, workers=1):
+		self.predict_batch = predict_batch
+		self.max_batch_size = max_batch_size
+		self.max_wait = max_wait
+		self.workers = workers
+		self._queue = queue.Queue()
+		self._threads = []
+		self._lock = threading.Lock()
+
+	def predict(self, sources, descriptions, tgt_lang, num_beams=1, num_return_sequences=1):
+		item = {'sources': sources, 'descriptions': descriptions, 'tgt_lang': tgt_lang,
+				'num_beams': num_beams, 'num_return_sequences': num_return_sequences}
+		return self.submit(item).result()
+
+	def submit(self, item):
+		"""Queue one item for prediction and return a Future for its output."""
+		self._ensure_started()
+		future = concurrent.futures.Future()
+		self._queue.put((item, future))
+		return future
+
+	def _ensure_started(self):
+		# started lazily so that the worker threads live in the process that serves requests
+		with self._lock:
+			self._threads = [thread for thread in self._threads if thread.is_alive()]
+			while len(self._threads) < self.workers:
+				thread = threading.Thread(target=self._run, name=f'batch-scheduler-{len(self._threads)}', daemon=True)
+				thread.start()
+				self._threads.append(thread)
+
+	def _next_batch(self):
+		batch = [self._queue.get()]
+		deadline = time.monotonic() + self.max_wait
+		while len(batch) < self.max_batch_size:
+			timeout = deadline - time.monotonic()
+			if timeout <= 0:
+				break
+			try:
+				batch.append(self._queue.get(timeout=timeout))
+			except queue.Empty:
+				break
+		return batch
+
+	def _run(self):
+		while True:
+			batch = self._next_batch()
+			try:
+				outputs = self.predict_batch([item for item, _ in batch], return_exceptions=True)
+			except Exception as e:
+				for _, future in batch:
+					future.set_exception(e)
+			else:
+				for (_, future), output in zip(batch, outputs):
+					if isinstance(output, Exception):
+						future.set_exception(output)
+					else:
+						future.set_result(output)
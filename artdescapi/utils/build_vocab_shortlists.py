@@ -0,0 +1,46 @@
+"""Build the per-target-language vocabulary shortlists (VOCAB_SHORTLISTS_PATH) from existing Wikidata descriptions.
+
+Tokenizes the descriptions of each supported language in a Wikidata JSON dump with the MBart tokenizer and keeps, per
+language, every token used at least `--min-count` times plus the special tokens, e.g.:
+
+	python -m artdescapi.utils.build_vocab_shortlists --dump latest-all.json.gz --model-dir /srv/model-25lang-all/ \
+		--out /srv/api-endpoint/cache/vocab-shortlists.json
+
+Check the result with `python -m artdescapi.benchmarks.vocab_shortlist` before serving with it.
+"""
+import argparse
+
+from artdescapi.transformers import MBartTokenizer, MBartTokenizerFast, VocabShortlist, save_vocab_shortlists
+from artdescapi.utils.prewarm_embeddings import iter_descriptions
+from artdescapi.utils.utils import lang_dict, load_tokenizer
+
+
+def collect_descriptions(path, langs, max_entities=None, max_per_lang=None):
+	"""Distinct descriptions per language; with `max_per_lang`, only the first ones of each language are kept."""
+	descriptions = {lang: set() for lang in langs}
+	for lang, description in iter_descriptions(path, langs, max_entities):
+		if max_per_lang is None or len(descriptions[lang]) < max_per_lang:
+			descriptions[lang].add(description)
+	return descriptions
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--dump', required=True, help='Wikidata JSON dump')
+	parser.add_argument('--model-dir', required=True, help='checkpoint directory with the MBart tokenizer files')
+	parser.add_argument('--out', required=True, help='JSON file for the shortlists (VOCAB_SHORTLISTS_PATH)')
+	parser.add_argument('--min-count', type=int, default=2, help='skip tokens used fewer times than this')
+	parser.add_argument('--max-entities', type=int, default=None, help='only read the first N entities of the dump')
+	parser.add_argument('--max-per-lang', type=int, default=None, help='distinct descriptions to use per language')
+	args = parser.parse_args()
+
+	tokenizer = load_tokenizer(args.model_dir, MBartTokenizer, MBartTokenizerFast)
+	descriptions = collect_descriptions(args.dump, set(lang_dict), args.max_entities, args.max_per_lang)
+	shortlists = {}
+	for lang, texts in descriptions.items():
+		shortlists[lang] = VocabShortlist.from_corpus(tokenizer, sorted(texts), min_count=args.min_count)
+		print(f'{lang}: {len(texts)} descriptions, {len(shortlists[lang])}/{len(tokenizer)} tokens')
+	save_vocab_shortlists(args.out, shortlists)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,171 @@
+import collections
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+
+import numpy as np
+
+
+class LRUCache:
+	"""Thread-safe in-memory LRU cache with a per-entry time-to-live and hit/miss counters.
+
+	Keys and values must be JSON-serialisable if a `SqliteStore` is attached; entries evicted from memory or lost in
+	a restart are then looked up there before counting as a miss. JSON turns tuples into lists, so callers should
+	only rely on values being sequences.
+	"""
+
+	def __init__(self, max_entries=10000, ttl=3600, store=None):
+		self.max_entries = max_entries
+		self.ttl = ttl
+		self.store = store
+		self._entries = collections.OrderedDict()
+		self._lock = threading.Lock()
+		self.hits = 0
+		self.store_hits = 0
+		self.misses = 0
+
+	def get(self, key, default=None):
+		now = time.time()
+		with self._lock:
+			entry = self._entries.get(key)
+			if entry is not None:
+				expires, value = entry
+				if expires is None or expires > now:
+					self._entries.move_to_end(key)
+					self.hits += 1
+					return value
+				del self._entries[key]
+		if self.store is not None:
+			entry = self.store.get(key, now)
+			if entry is not None:
+				expires, value = entry
+				with self._lock:
+					self._put(key, expires, value)
+					self.store_hits += 1
+				return value
+		with self._lock:
+			self.misses += 1
+		return default
+
+	def set(self, key, value, ttl=None):
+		"""Cache `value`; `ttl` overrides the cache-wide time-to-live for this entry (None: use the default)."""
+		ttl = ttl if ttl is not None else self.ttl
+		expires = time.time() + ttl if ttl is not None else None
+		with self._lock:
+			self._put(key, expires, value)
+		if self.store is not None:
+			self.store.set(key, expires, value)
+
+	def _put(self, key, expires, value):
+		self._entries[key] = (expires, value)
+		self._entries.move_to_end(key)
+		while len(self._entries) > self.max_entries:
+			self._entries.popitem(last=False)
+
+	def stats(self):
+		with self._lock:
+			lookups = self.hits + self.store_hits + self.misses
+			return {'entries': len(self._entries), 'hits': self.hits, 'store-hits': self.store_hits,
+					'misses': self.misses, 'hit-rate': (self.hits + self.store_hits) / lookups if lookups else None}
+
+
+class SqliteStore:
+	"""On-disk backend for `LRUCache` so that cached entries survive process restarts.
+
+	Rows are pruned of expired entries when opened and whenever `prune_every` new entries have been written; beyond
+	`max_entries` rows the ones closest to expiring are dropped. A process forked after the store is opened (e.g. a
+	uWSGI worker forked from the master) opens its own connection, since SQLite connections can't be shared across
+	fork().
+	"""
+
+	def __init__(self, path, table='cache', max_entries=100000, prune_every=1000):
+		self.table = table
+		self.max_entries = max_entries
+		self.prune_every = prune_every
+		self.path = path
+		self._writes = 0
+		self._lock = threading.Lock()
+		self._pid = None
+		self._conn = None
+		self._connection().execute(
+			f'CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, expires REAL, value TEXT)')
+		self.prune()
+
+	def _connection(self):
+		if self._pid != os.getpid():
+			# an inherited connection is left alone -- closing it in the child could release the parent's locks
+			self._inherited_conn = self._conn
+			self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+			self._conn.execute('PRAGMA journal_mode=WAL')
+			self._pid = os.getpid()
+		return self._conn
+
+	def get(self, key, now):
+		with self._lock:
+			row = self._connection().execute(f'SELECT expires, value FROM {self.table} WHERE key = ?',
+											 (json.dumps(key),)).fetchone()
+		if row is None or (row[0] is not None and row[0] <= now):
+			return None
+		return row[0], json.loads(row[1])
+
+	def set(self, key, expires, value):
+		with self._lock:
+			self._connection().execute(f'INSERT OR REPLACE INTO {self.table} (key, expires, value) VALUES (?, ?, ?)',
+									   (json.dumps(key), expires, json.dumps(value)))
+			self._writes += 1
+			prune = self._writes % self.prune_every == 0
+		if prune:
+			self.prune()
+
+	def prune(self):
+		with self._lock:
+			conn = self._connection()
+			conn.execute(f'DELETE FROM {self.table} WHERE expires IS NOT NULL AND expires <= ?', (time.time(),))
+			conn.execute(f'DELETE FROM {self.table} WHERE key IN (SELECT key FROM {self.table} '
+						 f'ORDER BY expires IS NULL DESC, expires DESC LIMIT -1 OFFSET ?)', (self.max_entries,))
+
+
+def description_key(lang, text):
+	"""64-bit key for a description: a hash of its language and its text with case, Unicode form and whitespace
+	normalised (the uncased BERT model doesn't see those differences)."""
+	text = ' '.join(unicodedata.normalize('NFC', text).lower().split())
+	digest = hashlib.blake2b(f'{lang}\t{text}'.encode('utf-8'), digest_size=8).digest()
+	return int.from_bytes(digest, 'little')
+
+
+class MmapVectorStore:
+	"""Read-only on-disk backend for an `LRUCache` of vectors keyed by `description_key`.
+
+	The store is a directory holding `keys.npy` (sorted uint64 keys) and `vectors.npy` (one float16 row per key),
+	both memory-mapped so that lookups only page in the rows they touch and every process shares the page cache.
+	It is written once, ahead of time, with `MmapVectorStore.build`; new entries only go to the in-memory cache.
+	"""
+
+	def __init__(self, path):
+		self.keys = np.load(os.path.join(path, 'keys.npy'), mmap_mode='r')
+		self.vectors = np.load(os.path.join(path, 'vectors.npy'), mmap_mode='r')
+
+	def __len__(self):
+		return len(self.keys)
+
+	def get(self, key, now):
+		i = int(np.searchsorted(self.keys, np.uint64(key)))
+		if i == len(self.keys) or int(self.keys[i]) != key:
+			return None
+		return None, np.array(self.vectors[i])
+
+	def set(self, key, expires, value):
+		pass
+
+	@staticmethod
+	def build(path, keys, vectors):
+		"""Write a store from parallel sequences of keys and vectors (later duplicates of a key are dropped)."""
+		keys = np.asarray(keys, dtype=np.uint64)
+		keys, first = np.unique(keys, return_index=True)
+		os.makedirs(path, exist_ok=True)
+		np.save(os.path.join(path, 'vectors.npy'), np.asarray(vectors, dtype=np.float16)[first])
+		np.save(os.path.join(path, 'keys.npy'), keys)
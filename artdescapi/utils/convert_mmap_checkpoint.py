@@ -0,0 +1,51 @@
+"""Convert checkpoints to the memory-mapped format that `from_pretrained` loads without copying.
+
+Writes a `pytorch_model.mmap` next to the `pytorch_model.bin` of each model directory; `from_pretrained` then maps
+it instead of deserialising the .bin, so startup is bounded by page faults and all uWSGI workers share one copy of
+the weights in the page cache. With `--bert-dir`, the BERT model used for descriptions (fetched from the hub by
+default) is saved there with its tokenizer and a memory-mapped checkpoint; point BERT_MODEL_DIR at it. E.g.:
+
+	python -m artdescapi.utils.convert_mmap_checkpoint /srv/model-25lang-all/ --bert-dir /srv/bert-multilingual/
+"""
+import argparse
+import os
+
+import torch
+
+from artdescapi.transformers import BertModel, BertTokenizer, BertTokenizerFast, MMAP_WEIGHTS_NAME, WEIGHTS_NAME
+from artdescapi.transformers.modeling_mmap_utils import load_mmap_checkpoint, save_mmap_checkpoint
+from artdescapi.utils.utils import bert_path, load_tokenizer
+
+
+def convert(model_dir, verify=True):
+	bin_path = os.path.join(model_dir, WEIGHTS_NAME)
+	mmap_path = os.path.join(model_dir, MMAP_WEIGHTS_NAME)
+	state_dict = torch.load(bin_path, map_location='cpu')
+	save_mmap_checkpoint(state_dict, mmap_path)
+	if verify:
+		mapped = load_mmap_checkpoint(mmap_path)
+		if mapped.keys() != state_dict.keys() or not all(torch.equal(mapped[k], v) for k, v in state_dict.items()):
+			os.remove(mmap_path)
+			raise SystemExit(f'{mmap_path} does not match {bin_path}; removed it')
+	print(f'{bin_path} -> {mmap_path} ({os.path.getsize(mmap_path) / 2 ** 20:.0f} MB)')
+
+def save_bert(bert_dir):
+	load_tokenizer(bert_path, BertTokenizer, BertTokenizerFast).save_pretrained(bert_dir)
+	BertModel.from_pretrained(bert_path).save_pretrained(bert_dir, save_mmap=True)
+	print(f'{bert_path} -> {bert_dir}')
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('model_dirs', nargs='*', help='directories with a pytorch_model.bin to convert')
+	parser.add_argument('--bert-dir', default=None, help='save the description BERT model here, memory-mapped')
+	parser.add_argument('--no-verify', action='store_true', help="don't compare the converted tensors")
+	args = parser.parse_args()
+
+	for model_dir in args.model_dirs:
+		convert(model_dir, verify=not args.no_verify)
+	if args.bert_dir is not None:
+		save_bert(args.bert_dir)
+
+
+if __name__ == '__main__':
+	main()
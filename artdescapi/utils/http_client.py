@@ -0,0 +1,54 @@
+import collections
+import concurrent.futures
+import threading
+import urllib.parse
+
+import mwapi
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class HttpClient:
+	"""Process-wide client for the Wikipedia / Wikidata fan-out.
+
+	All calls share one `requests.Session`, so connections (and their TLS handshakes) to each of the ~26 hosts are
+	kept alive across requests. Concurrency per host is bounded by a semaphore, every call gets a timeout, and
+	`executor` is a long-lived thread pool for running calls in parallel.
+	"""
+
+	def __init__(self, user_agent, timeout=5, max_workers=32, max_per_host=8):
+		self.user_agent = user_agent
+		self.timeout = timeout
+		self.max_per_host = max_per_host
+		self.session = requests.Session()
+		self.session.headers['User-Agent'] = user_agent
+		adapter = HTTPAdapter(pool_connections=64, pool_maxsize=max_per_host)
+		self.session.mount('https://', adapter)
+		self.session.mount('http://', adapter)
+		self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='http')
+		self._host_slots = collections.defaultdict(lambda: threading.BoundedSemaphore(self.max_per_host))
+		self._api_sessions = {}
+		self._lock = threading.Lock()
+
+	def _slot(self, host):
+		with self._lock:
+			return self._host_slots[host]
+
+	def get(self, url, timeout=None, **kwargs):
+		"""GET `url` over the shared connection pool."""
+		with self._slot(urllib.parse.urlsplit(url).netloc):
+			return self.session.get(url, timeout=timeout if timeout is not None else self.timeout, **kwargs)
+
+	def api_get(self, host, **params):
+		"""Call the MediaWiki action API at `host` (e.g. 'https://en.wikipedia.org') over the shared pool."""
+		with self._lock:
+			api_session = self._api_sessions.get(host)
+			if api_session is None:
+				api_session = mwapi.Session(host, user_agent=self.user_agent, session=self.session,
+											timeout=self.timeout)
+				self._api_sessions[host] = api_session
+		with self._slot(urllib.parse.urlsplit(host).netloc):
+			return api_session.get(**params)
+
+	def submit(self, fn, *args, **kwargs):
+		return self.executor.submit(fn, *args, **kwargs)
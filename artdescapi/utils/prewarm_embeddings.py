@@ -0,0 +1,109 @@
+"""Prewarm the description-vector cache: embed the most frequent Wikidata descriptions into a `MmapVectorStore`.
+
+Reads a Wikidata JSON dump (https://dumps.wikimedia.org/wikidatawiki/entities/latest-all.json.gz; .gz, .bz2 or plain),
+counts the descriptions in the supported languages and embeds the `--top` most frequent ones that occur at least
+`--min-count` times. At most 2 * `--capacity-factor` * `--top` descriptions are counted at once (see
+`count_descriptions`), so memory doesn't grow with the size of the dump, e.g.:
+
+	python -m artdescapi.utils.prewarm_embeddings --dump latest-all.json.gz --out /srv/api-endpoint/cache/description-vectors
+"""
+import argparse
+import bz2
+import gzip
+import heapq
+import json
+
+import torch
+
+from artdescapi.transformers import BertModel, BertTokenizer, BertTokenizerFast
+from artdescapi.transformers.generation_utils import masked_mean_pooling
+from artdescapi.utils.cache import MmapVectorStore, description_key
+from artdescapi.utils.utils import bert_path, lang_dict, load_tokenizer
+
+
+def open_dump(path):
+	if path.endswith('.gz'):
+		return gzip.open(path, 'rt', encoding='utf-8')
+	if path.endswith('.bz2'):
+		return bz2.open(path, 'rt', encoding='utf-8')
+	return open(path, encoding='utf-8')
+
+def iter_descriptions(path, langs, max_entities=None):
+	"""Yield (lang, description) for every entity in the dump -- one JSON entity per line inside a JSON list."""
+	with open_dump(path) as dump:
+		for n, line in enumerate(dump):
+			if max_entities is not None and n >= max_entities:
+				break
+			line = line.strip().rstrip(',')
+			if line in ('[', ']', ''):
+				continue
+			entity = json.loads(line)
+			for lang, description in entity.get('descriptions', {}).items():
+				if lang in langs:
+					yield lang, description['value']
+
+def count_descriptions(path, langs, capacity, max_entities=None):
+	"""Approximate counts of the most frequent descriptions, tracking at most 2 * `capacity` of them (space-saving).
+
+	When the table is full, only the `capacity` most frequent descriptions are kept, and a description seen afterwards
+	starts from the largest count dropped so far. Returns ({key: [count, error, text]}, number of descriptions read):
+	`count` over-estimates the true count by at most `error`, and any description seen more often than the largest
+	count dropped is in the table.
+	"""
+	entries = {}
+	dropped = 0
+	total = 0
+	for lang, description in iter_descriptions(path, langs, max_entities):
+		total += 1
+		key = description_key(lang, description)
+		entry = entries.get(key)
+		if entry is not None:
+			entry[0] += 1
+			continue
+		if len(entries) >= 2 * capacity:
+			kept = heapq.nlargest(capacity + 1, entries.items(), key=lambda item: item[1][0])
+			dropped = max(dropped, kept.pop()[1][0])
+			entries = dict(kept)
+		entries[key] = [dropped + 1, dropped, description]
+	return entries, total
+
+def most_frequent(entries, top, min_count=2):
+	"""Keys of the `top` most frequent descriptions that are certainly used at least `min_count` times."""
+	ranked = sorted(entries.items(), key=lambda item: item[1][0], reverse=True)
+	return [key for key, (count, error, _) in ranked if count - error >= min_count][:top]
+
+def embed(texts, batch_size=256):
+	"""Masked-mean BERT vectors for `texts`, as ModelLoader computes them, in batches."""
+	tokenizer = load_tokenizer(bert_path, BertTokenizer, BertTokenizerFast)
+	model = BertModel.from_pretrained(bert_path)
+	model.eval()
+	vectors = []
+	with torch.no_grad():
+		for i in range(0, len(texts), batch_size):
+			bert_in = tokenizer(texts[i:i + batch_size], padding=True, truncation=True, return_tensors='pt')
+			bert_outs = model(**bert_in)
+			vectors.append(masked_mean_pooling(bert_outs.last_hidden_state, bert_in['attention_mask']).half())
+			print(f'embedded {min(i + batch_size, len(texts))}/{len(texts)} descriptions')
+	return torch.cat(vectors).numpy()
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--dump', required=True, help='Wikidata JSON dump')
+	parser.add_argument('--out', required=True, help='directory for the store (EMBEDDING_STORE_PATH)')
+	parser.add_argument('--top', type=int, default=200000, help='number of most frequent descriptions to embed')
+	parser.add_argument('--min-count', type=int, default=2, help='skip descriptions used fewer times than this')
+	parser.add_argument('--capacity-factor', type=int, default=4,
+						help='count up to 2 * this * --top descriptions at once (about 150 bytes each)')
+	parser.add_argument('--max-entities', type=int, default=None, help='only read the first N entities of the dump')
+	parser.add_argument('--batch-size', type=int, default=256)
+	args = parser.parse_args()
+
+	entries, total = count_descriptions(args.dump, set(lang_dict), args.capacity_factor * args.top, args.max_entities)
+	keys = most_frequent(entries, args.top, args.min_count)
+	print(f'{total} descriptions read, embedding the {len(keys)} most frequent')
+	vectors = embed([entries[key][2] for key in keys], args.batch_size)
+	MmapVectorStore.build(args.out, keys, vectors)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,148 @@
+"""Trim the checkpoint's vocabulary to the tokens used by the served languages.
+
+mBART's shared embedding, `lm_head` and `final_logits_bias` cover all ~250k sentencepiece tokens, most of which never
+occur in the 25 supported languages. This counts the token ids the tokenizer produces over a corpus of those languages
+(plain-text files, one paragraph or description per line, optionally .gz), keeps those used at least `--min-count`
+times -- plus every single-character piece, so unseen words still split into known pieces, and all special and
+language-code tokens -- and saves a checkpoint whose embeddings, output projection and sentencepiece model only cover
+them. It loads with the usual `from_pretrained`, e.g.:
+
+	python -m artdescapi.utils.trim_vocab --model-dir /srv/model-25lang-all/ --out /srv/model-25lang-trimmed/ \
+		--corpus paragraphs.txt.gz descriptions.txt.gz
+
+Token ids change, so vocabulary shortlists (`build_vocab_shortlists`) have to be rebuilt for the trimmed checkpoint.
+"""
+import argparse
+import collections
+import gzip
+import itertools
+import os
+
+import torch
+from torch import nn
+
+from artdescapi.transformers import AutoConfig, MBartForConditionalGeneration, MBartTokenizer, MBartTokenizerFast
+from artdescapi.transformers.utils import sentencepiece_model_pb2
+from artdescapi.utils.utils import load_tokenizer
+
+SPM_SPECIAL_PIECES = 3  # <unk>, <s> and </s> lead every sentencepiece model and stay where they are
+
+
+def read_lines(paths):
+	for path in paths:
+		with (gzip.open(path, 'rt', encoding='utf-8') if path.endswith('.gz') else open(path, encoding='utf-8')) as f:
+			for line in f:
+				line = line.strip()
+				if line:
+					yield line
+
+def count_tokens(tokenizer, lines, batch_size=1000):
+	counts = collections.Counter()
+	lines = iter(lines)
+	batch = list(itertools.islice(lines, batch_size))
+	while batch:
+		for ids in tokenizer(batch, add_special_tokens=False)['input_ids']:
+			counts.update(ids)
+		batch = list(itertools.islice(lines, batch_size))
+	return counts
+
+def kept_pieces(proto, counts, offset, min_count=1, keep_chars=True):
+	"""Indices, in the sentencepiece model, of the pieces to keep."""
+	kept = set(range(SPM_SPECIAL_PIECES))
+	kept.update(token_id - offset for token_id, count in counts.items()
+				if count >= min_count and SPM_SPECIAL_PIECES <= token_id - offset < len(proto.pieces))
+	if keep_chars:
+		kept.update(i for i, piece in enumerate(proto.pieces) if len(piece.piece.lstrip('▁')) <= 1)
+	return sorted(kept)
+
+def new_to_old_ids(kept, offset, num_pieces, old_size):
+	"""Old token id of each token of the trimmed vocabulary, given the `kept` sentencepiece pieces: the fairseq specials
+	(<s>, <pad>, </s>, <unk>), the kept pieces, then the language codes, <mask> and anything after."""
+	return (list(range(SPM_SPECIAL_PIECES + offset)) + [i + offset for i in kept[SPM_SPECIAL_PIECES:]]
+			+ list(range(num_pieces + offset, old_size)))
+
+def trim_sentencepiece(vocab_file, kept, out_file):
+	proto = sentencepiece_model_pb2.ModelProto()
+	with open(vocab_file, 'rb') as f:
+		proto.ParseFromString(f.read())
+	pieces = [proto.pieces[i] for i in kept]
+	del proto.pieces[:]
+	proto.pieces.extend(pieces)
+	proto.trainer_spec.vocab_size = len(pieces)
+	with open(out_file, 'wb') as f:
+		f.write(proto.SerializeToString())
+
+def trim_model(model, new_to_old):
+	"""Keep the rows `new_to_old` (old ids, in new id order) of the embeddings, lm_head and final_logits_bias."""
+	index = torch.tensor(new_to_old, dtype=torch.long)
+	old_embeddings = model.get_input_embeddings()
+	shared = nn.Embedding(len(index), old_embeddings.embedding_dim, padding_idx=old_embeddings.padding_idx)
+	shared.weight.data = old_embeddings.weight.data.index_select(0, index).clone()
+	model.set_input_embeddings(shared)
+
+	old_lm_head = model.get_output_embeddings()
+	lm_head = nn.Linear(old_lm_head.in_features, len(index), bias=False)
+	lm_head.weight.data = old_lm_head.weight.data.index_select(0, index).clone()
+	model.set_output_embeddings(lm_head)
+	model.register_buffer('final_logits_bias', model.final_logits_bias.index_select(1, index).clone())
+
+	model.config.vocab_size = len(index)
+	old_to_new = {old: new for new, old in enumerate(new_to_old)}
+	for name in ('bos_token_id', 'pad_token_id', 'eos_token_id', 'decoder_start_token_id', 'forced_bos_token_id',
+				 'forced_eos_token_id'):
+		if getattr(model.config, name, None) is not None:
+			setattr(model.config, name, old_to_new[getattr(model.config, name)])
+	model.tie_weights()
+	return model
+
+def check(old_tokenizer, new_tokenizer, new_to_old, lines):
+	"""Share of `lines` that the trimmed tokenizer splits exactly as before (compared as old ids)."""
+	lines = list(lines)
+	if not lines:
+		return None
+	old_ids = old_tokenizer(lines, add_special_tokens=False)['input_ids']
+	new_ids = new_tokenizer(lines, add_special_tokens=False)['input_ids']
+	same = sum(old == [new_to_old[i] for i in new] for old, new in zip(old_ids, new_ids))
+	return same / len(lines)
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--model-dir', required=True, help='checkpoint directory (e.g. /srv/model-25lang-all/)')
+	parser.add_argument('--out', required=True, help='directory for the trimmed checkpoint')
+	parser.add_argument('--corpus', nargs='+', required=True, help='text files of the supported languages')
+	parser.add_argument('--min-count', type=int, default=1, help='drop tokens used fewer times than this')
+	parser.add_argument('--no-chars', action='store_true', help="don't keep single-character pieces")
+	parser.add_argument('--check-lines', type=int, default=10000, help='corpus lines to re-tokenize as a check')
+	args = parser.parse_args()
+
+	tokenizer = MBartTokenizer.from_pretrained(args.model_dir)
+	counts = count_tokens(load_tokenizer(args.model_dir, MBartTokenizer, MBartTokenizerFast), read_lines(args.corpus))
+	proto = sentencepiece_model_pb2.ModelProto()
+	with open(tokenizer.vocab_file, 'rb') as f:
+		proto.ParseFromString(f.read())
+	offset = tokenizer.fairseq_offset
+	kept = kept_pieces(proto, counts, offset, args.min_count, keep_chars=not args.no_chars)
+
+	config = AutoConfig.from_pretrained(args.model_dir)
+	config.graph_embd_length = 128
+	model = MBartForConditionalGeneration.from_pretrained(args.model_dir, config=config)
+	old_size = model.get_input_embeddings().num_embeddings
+	new_to_old = new_to_old_ids(kept, offset, len(proto.pieces), old_size)
+
+	os.makedirs(args.out, exist_ok=True)
+	vocab_file = os.path.join(args.out, os.path.basename(tokenizer.vocab_file))
+	trim_sentencepiece(tokenizer.vocab_file, kept, vocab_file)
+	new_tokenizer = MBartTokenizer(vocab_file, **{k: v for k, v in tokenizer.init_kwargs.items() if k != 'vocab_file'})
+	if len(new_tokenizer) != len(new_to_old):
+		raise SystemExit(f'trimmed tokenizer has {len(new_tokenizer)} tokens but the embeddings {len(new_to_old)}')
+	trim_model(model, new_to_old).save_pretrained(args.out)
+	new_tokenizer.save_pretrained(args.out)
+
+	print(f'vocabulary: {old_size} -> {len(new_to_old)} tokens ({len(counts)} seen in the corpus)')
+	same = check(tokenizer, new_tokenizer, new_to_old, itertools.islice(read_lines(args.corpus), args.check_lines))
+	if same is not None:
+		print(f'corpus lines tokenized as before: {same:.2%}')
+
+
+if __name__ == '__main__':
+	main()
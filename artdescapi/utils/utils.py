@@ -1,80 +1,386 @@
-from artdescapi.transformers import AutoConfig
-from artdescapi.transformers import MBartForConditionalGeneration, MBartTokenizer
-from artdescapi.transformers import BertModel, BertTokenizer
+from artdescapi.transformers import AutoConfig, is_tokenizers_available
+from artdescapi.transformers import MBartForConditionalGeneration, MBartTokenizer, MBartTokenizerFast
+from artdescapi.transformers import BertModel, BertTokenizer, BertTokenizerFast, MMAP_WEIGHTS_NAME
+from artdescapi.transformers.generation_utils import masked_mean_pooling
 from artdescapi.transformers.tokenization_utils_base import BatchEncoding
+from artdescapi.utils.cache import description_key
+import collections
+import concurrent.futures
+import itertools
+import json
+import os
+import threading
 import torch
 
 
 bert_path = "bert-base-multilingual-uncased"
 lang_dict = {"en":"en_XX", "fr": "fr_XX", "it":"it_IT", "es":"es_XX", "de":"de_DE", "nl":"nl_XX", "ja":"ja_XX", "zh":"zh_CN", "ko":"ko_KR", "vi":"vi_VN", "ru":"ru_RU", "cs":"cs_CZ", "fi":"fi_FI", "lt":"lt_LT", "lv":"lv_LV", "et":"et_EE", "ar":"ar_AR", "tr":"tr_TR", "ro":"ro_RO", "kk":"kk_KZ", "gu":"gu_IN", "hi":"hi_IN", "si":"si_LK", "my":"my_MM", "ne":"ne_NP"}
 
+# the models, tokenizers and device of one `load_model` call, swapped in as a whole so a prediction never mixes loads
+LoadedModel = collections.namedtuple('LoadedModel', ['model', 'tokenizer', 'tokenizer_bert', 'device'])
+
 class ModelLoader:
 	
-	def __init__(self):
-		self.model = None
-		self.tokenizer = None
-		self.tokenizer_bert = None
-		self.device = None
+	def __init__(self, encoder_buckets=2, max_concurrency=1, num_threads=None, use_fast=True, embedding_cache=None,
+				 encoder_cache=None, vocab_shortlists=None, quantize=False, bert_dir=None, prefork=False, pack=True):
+		self.loaded = None
+		# number of padded encoder calls over all source languages (None: one call per language)
+		self.encoder_buckets = encoder_buckets
+		# predictions allowed to run at once; the CPU budget (`num_threads`, default all cores) is split between them
+		self.max_concurrency = max_concurrency
+		self.num_threads = num_threads
+		self._slots = threading.BoundedSemaphore(max_concurrency)
+		# Rust tokenizers when the `tokenizers` library is installed; the slow ones are kept for comparison
+		self.use_fast = use_fast
+		# optional LRUCache of float16 description vectors keyed by `description_key`
+		self.embedding_cache = embedding_cache
+		# optional EncoderOutputCache so paragraphs already encoded for another target language aren't encoded again
+		self.encoder_cache = encoder_cache
+		# optional {lang: VocabShortlist}: decode only over the tokens seen in each target language's descriptions
+		self.vocab_shortlists = vocab_shortlists
+		self._shortlist_unions = {}
+		# dynamic int8 quantization of every nn.Linear (MBart encoder, fusion, decoder, lm_head and BERT); CPU only
+		self.quantize = quantize
+		# local copy of the description BERT model (e.g. with a memory-mapped checkpoint) instead of the hub's
+		self.bert_dir = bert_dir
+		# loaded before fork() and shared copy-on-write by the forked workers, which then call `after_fork`
+		self.prefork = prefork
+		# with `prefork`, move the weights that aren't memory-mapped from a checkpoint into one buffer per dtype
+		self.pack = pack
+
+	@property
+	def model(self):
+		return self.loaded.model if self.loaded is not None else None
+
+	@property
+	def tokenizer(self):
+		return self.loaded.tokenizer if self.loaded is not None else None
+
+	@property
+	def tokenizer_bert(self):
+		return self.loaded.tokenizer_bert if self.loaded is not None else None
+
+	@property
+	def device(self):
+		return self.loaded.device if self.loaded is not None else None
 
 	def load_model(self, output_dir):
-		config = AutoConfig.from_pretrained(output_dir)
-		config.graph_embd_length = 128
-		model = MBartForConditionalGeneration.from_pretrained(output_dir, config=config)
-		tokenizer = MBartTokenizer.from_pretrained(output_dir)
+		"""Load the checkpoint in `output_dir` and the BERT model, then swap them in for any loaded before.
 
-		tokenizer_bert = BertTokenizer.from_pretrained(bert_path)
-		bert_model = BertModel.from_pretrained(bert_path)
+		The MBart model, the BERT model and their tokenizers don't depend on each other and are loaded concurrently --
+		most of the time goes to reading files and to torch / tokenizers code that releases the GIL.
+
+		With `prefork`, no intra-op threads are started (OpenMP in a forked worker would wait on threads that only
+		exist in the parent) and, with `pack`, the weights that aren't memory-mapped from a checkpoint are packed with
+		`pack_weights`.
+		"""
+		if self.prefork:
+			torch.set_num_threads(1)
+		bert_dir = self.bert_dir or bert_path
+		with concurrent.futures.ThreadPoolExecutor(max_workers=4, thread_name_prefix='load-model') as executor:
+			futures = [executor.submit(load_mbart_model, output_dir),
+					   executor.submit(load_tokenizer, output_dir, MBartTokenizer, MBartTokenizerFast,
+									   use_fast=self.use_fast, cache_dir=os.path.join(output_dir, 'tokenizer-fast')),
+					   executor.submit(load_tokenizer, bert_dir, BertTokenizer, BertTokenizerFast,
+									   use_fast=self.use_fast),
+					   executor.submit(BertModel.from_pretrained, bert_dir)]
+			model, tokenizer, tokenizer_bert, bert_model = [future.result() for future in futures]
 		model.model_bert = bert_model
 
 		device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
 		model = model.to(device)
+		if self.quantize:
+			if device.type != 'cpu':
+				raise ValueError('dynamic int8 quantization is only supported on CPU')
+			# weights are stored as int8 and activations quantized on the fly; embeddings and layer norms stay float
+			torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+		if self.prefork:
+			# after quantization, which replaces the float weights of the linear layers
+			if self.pack and not os.path.isfile(os.path.join(output_dir, MMAP_WEIGHTS_NAME)):
+				pack_weights(model, skip=itertools.chain(bert_model.parameters(), bert_model.buffers()))
+			if self.pack and not os.path.isfile(os.path.join(bert_dir, MMAP_WEIGHTS_NAME)):
+				pack_weights(bert_model)
+		else:
+			self.after_fork()
+
+		self.loaded = LoadedModel(model, tokenizer, tokenizer_bert, device)
 
-		self.model = model
-		self.tokenizer = tokenizer
-		self.tokenizer_bert = tokenizer_bert
-		self.device = device
+	def after_fork(self):
+		"""Start the intra-op threads of a worker forked after a `prefork` load (without `prefork`, `load_model` does)."""
+		torch.set_num_threads(intra_op_threads(self.max_concurrency, self.num_threads))
 
 	def predict(self, sources, descriptions, tgt_lang, num_beams=1, num_return_sequences=1):
+		"""Descriptions for one article in `tgt_lang`, or a {target: descriptions} dict if `tgt_lang` is a list."""
+		item = {'sources': sources, 'descriptions': descriptions, 'tgt_lang': tgt_lang,
+				'num_beams': num_beams, 'num_return_sequences': num_return_sequences}
+		return self.predict_batch([item])[0]
+
+	def predict_batch(self, items, return_exceptions=False):
+		"""Predict descriptions for several articles at once.
+
+		Each item is a dict with the arguments of `predict`. Items that share the target language and beam settings
+		are run as one batched generate() call, whatever source languages each of them has; the outputs are returned
+		in input order. Safe to call from several threads; at most `max_concurrency` calls run at once.
+
+		An item without a paragraph in one of its targets fails on its own with a ValueError, and a generate() call
+		that fails only fails the items of its group. With `return_exceptions`, the exception takes
+		the place of the output of each of these items; otherwise the first one is raised.
+
+		An item's `tgt_lang` may be a list of languages: its paragraphs are then encoded once and decoded into each
+		of them in the same generate() call, and its output is a {target: descriptions} dict. As with a single target,
+		the item needs a first paragraph in each target language.
+		"""
+		outputs = [None] * len(items)
+		groups = {}
+		for i, item in enumerate(items):
+			targets = tuple(target_languages(item['tgt_lang']))
+			missing = [t for t in targets if not item['sources'].get(t)]
+			if missing:
+				# the target's paragraph is the fusion query: without it the item would be decoded from padding
+				outputs[i] = ValueError('no first paragraph in the target language: {0}'.format(', '.join(missing)))
+				continue
+			key = (targets, item.get('num_beams', 1), item.get('num_return_sequences', 1))
+			groups.setdefault(key, []).append(i)
+
+		with self._slots:
+			loaded = self.loaded  # the whole batch runs on one model even if another is swapped in meanwhile
+			if loaded is None:
+				raise RuntimeError('the model is not loaded yet')
+			for (targets, num_beams, num_return_sequences), indices in groups.items():
+				group = [items[i] for i in indices]
+				try:
+					group_outputs = self._generate(loaded, group, list(targets), num_beams, num_return_sequences)
+				except Exception as e:
+					for i in indices:
+						outputs[i] = e
+					continue
+				for i, output in zip(indices, group_outputs):
+					if isinstance(items[i]['tgt_lang'], str):
+						outputs[i] = output[0]
+					else:
+						outputs[i] = dict(zip(targets, output))
+		if not return_exceptions:
+			for output in outputs:
+				if isinstance(output, Exception):
+					raise output
+		return outputs
+
+	def _generate(self, loaded, items, tgt_langs, num_beams, num_return_sequences):
+		"""Run one generate() call for `items`; returns, per item, a list of outputs per target in `tgt_langs`."""
+		tokens = self.generate_tokens(items, tgt_langs, num_beams, num_return_sequences, loaded=loaded)
+		output = loaded.tokenizer.batch_decode(tokens, skip_special_tokens=True)
+		# rows are ordered by item, then target, then returned sequence
+		per_row = [output[j * num_return_sequences:(j + 1) * num_return_sequences]
+				   for j in range(len(items) * len(tgt_langs))]
+		return [per_row[i * len(tgt_langs):(i + 1) * len(tgt_langs)] for i in range(len(items))]
+
+	def generate_tokens(self, items, tgt_langs, num_beams=1, num_return_sequences=1, loaded=None, **generate_kwargs):
+		"""Token ids generated for `items` in each of `tgt_langs`, one row per (item, target, returned sequence).
+
+		`loaded` is the LoadedModel to run (default: the current one). `generate_kwargs` override the serving
+		settings, e.g. `vocab_shortlist=None` for the full vocabulary.
+		"""
+		if loaded is None:
+			loaded = self.loaded
 		batch = {}
 		input_ids = {}
 		attention_mask = {}
-		# process first paragraphs
+		# process first paragraphs: items without a paragraph in a language get an all-padding row,
+		# which generate() turns into a zero in that language's presence mask
+		present = {}
+		examples = []
 		for lang, lang_code in lang_dict.items():
-			if lang in sources:
-				source = sources[lang]
-			else:
-				source = ""
-			if len(source) > 0:
-				self.tokenizer.src_lang = lang_code
-				batch_enc = self.tokenizer([source], padding=True, truncation=True)
-				input_ids[lang] = torch.tensor(batch_enc['input_ids'])
-				attention_mask[lang] = torch.tensor(batch_enc['attention_mask'])
+			present[lang] = [i for i, item in enumerate(items) if len(item['sources'].get(lang) or '') > 0]
+			examples.extend((items[i]['sources'][lang], lang_code) for i in present[lang])
+		# one tokenizer call for all languages; doesn't touch the tokenizer's src_lang so concurrent calls can share it
+		encoded = loaded.tokenizer.batch_encode_multilingual(examples, return_tensors='pt')
+		for lang, lang_code in lang_dict.items():
+			if len(present[lang]) > 0:
+				enc = encoded[lang_code]
+				input_ids[lang] = torch.full((len(items), enc['input_ids'].shape[1]), loaded.tokenizer.pad_token_id,
+											 dtype=torch.long)
+				attention_mask[lang] = torch.zeros_like(input_ids[lang])
+				input_ids[lang][present[lang]] = enc['input_ids']
+				attention_mask[lang][present[lang]] = enc['attention_mask']
 			else:
 				input_ids[lang] = None
 				attention_mask[lang] = None
 
-		# process descriptions
-		bert_inputs = {}
-		for lang, description in descriptions:
-			if lang != tgt_lang:
-				bert_outs = self.tokenizer_bert([description],
-	                padding=True,
-	                truncation=True,
-	                return_tensors="pt",)
-				bert_inputs[lang] = bert_outs
+		# process descriptions: one vector per item so that items with different description languages can share a batch
+		bert_outputs = self._embed_descriptions(loaded, items, tgt_langs)
 
 		batch['input_ids'] = input_ids
 		batch['attention_mask'] = attention_mask
 		batch["graph_embeddings"] = None
-		batch['bert_inputs'] = bert_inputs
-
-		batch = prepare_inputs(batch, self.device)
-		tokens = self.model.generate(**batch, max_length=20, min_length=2, length_penalty=2.0, num_beams=num_beams,
-									 early_stopping=True, target_lang = lang_dict[tgt_lang],
-									 decoder_start_token_id=self.tokenizer.lang_code_to_id[lang_dict[tgt_lang]],
-									 num_return_sequences=num_return_sequences)
-		output = self.tokenizer.batch_decode(tokens, skip_special_tokens=True) #TODO check beams
-		return output
+		batch['bert_inputs'] = None
+		batch['bert_outputs'] = bert_outputs
+
+		batch = prepare_inputs(batch, loaded.device)
+		start_ids = [loaded.tokenizer.convert_tokens_to_ids(lang_dict[tgt_lang]) for tgt_lang in tgt_langs]
+		if len(tgt_langs) > 1:
+			# the encoders run once per item, the fusion and the decoder once per (item, target)
+			batch['target_langs'] = [lang_dict[tgt_lang] for tgt_lang in tgt_langs]
+		kwargs = dict(max_length=20, min_length=2, length_penalty=2.0, num_beams=num_beams, early_stopping=True,
+					  target_lang = lang_dict[tgt_langs[0]],
+					  decoder_start_token_id=start_ids if len(tgt_langs) > 1 else start_ids[0],
+					  num_return_sequences=num_return_sequences, encoder_buckets=self.encoder_buckets,
+					  encoder_cache=self.encoder_cache, vocab_shortlist=self.vocab_shortlist(tgt_langs))
+		kwargs.update(generate_kwargs)
+		return loaded.model.generate(**batch, **kwargs)
+
+	def vocab_shortlist(self, tgt_langs):
+		"""Shortlist for a batch decoded into `tgt_langs` (None: full vocabulary, also if a target has no shortlist).
+
+		The union for several targets is kept so its sliced output projection is reused by later calls.
+		"""
+		if self.vocab_shortlists is None or any(tgt_lang not in self.vocab_shortlists for tgt_lang in tgt_langs):
+			return None
+		if len(tgt_langs) == 1:
+			return self.vocab_shortlists[tgt_langs[0]]
+		key = tuple(sorted(tgt_langs))
+		if key not in self._shortlist_unions:
+			first, *others = [self.vocab_shortlists[tgt_lang] for tgt_lang in key]
+			self._shortlist_unions[key] = first.union(*others)
+		return self._shortlist_unions[key]
+
+	def _embed_descriptions(self, loaded, items, tgt_langs):
+		"""Mean BERT embedding of each item's Wikidata descriptions for each of `tgt_langs`, leaving out the target.
+
+		Returns one row per (item, target), ordered by item. Every description is embedded once whatever the number of
+		targets; those found in `embedding_cache` aren't re-embedded and the rest (of all items) go through BERT as one
+		padded batch, each pooled over its own tokens only. Items without any other description get a zero vector.
+		"""
+		owners = []
+		langs = []
+		to_embed = {}  # description key -> (text, positions in `owners`)
+		pooled = []
+		for i, item in enumerate(items):
+			for lang, description in item['descriptions'].items():
+				if len(tgt_langs) > 1 or lang != tgt_langs[0]:
+					key = description_key(lang, description)
+					vector = self.embedding_cache.get(key) if self.embedding_cache is not None else None
+					if vector is None:
+						to_embed.setdefault(key, (description, []))[1].append(len(owners))
+						vector = torch.zeros(768)
+					else:
+						vector = torch.from_numpy(vector).float()
+					owners.append(i)
+					langs.append(lang)
+					pooled.append(vector)
+		if len(owners) == 0:
+			return torch.zeros((len(items) * len(tgt_langs), 768), device=loaded.device)
+		pooled = torch.stack(pooled).to(loaded.device)
+
+		if len(to_embed) > 0:
+			with torch.no_grad():
+				bert_in = loaded.tokenizer_bert([text for text, _ in to_embed.values()],
+					padding=True,
+					truncation=True,
+					return_tensors="pt",).to(loaded.device)
+				bert_outs = loaded.model.model_bert(**bert_in)
+				embedded = masked_mean_pooling(bert_outs.last_hidden_state, bert_in['attention_mask'])
+			if self.embedding_cache is not None:
+				# round to the cached precision so a prediction doesn't depend on whether its descriptions were cached
+				embedded = embedded.half()
+				for key, vector in zip(to_embed, embedded.cpu().numpy()):
+					self.embedding_cache.set(key, vector)
+			for (_, positions), vector in zip(to_embed.values(), embedded.float()):
+				pooled[positions] = vector
+
+		# weights[i * len(tgt_langs) + t, j]: description j belongs to item i and isn't in target t's language
+		weights = torch.zeros((len(items) * len(tgt_langs), len(owners)), device=loaded.device)
+		for j, (i, lang) in enumerate(zip(owners, langs)):
+			for t, tgt_lang in enumerate(tgt_langs):
+				if lang != tgt_lang:
+					weights[i * len(tgt_langs) + t, j] = 1.
+		return weights.matmul(pooled) / weights.sum(dim=-1, keepdim=True).clamp(min=1)
+
+def target_languages(tgt_lang):
+	"""The list of target languages of a `tgt_lang` that is either one language code or a list of them."""
+	return [tgt_lang] if isinstance(tgt_lang, str) else list(tgt_lang)
+
+def load_mbart_model(path):
+	"""The description model of the checkpoint in `path`."""
+	config = AutoConfig.from_pretrained(path)
+	config.graph_embd_length = 128
+	return MBartForConditionalGeneration.from_pretrained(path, config=config)
+
+def load_tokenizer(path, slow_class, fast_class, use_fast=True, cache_dir=None):
+	"""Load the fast (Rust) tokenizer for `path` if `use_fast` and the tokenizers library is available, else the slow one.
+
+	Checkpoints without a tokenizer.json have their fast tokenizer converted from the slow files, which takes a while
+	for sentencepiece vocabularies; the converted tokenizer.json is saved to `cache_dir` and loaded from there next time,
+	as long as the slow files it was converted from are unchanged (e.g. not replaced by a trimmed vocabulary).
+	"""
+	if not use_fast or not is_tokenizers_available():
+		return slow_class.from_pretrained(path)
+	fingerprint_path = os.path.join(cache_dir, 'source.json') if cache_dir is not None else None
+	fingerprint = tokenizer_fingerprint(path, slow_class)
+	if fingerprint_path is not None and os.path.isfile(os.path.join(cache_dir, 'tokenizer.json')):
+		try:
+			with open(fingerprint_path) as f:
+				cached = json.load(f)
+		except (OSError, ValueError):
+			cached = None
+		if cached == fingerprint:
+			return fast_class.from_pretrained(cache_dir)
+	tokenizer = fast_class.from_pretrained(path)
+	if cache_dir is not None and not os.path.isfile(os.path.join(path, 'tokenizer.json')):
+		try:
+			tokenizer.save_pretrained(cache_dir, legacy_format=False)
+			with open(fingerprint_path, 'w') as f:
+				json.dump(fingerprint, f)
+		except OSError:
+			pass  # read-only model directory: convert again on the next load
+	return tokenizer
+
+def tokenizer_fingerprint(path, slow_class):
+	"""Size and modification time of each file in `path` that the slow tokenizer is built from."""
+	names = sorted(set(slow_class.vocab_files_names.values()) |
+				   {'tokenizer_config.json', 'special_tokens_map.json', 'added_tokens.json'})
+	fingerprint = {}
+	for name in names:
+		file_path = os.path.join(path, name)
+		if os.path.isfile(file_path):
+			stat = os.stat(file_path)
+			fingerprint[name] = [stat.st_size, stat.st_mtime_ns]
+	return fingerprint
+
+def pack_weights(module, skip=()):
+	"""Move the parameters and buffers of `module` (but those in `skip`) into one contiguous buffer per dtype.
+
+	For a model loaded before fork(): its tensors then sit in a few large page-aligned allocations of their own instead
+	of among the Python objects whose reference counts every worker keeps updating, so their pages stay shared. Tied
+	weights stay tied, as the tensors keep their identity and only get new data.
+
+	This doesn't hold a second copy of the weights at any point: the buffer's pages are only committed as tensors are
+	copied into it, one at a time, and each tensor's old storage is released right after its copy (as long as nothing
+	else refers to it, e.g. a state dict still in scope). `python -m
+	artdescapi.benchmarks.prefork_memory --no-pack` measures the master's peak RSS and the workers' PSS without it.
+	"""
+	skip = {id(tensor) for tensor in skip}
+	by_dtype = collections.defaultdict(list)
+	for tensor in itertools.chain(module.parameters(), module.buffers()):
+		if id(tensor) not in skip and tensor.device.type == 'cpu' and not tensor.is_quantized and tensor.numel() > 0:
+			by_dtype[tensor.dtype].append(tensor)
+	with torch.no_grad():
+		for dtype, tensors in by_dtype.items():
+			packed = torch.empty(sum(tensor.numel() for tensor in tensors), dtype=dtype)
+			offset = 0
+			for tensor in tensors:
+				view = packed[offset:offset + tensor.numel()].view(tensor.shape)
+				view.copy_(tensor)
+				tensor.data = view
+				offset += tensor.numel()
+
+def intra_op_threads(concurrency, num_threads=None):
+	"""Torch intra-op threads per prediction when `concurrency` predictions share `num_threads` cores (default: all).
+
+	Each concurrent call gets an equal share rather than every call spawning a thread per core, which oversubscribes
+	the CPU and makes aggregate throughput worse than running the calls one at a time.
+	"""
+	num_threads = num_threads or os.cpu_count() or 1
+	return max(1, num_threads // max(1, concurrency))
 
 def prepare_inputs(inputs, device):
 	"""
@@ -3,31 +3,151 @@ import sys
 
 from flask import Flask, request, jsonify
 from flask_cors import CORS
+import asyncio
+import collections
 import concurrent.futures
-import mwapi
-import requests
+import gc
+import json
+import signal
+import threading
 import time
+import torch
+import traceback
 import yaml
 
 __dir__ = os.path.dirname(__file__)
 __updir = os.path.abspath(os.path.join(__dir__, '..'))
 sys.path.append(__updir)
 
+from artdescapi.transformers import EncoderOutputCache, load_vocab_shortlists
+from artdescapi.utils.batching import BatchScheduler
+from artdescapi.utils.cache import LRUCache, MmapVectorStore, SqliteStore
+from artdescapi.utils.http_client import HttpClient
 from artdescapi.utils.utils import ModelLoader
 
 app = Flask(__name__)
 
-MODEL = ModelLoader()
 SUPPORTED_WIKIPEDIA_LANGUAGE_CODES = ['en', 'de', 'nl', 'es', 'it', 'ru', 'fr', 'zh', 'ar', 'vi', 'ja', 'fi', 'ko',
                                       'tr', 'ro', 'cs', 'et', 'lt', 'kk', 'lv', 'hi', 'ne', 'my', 'si', 'gu']
+API_BATCH_SIZE = 50  # max titles / ids per action=query or wbgetentities call
 
 # load in app user-agent or any other app config
 app.config.update(
     yaml.safe_load(open(os.path.join(__updir, 'flask_config.yaml'))))
 
+# mean-pooled BERT vectors of Wikidata descriptions keyed by (lang, normalized text); the optional read-only store
+# is built ahead of time from a dump with artdescapi/utils/prewarm_embeddings.py
+EMBEDDING_STORE_PATH = app.config.get('EMBEDDING_STORE_PATH')
+EMBEDDING_CACHE = LRUCache(
+    max_entries=app.config.get('EMBEDDING_CACHE_SIZE', 50000),
+    ttl=None,
+    store=MmapVectorStore(EMBEDDING_STORE_PATH) if EMBEDDING_STORE_PATH and os.path.isdir(EMBEDDING_STORE_PATH) else None)
+
+# optional per-target-language token subsets for the output projection (artdescapi/utils/build_vocab_shortlists.py)
+VOCAB_SHORTLISTS_PATH = app.config.get('VOCAB_SHORTLISTS_PATH')
+
+# load the model once in the uWSGI master and let the workers forked afterwards share it copy-on-write (needs
+# `master = true` without `lazy-apps` in uwsgi.ini); otherwise each worker loads its own copy in the background (and
+# uwsgi.ini needs `lazy-apps = true`)
+MODEL_PRELOAD = app.config.get('MODEL_PRELOAD', False)
+if MODEL_PRELOAD:
+    # the fast tokenizers' thread pool wouldn't exist in the forked workers
+    os.environ.setdefault('TOKENIZERS_PARALLELISM', 'false')
+
+# a reload has to reach every worker: a single process swaps the new model in place; preloaded workers all share the
+# master's model, so the master reloads (it loads the model again and forks new workers); otherwise the worker handling
+# the reload loads the new model first, and only once it works are the workers chain-reloaded one at a time while the
+# others keep serving, reporting their part through the uWSGI cache `reload`
+try:
+    import uwsgi
+except ImportError:  # not running under uWSGI
+    uwsgi = None
+if uwsgi is None or (uwsgi.numproc == 1 and not MODEL_PRELOAD):
+    RELOAD_MODE = 'in-place'
+elif MODEL_PRELOAD:
+    RELOAD_MODE = 'master'
+else:
+    RELOAD_MODE = 'chain'
+if uwsgi is not None and not MODEL_PRELOAD and uwsgi.worker_id() == 0:
+    # the background load would run in the master, and its thread isn't part of the forked workers
+    raise RuntimeError('without MODEL_PRELOAD, uwsgi.ini needs `lazy-apps = true` so that each worker loads its model')
+
+
+def new_model_loader():
+    """A ModelLoader set up from the config, not loaded yet.
+
+    Each loader gets its own encoder cache and vocabulary shortlists (whose sliced output projections are cached),
+    as both depend on the checkpoint; the description vectors only depend on the BERT model and are shared.
+    """
+    # per-language encoder outputs of source paragraphs, reused when an article is requested for another target
+    encoder_cache = EncoderOutputCache(max_bytes=app.config.get('ENCODER_CACHE_MB', 512) * 1024 * 1024,
+                                       dtype=torch.float16 if app.config.get('ENCODER_CACHE_FP16', True) else None)
+    # predictions that can run at once -- the CPU cores (MODEL_THREADS, default all) are split evenly between them
+    return ModelLoader(max_concurrency=app.config.get('MODEL_CONCURRENCY', 1),
+                       num_threads=app.config.get('MODEL_THREADS'),
+                       quantize=app.config.get('MODEL_QUANTIZE', False),
+                       bert_dir=app.config.get('BERT_MODEL_DIR'),
+                       embedding_cache=EMBEDDING_CACHE,
+                       encoder_cache=encoder_cache,
+                       vocab_shortlists=load_vocab_shortlists(VOCAB_SHORTLISTS_PATH) if VOCAB_SHORTLISTS_PATH else None,
+                       prefork=MODEL_PRELOAD,
+                       pack=app.config.get('MODEL_PACK_WEIGHTS', True))
+
+
+# the live model; `load_model` replaces it with a new loader, so always go through the global
+MODEL = new_model_loader()
+
+# model loading runs in the background so the worker answers /healthz, /readyz and /supported-languages meanwhile:
+# 'loading' until the model is loaded and has made a warm-up prediction, then 'ready' (or 'failed'). A reload
+# (POST /admin/reload or SIGUSR2) keeps serving the current model until the new one is ready; LOAD_STATUS tracks it
+MODEL_PATH = '/srv/model-25lang-all/'
+MODEL_STATUS = {'state': 'loading', 'since': time.time(), 'error': None}
+LOAD_STATUS = {'state': None, 'model_dir': None, 'since': None, 'error': None}
+LOAD_LOCK = threading.Lock()
+WARMUP_ARTICLE_PATH = os.path.join(__dir__, 'fixtures', 'warmup_article.json')
+LOCAL_ADDRESSES = ('127.0.0.1', '::1')
+
+# shared keep-alive connection pools and worker threads for all Wikipedia / Wikidata calls
+HTTP = HttpClient(app.config['CUSTOM_UA'],
+                  timeout=app.config.get('HTTP_TIMEOUT', 5),
+                  max_workers=app.config.get('HTTP_MAX_WORKERS', 32),
+                  max_per_host=app.config.get('HTTP_MAX_PER_HOST', 8))
+
+def predict_batch(items, **kwargs):
+    # looked up for each batch, so that a reloaded model takes over from the next batch on
+    return MODEL.predict_batch(items, **kwargs)
+
+
+# concurrent requests that arrive within a short window are run through the model as one batch
+SCHEDULER = BatchScheduler(predict_batch,
+                           max_batch_size=app.config.get('BATCH_MAX_SIZE', 8),
+                           max_wait=app.config.get('BATCH_WINDOW_MS', 10) / 1000,
+                           workers=MODEL.max_concurrency)
+
+# parsed Wikidata lookups keyed by (lang, canonical title); optionally persisted so they survive restarts
+WIKIDATA_CACHE = LRUCache(
+    max_entries=app.config.get('WIKIDATA_CACHE_SIZE', 10000),
+    ttl=app.config.get('WIKIDATA_CACHE_TTL', 3600),
+    store=SqliteStore(app.config['CACHE_PATH'], table='wikidata') if app.config.get('CACHE_PATH') else None)
+
+# first-paragraph extracts keyed by (lang, title), revalidated against the REST API's ETag once they go stale
+EXTRACT_CACHE = LRUCache(
+    max_entries=app.config.get('EXTRACT_CACHE_SIZE', 50000),
+    ttl=app.config.get('EXTRACT_CACHE_TTL', 86400),
+    store=SqliteStore(app.config['CACHE_PATH'], table='extracts') if app.config.get('CACHE_PATH') else None)
+EXTRACT_REVALIDATIONS = collections.Counter()
+
+# title resolution (canonical title, QID, English shortdesc) keyed by (lang, title) -- shared by request validation
+# and feature gathering so that one request resolves its title once
+TITLE_CACHE = LRUCache(
+    max_entries=app.config.get('TITLE_CACHE_SIZE', 50000),
+    ttl=app.config.get('TITLE_CACHE_TTL', 600))
+
 # Enable CORS for API endpoints
 cors = CORS(app, resources={r'/article': {'origins': '*'},
-                            r'/supported-languages': {'origins': '*'}})
+                            r'/articles': {'origins': '*'},
+                            r'/supported-languages': {'origins': '*'},
+                            r'/cache-stats': {'origins': '*'}})
 
 
 @app.route('/supported-languages', methods=['GET'])
@@ -35,43 +155,182 @@ def get_supported_languages():
     return jsonify({'languages': SUPPORTED_WIKIPEDIA_LANGUAGE_CODES})
 
 
+@app.route('/healthz', methods=['GET'])
+def get_health():
+    """Liveness: 200 while the model is loading or loaded, 500 if loading failed (the worker needs a restart)."""
+    status = MODEL_STATUS
+    return jsonify(status), 500 if status['state'] == 'failed' else 200
+
+
+@app.route('/readyz', methods=['GET'])
+def get_readiness():
+    """Readiness: 200 once the model serves predictions, 503 while it is still loading (or failed to)."""
+    status = MODEL_STATUS
+    return jsonify(status), 200 if status['state'] == 'ready' else 503
+
+
+@app.route('/admin/reload', methods=['GET', 'POST'])
+def reload_model():
+    """POST: load `model_dir` (default: the current model's directory) in the background and swap it in once it has
+    made its warm-up prediction. GET: the state of the last load. Only answered for calls from the instance itself."""
+    if request.remote_addr not in LOCAL_ADDRESSES:
+        return jsonify({'error': 'admin endpoints are only available locally'}), 403
+    if request.method == 'GET':
+        return jsonify(reload_status())
+    model_dir = request.values.get('model_dir') or MODEL_PATH
+    if not os.path.isdir(model_dir):
+        return jsonify({'error': 'no model directory {0}'.format(model_dir)}), 400
+    if RELOAD_MODE == 'in-place':
+        if not start_load(model_dir):
+            return jsonify(dict(LOAD_STATUS, error='a model is already loading')), 409
+        return jsonify(LOAD_STATUS), 202
+
+    status = reload_status()
+    if status['state'] == 'loading':
+        return jsonify(dict(status, error='a model is already loading')), 409
+    status = {'state': 'loading', 'model_dir': model_dir, 'since': time.time(), 'error': None}
+    if RELOAD_MODE == 'master':
+        if os.path.realpath(model_dir) != os.path.realpath(MODEL_PATH):
+            # the master loads MODEL_PATH when it starts again, it doesn't keep anything of this request
+            return jsonify({'error': 'the workers share the model the master loads from {0} -- put the new '
+                                     'checkpoint there'.format(MODEL_PATH)}), 400
+        # no worker answers while the master loads; GET then tells from `since` that it's the new one
+        uwsgi.reload()
+    else:
+        # a worker spawned by the chain has no model to fall back to, so a checkpoint that doesn't load would take
+        # down every worker in turn: this worker loads and warms it up first, and the chain only starts if that works
+        previous = get_shared('reload')
+        status = dict(status, worker=uwsgi.worker_id(), checked=False)
+        set_shared('reload', status)
+        if not start_load(model_dir, then=lambda: chain_reload(status)):
+            if previous is not None:
+                set_shared('reload', previous)
+            else:
+                uwsgi.cache_del('reload', 'reload')
+            return jsonify(dict(LOAD_STATUS, error='a model is already loading')), 409
+    return jsonify(status), 202
+
+
+def chain_reload(status):
+    """Once this worker has loaded and warmed up the reload's model, have every worker (this one too) load it."""
+    # also what a worker respawned later on loads
+    set_shared('model-dir', status['model_dir'])
+    # from now on, so that this worker's own load doesn't count as reloading it
+    set_shared('reload', dict(status, checked=True, since=time.time()))
+    uwsgi.chain_reload()
+
+
+def reload_status():
+    """The state of the last load; in the chain-reload mode, of the last reload across all the workers."""
+    status = get_shared('reload') if RELOAD_MODE == 'chain' else None
+    if status is None:
+        return LOAD_STATUS
+    workers = [get_shared('worker-{0}'.format(worker_id)) for worker_id in range(1, uwsgi.numproc + 1)]
+    if not status.get('checked', True):
+        # still loading in the worker that handled the reload; if it failed there, no worker was reloaded
+        checker = workers[status['worker'] - 1]
+        if checker is not None and checker['since'] >= status['since'] and checker['state'] == 'failed':
+            return dict(status, state='failed', error=checker['error'], workers=workers)
+        return dict(status, workers=workers)
+    reloaded = [worker for worker in workers if worker is not None and worker['since'] >= status['since']]
+    failed = [worker for worker in reloaded if worker['state'] == 'failed']
+    if failed:
+        state, error = 'failed', failed[0]['error']
+    elif len(reloaded) == len(workers) and all(worker['state'] == 'done' for worker in reloaded):
+        state, error = 'done', None
+    else:
+        state, error = 'loading', None
+    return dict(status, state=state, error=error, workers=workers)
+
+
+def get_shared(key):
+    value = uwsgi.cache_get(key, 'reload')
+    return json.loads(value) if value is not None else None
+
+
+def set_shared(key, value):
+    uwsgi.cache_update(key, json.dumps(value), 0, 'reload')
+
+
+@app.route('/cache-stats', methods=['GET'])
+def get_cache_stats():
+    extracts = EXTRACT_CACHE.stats()
+    extracts['revalidations'] = dict(EXTRACT_REVALIDATIONS)
+    descriptions = EMBEDDING_CACHE.stats()
+    descriptions['store-entries'] = len(EMBEDDING_CACHE.store) if EMBEDDING_CACHE.store is not None else 0
+    return jsonify({'titles': TITLE_CACHE.stats(), 'wikidata': WIKIDATA_CACHE.stats(), 'extracts': extracts,
+                    'descriptions': descriptions, 'encoder': MODEL.encoder_cache.stats()})
+
+
 @app.route('/article', methods=['GET'])
 def get_article_description():
-    lang, title, num_beams, error = validate_api_args()
+    if MODEL_STATUS['state'] != 'ready':
+        return model_unavailable()
+    lang, title, num_beams, targets, error = validate_api_args()
     if error:
         return jsonify({'error': error})
     else:
-        return jsonify(run_model(lang, title, num_beams))
+        return jsonify(run_model(lang, title, num_beams, targets))
 
 
-def run_model(lang, title, num_beams):
-    execution_times = {}  # just used right now for debugging
-    features = {}  # just used right now for debugging
-    starttime = time.time()
+@app.route('/articles', methods=['POST'])
+def get_article_descriptions():
+    """Batch version of /article: POST a JSON list of {"lang", "title", "num_beams"} items and get back one JSON line
+    per item, in the order they finish -- each line carries the `index` of its item in the request."""
+    if MODEL_STATUS['state'] != 'ready':
+        return model_unavailable()
+    items, error = validate_batch_args()
+    if error:
+        return jsonify({'error': error})
+    lines = (json.dumps(result, ensure_ascii=False) + '\n' for result in run_batch(items))
+    # don't let nginx buffer the stream -- clients should see each result as soon as it's ready
+    return app.response_class(lines, mimetype='application/x-ndjson', headers={'X-Accel-Buffering': 'no'})
 
-    descriptions, sitelinks, blp = get_wikidata_info(lang, title)
-    wd_time = time.time()
-    execution_times['wikidata-info (s)'] = wd_time - starttime
-    features['descriptions'] = descriptions
 
-    first_paragraphs = {}
-    with concurrent.futures.ThreadPoolExecutor(max_workers=16) as executor:
-        futures = { executor.submit(get_first_paragraph, l, sitelinks[l]): l for l in sitelinks }
-        futures[executor.submit(get_groundtruth, lang, title)] = 'groundtruth'
-        for future in concurrent.futures.as_completed(futures):
-            if futures[future] == 'groundtruth':
-                groundtruth_desc = future.result()
-            else:
-                first_paragraphs[futures[future]] = future.result()
+def model_unavailable():
+    """503 for model endpoints called before the model is ready, so nginx / clients know to retry later."""
+    if MODEL_STATUS['state'] == 'loading':
+        error = 'the model is still loading -- retry shortly'
+    else:
+        error = 'the model failed to load'
+    return jsonify({'error': error}), 503, {'Retry-After': '10'}
 
-    execution_times['total network (s)'] = time.time() - starttime
-    features['first-paragraphs'] = first_paragraphs
 
-    prediction = MODEL.predict(first_paragraphs, descriptions, lang,
-                               num_beams=num_beams, num_return_sequences=num_beams)
+def run_model(lang, title, num_beams, targets=None):
+    starttime = time.time()
+
+    features, execution_times, blp, groundtruth_desc = asyncio.run(gather_features(lang, title))
+
+    error = None
+    if targets is None:
+        # the article's own paragraph is the query the other languages are fused into
+        prediction = None
+        if features['first-paragraphs'].get(lang):
+            prediction = SCHEDULER.predict(features['first-paragraphs'], features['descriptions'], lang,
+                                           num_beams=num_beams, num_return_sequences=num_beams)
+        else:
+            error = no_paragraph_error(lang, title)
+    else:
+        # all targets in one prediction so the paragraphs are encoded once; a target needs its own paragraph
+        prediction = dict.fromkeys(targets)
+        available = [t for t in targets if features['first-paragraphs'].get(t)]
+        if available:
+            prediction.update(SCHEDULER.predict(features['first-paragraphs'], features['descriptions'], available,
+                                                num_beams=num_beams, num_return_sequences=num_beams))
 
     execution_times['total (s)'] = time.time() - starttime
 
+    result = format_result(lang, title, num_beams, blp, groundtruth_desc, execution_times, features, prediction)
+    if error:
+        result['error'] = error
+    return result
+
+
+def no_paragraph_error(lang, title):
+    return 'no first paragraph for https://{0}.wikipedia.org/wiki/{1}'.format(lang, title)
+
+
+def format_result(lang, title, num_beams, blp, groundtruth_desc, execution_times, features, prediction):
     return {'lang': lang, 'title': title, 'blp':blp,
             'num_beams':num_beams,
             'groundtruth': groundtruth_desc,
@@ -80,82 +339,267 @@ def run_model(lang, title, num_beams):
             'prediction':prediction}
 
 
+def run_batch(items):
+    """Yield a result (or error) for each (index, lang, title, num_beams) item as soon as it's ready.
+
+    Metadata is fetched in bulk: titles are resolved 50 per call per wiki and Wikidata items 50 per call across
+    wikis. Paragraphs are fetched through the shared pool (and cache, so sitelinks shared by items are fetched once)
+    and each item goes to the batch scheduler as soon as its own paragraphs are in.
+    """
+    starttime = time.time()
+
+    by_lang = {}
+    for index, lang, title, num_beams in items:
+        by_lang.setdefault(lang, []).append(title)
+    resolve_futures = {lang: HTTP.submit(resolve_titles, lang, titles) for lang, titles in by_lang.items()}
+    resolved = {}
+    resolve_errors = {}  # lang -> why its titles couldn't be resolved, as opposed to titles without an article
+    for lang, future in resolve_futures.items():
+        try:
+            resolved[lang] = future.result()
+        except Exception as e:
+            resolved[lang] = {}
+            resolve_errors[lang] = e
+
+    jobs = []
+    for index, lang, title, num_beams in items:
+        page_title = resolved[lang].get(title, {}).get('title')
+        if lang in resolve_errors:
+            yield {'index': index, 'lang': lang, 'title': title,
+                   'error': 'could not look up https://{0}.wikipedia.org/wiki/{1}: {2}'.format(
+                       lang, title, resolve_errors[lang])}
+        elif page_title is None:
+            yield {'index': index, 'lang': lang, 'title': title,
+                   'error': 'no matching article for https://{0}.wikipedia.org/wiki/{1}'.format(lang, title)}
+        else:
+            jobs.append({'index': index, 'lang': lang, 'title': page_title, 'num_beams': num_beams})
+
+    infos = get_wikidata_infos([(job['lang'], job['title']) for job in jobs])
+
+    paragraph_futures = {}  # (lang, title) -> future, so shared sitelinks are only fetched once
+    waiting = {}  # paragraph future -> jobs waiting on it
+    model_futures = {}  # prediction future -> job
+    for job in jobs:
+        descriptions, sitelinks, blp = infos[(job['lang'], job['title'])]
+        job.update(descriptions=descriptions, sitelinks=sitelinks, blp=blp, remaining=len(sitelinks),
+                   groundtruth=get_groundtruth(job['lang'], job['title'], descriptions))
+        for l, t in sitelinks.items():
+            if (l, t) not in paragraph_futures:
+                paragraph_futures[(l, t)] = HTTP.submit(get_first_paragraph, l, t)
+            waiting.setdefault(paragraph_futures[(l, t)], []).append(job)
+
+    def submit_job(job):
+        """Queue the job's item for the model, or return an error if it has no paragraph to be described from."""
+        job['network'] = time.time() - starttime
+        first_paragraphs = {l: paragraph_futures[(l, t)].result() for l, t in job['sitelinks'].items()}
+        job['features'] = {'descriptions': job['descriptions'], 'first-paragraphs': first_paragraphs}
+        if not first_paragraphs.get(job['lang']):
+            return no_paragraph_error(job['lang'], job['title'])
+        item = {'sources': first_paragraphs, 'descriptions': job['descriptions'], 'tgt_lang': job['lang'],
+                'num_beams': job['num_beams'], 'num_return_sequences': job['num_beams']}
+        model_futures[SCHEDULER.submit(item)] = job
+
+    while waiting or model_futures:
+        done, _ = concurrent.futures.wait(list(waiting) + list(model_futures),
+                                          return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in done:
+            if future in waiting:
+                for job in waiting.pop(future):
+                    job['remaining'] -= 1
+                    if job['remaining'] == 0:
+                        error = submit_job(job)
+                        if error:
+                            yield {'index': job['index'], 'lang': job['lang'], 'title': job['title'], 'error': error}
+                continue
+            job = model_futures.pop(future)
+            try:
+                prediction = future.result()
+            except Exception as e:
+                yield {'index': job['index'], 'lang': job['lang'], 'title': job['title'], 'error': str(e)}
+                continue
+            execution_times = {'total network (s)': job['network'], 'total (s)': time.time() - starttime}
+            result = format_result(job['lang'], job['title'], job['num_beams'], job['blp'], job['groundtruth'],
+                                   execution_times, job['features'], prediction)
+            result['index'] = job['index']
+            yield result
+
+
+async def call_in_pool(fn, *args):
+    """Run a blocking fetch on the shared HTTP executor so the event loop can overlap it with others."""
+    return await asyncio.get_running_loop().run_in_executor(HTTP.executor, fn, *args)
+
+
+async def gather_features(lang, title):
+    """Fetch model features, overlapping independent calls and giving each stage its own deadline.
+
+    The groundtruth comes out of the Wikidata stage (see `get_article_info`). Languages whose paragraph misses the
+    deadline are left out rather than failing the request; a Wikidata timeout falls back to the article itself.
+    """
+    execution_times = {}  # just used right now for debugging
+    features = {}  # just used right now for debugging
+    deadlines = app.config.get('FETCH_DEADLINES', {})
+    starttime = time.time()
+
+    try:
+        descriptions, sitelinks, blp, groundtruth_desc = await asyncio.wait_for(
+            call_in_pool(get_article_info, lang, title), timeout=deadlines.get('wikidata', 8))
+    except asyncio.TimeoutError:
+        descriptions, sitelinks, blp, groundtruth_desc = {}, {lang: title}, False, None
+    execution_times['wikidata-info (s)'] = time.time() - starttime
+    features['descriptions'] = descriptions
+
+    paragraph_times = {}
+
+    async def fetch_paragraph(l):
+        start = time.time()
+        paragraph = await call_in_pool(get_first_paragraph, l, sitelinks[l])
+        paragraph_times[l] = time.time() - start
+        return paragraph
+
+    tasks = {l: asyncio.ensure_future(fetch_paragraph(l)) for l in sitelinks}
+    if tasks:
+        remaining = max(0, deadlines.get('paragraphs', 15) - (time.time() - starttime))
+        await asyncio.wait(list(tasks.values()), timeout=remaining)
+    first_paragraphs = {}
+    for l, task in tasks.items():
+        if task.done() and not task.cancelled() and task.exception() is None:
+            first_paragraphs[l] = task.result()
+        else:
+            task.cancel()
+            paragraph_times[l] = None  # timed out: the prediction goes ahead without this language
+
+    execution_times['total network (s)'] = time.time() - starttime
+    execution_times['first-paragraph (s)'] = paragraph_times
+    features['first-paragraphs'] = first_paragraphs
+
+    return features, execution_times, blp, groundtruth_desc
+
+
 def get_first_paragraph(lang, title):
     # get plain-text extract of article
+    # cached extracts are served as-is while fresh, then revalidated with a conditional request (304 -> unchanged);
+    # failures are cached for a short time so broken sitelinks aren't retried on every call -- unless there's an
+    # earlier extract, which keeps being served (until the next revalidation) rather than being lost to the failure
+    now = time.time()
+    cached = EXTRACT_CACHE.get((lang, title))
+    if cached is not None and (cached['failed'] or now - cached['checked'] < app.config.get('EXTRACT_CACHE_FRESH', 600)):
+        return cached['extract']
+
+    headers = {}
+    if cached is not None and cached['etag']:
+        headers['If-None-Match'] = cached['etag']
     try:
-        response = requests.get(f'https://{lang}.wikipedia.org/api/rest_v1/page/summary/{title}', headers={ 'User-Agent': app.config['CUSTOM_UA'] })
-        return response.json()['extract']
+        response = HTTP.get(f'https://{lang}.wikipedia.org/api/rest_v1/page/summary/{title}', headers=headers)
+        if response.status_code == 304:
+            EXTRACT_REVALIDATIONS['not-modified'] += 1
+            extract, etag = cached['extract'], cached['etag']
+        else:
+            if cached is not None:
+                EXTRACT_REVALIDATIONS['modified'] += 1
+            extract, etag = response.json()['extract'], response.headers.get('ETag')
     except Exception:
+        if cached is not None:
+            EXTRACT_CACHE.set((lang, title), dict(cached, checked=now))
+            return cached['extract']
+        EXTRACT_CACHE.set((lang, title), {'extract': '', 'etag': None, 'checked': now, 'failed': True},
+                          ttl=app.config.get('EXTRACT_CACHE_NEGATIVE_TTL', 300))
         return ''
+    EXTRACT_CACHE.set((lang, title), {'extract': extract, 'etag': etag, 'checked': now, 'failed': False})
+    return extract
 
-def get_groundtruth(lang, title):
-    """Get existing article description (groundtruth)."""
-    session = mwapi.Session(f'https://{lang}.wikipedia.org', user_agent=app.config['CUSTOM_UA'])
+def get_article_info(lang, title):
+    """Get everything the model and response need besides the paragraphs: descriptions, sitelinks, BLP and groundtruth.
 
+    Planned to take as few API calls as possible: the title resolution from validating the request already holds the
+    QID and English shortdesc, and a single wbgetentities call by QID supplies the rest (including the groundtruth for
+    non-English wikis). Answers that are cached are not requested again, so a repeat request makes no calls at all.
+    """
+    descriptions, sitelinks, blp = get_wikidata_info(lang, title)
+    return descriptions, sitelinks, blp, get_groundtruth(lang, title, descriptions)
+
+def get_groundtruth(lang, title, descriptions):
+    """Get existing article description (groundtruth)."""
     # English has a prop that takes into account shortdescs (local override) that other languages don't
     if lang == 'en':
-        result = session.get(
-            action="query",
-            prop="pageprops",
-            titles=title,
-            redirects="",
-            format='json',
-            formatversion=2
-        )
-        try:
-            return result['query']['pages'][0]['pageprops']['wikibase-shortdesc']
-        except Exception:
-            return None
-    # Non-English languages: get description from Wikidata
+        return resolve_title(lang, title)['shortdesc']
+    # Non-English languages: description from Wikidata
     else:
-        # https://fr.wikipedia.org/w/api.php?action=query&prop=pageterms&titles=Chicago&wbptterms=description&wbptlanguage=fr&format=json&formatversion=2
-        result = session.get(
-            action="query",
-            prop="pageterms",
-            titles=title,
-            redirects="",
-            wbptterms="description",
-            wbptlanguage=lang,
+        return descriptions.get(lang)
+
+def get_wikidata_info(lang, title):
+    """Get article descriptions from Wikidata, using the cache for articles requested recently."""
+    return get_wikidata_infos([(lang, title)])[(lang, title)]
+
+def get_wikidata_infos(articles):
+    """Bulk `get_wikidata_info` for (lang, canonical title) pairs: uncached items are fetched 50 QIDs per call.
+
+    Articles without a Wikidata item (or whose item couldn't be fetched) get the article itself as their only sitelink.
+    """
+    infos = {}
+    to_fetch = {}  # QID -> articles connected to it
+    for lang, title in articles:
+        cached = WIKIDATA_CACHE.get((lang, title))
+        if cached is not None:
+            descriptions, sitelinks, blp = cached
+            infos[(lang, title)] = (descriptions, sitelinks, blp)
+            continue
+        qid = resolve_title(lang, title)['qid']
+        if qid is None:
+            infos[(lang, title)] = ({}, {lang: title}, False)  # not connected to a Wikidata item -- nothing to ask for
+        else:
+            to_fetch.setdefault(qid, []).append((lang, title))
+
+    qids = list(to_fetch)
+    for i in range(0, len(qids), API_BATCH_SIZE):
+        entities = fetch_wikidata_entities(qids[i:i + API_BATCH_SIZE])
+        for qid in qids[i:i + API_BATCH_SIZE]:
+            descriptions, sitelinks, blp = parse_wikidata_entity(entities.get(qid, {}))
+            for article in to_fetch[qid]:
+                # a found item always has at least the sitelink for `lang`; don't cache failed lookups
+                if sitelinks:
+                    WIKIDATA_CACHE.set(article, (descriptions, sitelinks, blp))
+                infos[article] = (descriptions, sitelinks or {article[0]: article[1]}, blp)
+    return infos
+
+def fetch_wikidata_entities(qids):
+    """Get descriptions, claims and sitelinks for up to 50 Wikidata items in one call, keyed by requested QID."""
+    try:
+        result = HTTP.api_get(
+            'https://wikidata.org',
+            action="wbgetentities",
+            ids="|".join(qids),
+            props='descriptions|claims|sitelinks',
+            languages="|".join(SUPPORTED_WIKIPEDIA_LANGUAGE_CODES),
+            sitefilter="|".join([f'{l}wiki' for l in SUPPORTED_WIKIPEDIA_LANGUAGE_CODES]),
             format='json',
             formatversion=2
         )
-        try:
-            return result['query']['pages'][0]['terms']['description'][0]
-        except Exception:
-            return None
-
-def get_wikidata_info(lang, title):
-    """Get article descriptions from Wikidata"""
-    session = mwapi.Session('https://wikidata.org', user_agent=app.config['CUSTOM_UA'])
-
-    result = session.get(
-        action="wbgetentities",
-        sites=f"{lang}wiki",
-        titles=title,
-        redirects="yes",
-        props='descriptions|claims|sitelinks',
-        languages="|".join(SUPPORTED_WIKIPEDIA_LANGUAGE_CODES),
-        sitefilter="|".join([f'{l}wiki' for l in SUPPORTED_WIKIPEDIA_LANGUAGE_CODES]),
-        format='json',
-        formatversion=2
-    )
+        entities = {}
+        for qid, entity in result['entities'].items():
+            entities[qid] = entity
+            # items that were merged come back under their new QID
+            if 'redirects' in entity:
+                entities[entity['redirects']['from']] = entity
+        return entities
+    except Exception:
+        return {}
 
+def parse_wikidata_entity(entity):
+    """Extract descriptions, supported-language sitelinks and BLP status from a wbgetentities entity."""
     descriptions = {}
     sitelinks = {}
     blp = False
     try:
-        # should be exactly 1 QID for the page if it has a Wikidata item
-        qid = list(result['entities'].keys())[0]
         # get all the available descriptions in relevant languages
-        for l in result['entities'][qid]['descriptions']:
-            descriptions[l] = result['entities'][qid]['descriptions'][l]['value']
+        for l in entity['descriptions']:
+            descriptions[l] = entity['descriptions'][l]['value']
         # get the sitelinks from supported languages
-        for wiki in result['entities'][qid]['sitelinks']:
+        for wiki in entity['sitelinks']:
             lang = wiki[:-4]  # remove 'wiki' part
-            sitelinks[lang] = result['entities'][qid]['sitelinks'][wiki]['title']
+            sitelinks[lang] = entity['sitelinks'][wiki]['title']
         try:
             human = False
-            claims = result['entities'][qid]['claims']
+            claims = entity['claims']
             for io_claim in claims.get('P31', []):
                 if io_claim['mainsnak']['datavalue']['value']['id'] == 'Q5':
                     human = True
@@ -170,29 +614,71 @@ def get_wikidata_info(lang, title):
 
     return descriptions, sitelinks, blp
 
+def resolve_title(lang, title):
+    """Resolve redirects / normalization along with the page's QID and (English) shortdesc in one call.
+
+    Results are cached under both the requested and the canonical title so that the later lookups for the same
+    request don't go back to the API.
+    """
+    return resolve_titles(lang, [title])[title]
+
+def resolve_titles(lang, titles):
+    """Bulk `resolve_title` for titles on one wiki: uncached titles are resolved 50 per call."""
+    resolved = {}
+    to_fetch = []
+    for title in titles:
+        cached = TITLE_CACHE.get((lang, title))
+        if cached is not None:
+            resolved[title] = cached
+        elif '|' in title:
+            resolved[title] = {'title': None, 'qid': None, 'shortdesc': None}  # would be split into two titles
+        elif title not in to_fetch:
+            to_fetch.append(title)
+
+    for i in range(0, len(to_fetch), API_BATCH_SIZE):
+        chunk = to_fetch[i:i + API_BATCH_SIZE]
+        result = HTTP.api_get(
+            'https://{0}.wikipedia.org'.format(lang),
+            action="query",
+            prop="info|pageprops",
+            inprop='',
+            ppprop='wikibase_item|wikibase-shortdesc',
+            redirects='',
+            titles="|".join(chunk),
+            format='json',
+            formatversion=2
+        )
+        normalized = {n['from']: n['to'] for n in result['query'].get('normalized', [])}
+        redirects = {r['from']: r['to'] for r in result['query'].get('redirects', [])}
+        pages = {page['title']: page for page in result['query']['pages']}
+        for title in chunk:
+            page_title = normalized.get(title, title)
+            page = pages.get(redirects.get(page_title, page_title), {'missing': True})
+            if 'missing' in page or 'invalid' in page:
+                resolved[title] = {'title': None, 'qid': None, 'shortdesc': None}
+            else:
+                pageprops = page.get('pageprops', {})
+                resolved[title] = {'title': page['title'].replace(' ', '_'),
+                                   'qid': pageprops.get('wikibase_item'),
+                                   'shortdesc': pageprops.get('wikibase-shortdesc')}
+            TITLE_CACHE.set((lang, title), resolved[title])
+            if resolved[title]['title'] is not None and resolved[title]['title'] != title:
+                TITLE_CACHE.set((lang, resolved[title]['title']), resolved[title])
+    return resolved
+
 def get_canonical_page_title(title, lang):
     """Resolve redirects / normalization -- used to verify that an input page_title exists and help future API calls"""
-    session = mwapi.Session('https://{0}.wikipedia.org'.format(lang), user_agent=app.config['CUSTOM_UA'])
-
-    result = session.get(
-        action="query",
-        prop="info",
-        inprop='',
-        redirects='',
-        titles=title,
-        format='json',
-        formatversion=2
-    )
-    if 'missing' in result['query']['pages'][0]:
-        return None
-    else:
-        return result['query']['pages'][0]['title'].replace(' ', '_')
+    return resolve_title(lang, title)['title']
 
 def validate_lang(lang):
     return lang in SUPPORTED_WIKIPEDIA_LANGUAGE_CODES
 
 def validate_api_args():
-    """Validate API arguments: supported Wikipedia language and valid page title."""
+    """Validate API arguments: supported Wikipedia language and valid page title.
+
+    The optional `targets` (e.g. "en,fr,de") asks for descriptions in several languages at once; the prediction is
+    then a dict keyed by target language, with None for targets the article has no paragraph in.
+    """
     error = None
     lang = None
     page_title = None
@@ -215,27 +701,130 @@ def validate_api_args():
         except Exception:
             pass
 
-    return lang, page_title, num_beams, error
-
-
-def load_model():
-    # Load model (takes ~1 minute) and prime with first prediction
-    # to make sure operating correctly and fully loaded in
-    model_path = '/srv/model-25lang-all/'
-    MODEL.load_model(model_path)
-    test_model()
+    targets = None
+    if request.args.get('targets') and not error:
+        targets = list(dict.fromkeys(t.strip() for t in request.args['targets'].split(',') if t.strip()))
+        unsupported = [t for t in targets if not validate_lang(t)]
+        if unsupported or not targets:
+            error = 'unsupported target language(s): {0} -- see /supported-languages'.format(', '.join(unsupported))
+
+    return lang, page_title, num_beams, targets, error
+
+def validate_batch_args():
+    """Validate the POST /articles body: a JSON list (or {"articles": [...]}) of {"lang", "title", "num_beams"}.
+
+    The request is rejected if any item lacks a supported language or a title; titles are resolved later, in bulk.
+    """
+    body = request.get_json(silent=True)
+    if isinstance(body, dict):
+        body = body.get('articles')
+    if not isinstance(body, list) or not body:
+        return None, 'expected a JSON list of articles -- e.g., [{"lang": "en", "title": "2005_World_Series", "num_beams": 2}]'
+    max_items = app.config.get('ARTICLES_MAX_ITEMS', 50)
+    if len(body) > max_items:
+        return None, 'too many articles -- at most {0} per request'.format(max_items)
+
+    items = []
+    for index, article in enumerate(body):
+        if not isinstance(article, dict) or not article.get('title') or not validate_lang(article.get('lang')):
+            return None, 'article {0} needs a supported "lang" and a "title"'.format(index)
+        num_beams = 1
+        try:
+            num_beams = max(int(article.get('num_beams', 1)), num_beams)  # must return at least one sequence
+        except Exception:
+            pass
+        items.append((index, article['lang'], article['title'], num_beams))
+    return items, None
+
+
+def start_load(model_dir, background=True, then=None):
+    """Run `load_model`, on a background thread unless not `background`; False (and nothing done) if a load is
+    already running."""
+    global LOAD_STATUS
+    if not LOAD_LOCK.acquire(blocking=False):
+        return False
+    LOAD_STATUS = {'state': 'loading', 'model_dir': model_dir, 'since': time.time(), 'error': None}
+    publish_load_status()
+    if background:
+        threading.Thread(target=load_model, args=(model_dir, then), name='load-model', daemon=True).start()
+    else:
+        load_model(model_dir, then)
+    return True
+
+def load_model(model_dir, then=None):
+    """Load the model in `model_dir` into a new ModelLoader and swap it in for MODEL; called through `start_load`,
+    which runs `then` once the new model is in.
+
+    Loading takes ~1 minute, then the new model is primed with a prediction to make sure it's operating correctly and
+    fully loaded in. Until the swap, requests are served by the current model; batches already running finish on it
+    and its memory (weights, encoder cache, sliced output projections) is freed once the last of them is done.
+    """
+    global MODEL, MODEL_PATH, MODEL_STATUS, LOAD_STATUS
+    try:
+        loader = new_model_loader()
+        loader.load_model(model_dir)
+        test_model(loader)
+    except Exception as e:
+        traceback.print_exc()
+        if MODEL_STATUS['state'] != 'ready':
+            MODEL_STATUS = {'state': 'failed', 'since': time.time(), 'error': repr(e)}
+        LOAD_STATUS = dict(LOAD_STATUS, state='failed', error=repr(e))
+    else:
+        MODEL, MODEL_PATH = loader, model_dir
+        MODEL_STATUS = {'state': 'ready', 'since': time.time(), 'error': None}
+        LOAD_STATUS = dict(LOAD_STATUS, state='done')
+    finally:
+        publish_load_status()
+        LOAD_LOCK.release()
+    if then is not None and LOAD_STATUS['state'] == 'done':
+        then()
+    # the replaced (or failed) loader goes as soon as nothing uses it; collect any cycles keeping it around
+    loader = None
+    gc.collect()
+
+def publish_load_status():
+    """Share this worker's LOAD_STATUS with the others, which `reload_status` reads in the chain-reload mode."""
+    if RELOAD_MODE == 'chain':
+        set_shared('worker-{0}'.format(uwsgi.worker_id()), LOAD_STATUS)
+
+def test_model(loader):
+    """Warm-up prediction on a bundled article (features as returned by /article), so it needs no network."""
+    with open(WARMUP_ARTICLE_PATH, encoding='utf-8') as f:
+        article = json.load(f)
+    features = article['features']
+    starttime = time.time()
+    prediction = loader.predict(features['first-paragraphs'], features['descriptions'], article['lang'],
+                                num_beams=article['num_beams'], num_return_sequences=article['num_beams'])
+    print({'lang': article['lang'], 'title': article['title'], 'latency': {'total (s)': time.time() - starttime},
+           'prediction': prediction, 'expected': article['expected']})
 
-def test_model():
-    lang = 'en'
-    title = 'Clandonald'
-    num_beams = 2
+def handle_reload_signal(signum, frame):
+    start_load(MODEL_PATH)
 
-    expected = ['Hamlet in Alberta, Canada', 'human settlement in Alberta, Canada']
-    result = run_model(lang, title, num_beams)
-    result['expected'] = expected
-    print(result)
+def after_fork():
+    MODEL.after_fork()
 
-load_model()
+if MODEL_PRELOAD:
+    start_load(MODEL_PATH, background=False)
+    # the collector never visits the objects that exist by now, so it doesn't write to their pages in the workers
+    gc.freeze()
+    try:
+        from uwsgidecorators import postfork
+    except ImportError:  # not running under uWSGI
+        os.register_at_fork(after_in_child=after_fork)
+    else:
+        postfork(after_fork)
+elif RELOAD_MODE == 'chain' and get_shared('model-dir') is not None:
+    # spawned by a chain reload (or respawned after it): load the model the reload checked before accepting requests,
+    # as the chain only moves on to the next worker once this one accepts them
+    MODEL_PATH = get_shared('model-dir')
+    start_load(MODEL_PATH, background=False)
+else:
+    start_load(MODEL_PATH)
+    # `kill -USR2 <worker pid>` reloads MODEL_PATH in place; the handler runs once the worker's main thread next runs
+    # Python code (e.g. its next request), so POST /admin/reload is the more direct trigger
+    if RELOAD_MODE == 'in-place' and threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGUSR2, handle_reload_signal)
 application = app
 
 if __name__ == '__main__':
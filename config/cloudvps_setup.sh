@@ -29,6 +29,7 @@ echo "Setting up paths..."
 rm -rf ${TMP_PATH}
 mkdir -p ${TMP_PATH}
 mkdir -p ${SRV_PATH}/sock
+mkdir -p ${SRV_PATH}/cache  # on-disk caches of Wikipedia / Wikidata lookups
 mkdir -p ${ETC_PATH}
 mkdir -p ${ETC_PATH}/resources
 mkdir -p ${LOG_PATH}
@@ -13,6 +13,30 @@ LOG_PATH="/var/log/uwsgi"  # application log data
 LIB_PATH="/var/lib/${APP_LBL}"  # where virtualenv will sit
 MOD_PATH="/srv/model-25lang-all/"  # where the model binary is stored
 
+# `release.sh --reload-model`: a new checkpoint in ${MOD_PATH} without code changes -- reload it in the running
+# workers instead of restarting the service (see MODEL_PRELOAD in flask_config.yaml for how the workers reload)
+if [[ "$1" == "--reload-model" ]]; then
+    echo "Reloading the model from ${MOD_PATH}..."
+    if RESPONSE=$(curl -sf -X POST --data-urlencode "model_dir=${MOD_PATH}" http://localhost/admin/reload); then
+        SINCE=$(echo "${RESPONSE}" | python3 -c 'import json, sys; print(json.load(sys.stdin)["since"])')
+        for i in $(seq 60); do
+            sleep 5
+            # no answer while the workers are replaced; the state of an earlier load doesn't count
+            STATUS=$(curl -sf http://localhost/admin/reload) || continue
+            STATE=$(echo "${STATUS}" | python3 -c 'import json, sys; s = json.load(sys.stdin); print(s["state"] if s["since"] >= float(sys.argv[1]) else "loading")' "${SINCE}")
+            if [[ "${STATE}" != "loading" ]]; then
+                echo "${STATUS}"
+                [[ "${STATE}" == "done" ]] && exit 0 || exit 1
+            fi
+        done
+        echo "Model still loading after 5 minutes -- check /var/log/uwsgi/uwsgi.log"
+        exit 1
+    fi
+    echo "Hot reload unavailable, restarting the service instead"
+    systemctl restart model.service
+    exit 0
+fi
+
 # clean up old versions
 rm -rf ${TMP_PATH}
 mkdir -p ${TMP_PATH}
@@ -0,0 +1,128 @@
+import threading
+import unittest
+
+from artdescapi.transformers import is_torch_available
+from artdescapi.transformers.testing_utils import require_torch
+from artdescapi.utils.batching import BatchScheduler
+
+
+if is_torch_available():
+    from artdescapi.utils.utils import ModelLoader
+
+
+class RecordingPredictor:
+    """A `predict_batch` that records its calls and answers each item with `answer(item)`."""
+
+    def __init__(self, answer):
+        self.answer = answer
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def __call__(self, items, return_exceptions=False):
+        with self.lock:
+            self.calls.append((list(items), return_exceptions))
+        return [self.answer(item) for item in items]
+
+
+class BatchSchedulerTest(unittest.TestCase):
+    def submit_all(self, scheduler, items):
+        # submitted from one thread, so every item is queued before the first batch is taken
+        return [scheduler.submit(item) for item in items]
+
+    def test_concurrent_items_share_one_call(self):
+        predictor = RecordingPredictor(lambda item: item["tgt_lang"].upper())
+        scheduler = BatchScheduler(predictor, max_batch_size=8, max_wait=0.5)
+        futures = self.submit_all(scheduler, [{"tgt_lang": lang} for lang in ("en", "fr", "de")])
+
+        self.assertEqual([future.result(timeout=5) for future in futures], ["EN", "FR", "DE"])
+        self.assertEqual(len(predictor.calls), 1)
+        self.assertTrue(predictor.calls[0][1])
+
+    def test_batches_are_capped(self):
+        predictor = RecordingPredictor(lambda item: item["tgt_lang"])
+        scheduler = BatchScheduler(predictor, max_batch_size=2, max_wait=0.5)
+        futures = self.submit_all(scheduler, [{"tgt_lang": str(i)} for i in range(5)])
+
+        self.assertEqual([future.result(timeout=5) for future in futures], ["0", "1", "2", "3", "4"])
+        self.assertEqual([len(items) for items, _ in predictor.calls], [2, 2, 1])
+
+    def test_returned_exception_only_fails_its_item(self):
+        def answer(item):
+            return ValueError("no paragraph") if item["tgt_lang"] == "fr" else item["tgt_lang"]
+
+        scheduler = BatchScheduler(RecordingPredictor(answer), max_wait=0.5)
+        en, fr = self.submit_all(scheduler, [{"tgt_lang": "en"}, {"tgt_lang": "fr"}])
+
+        self.assertEqual(en.result(timeout=5), "en")
+        with self.assertRaises(ValueError):
+            fr.result(timeout=5)
+
+    def test_raised_exception_fails_the_whole_batch(self):
+        def predict_batch(items, return_exceptions=False):
+            raise RuntimeError("the model is not loaded yet")
+
+        scheduler = BatchScheduler(predict_batch, max_wait=0.5)
+        futures = self.submit_all(scheduler, [{"tgt_lang": "en"}, {"tgt_lang": "fr"}])
+        for future in futures:
+            with self.assertRaises(RuntimeError):
+                future.result(timeout=5)
+
+    def test_predict_blocks_for_its_output(self):
+        scheduler = BatchScheduler(RecordingPredictor(lambda item: [item["sources"]["en"]]), max_wait=0)
+        self.assertEqual(scheduler.predict({"en": "paragraph"}, {}, "en"), ["paragraph"])
+
+
+@require_torch
+class ModelLoaderPredictBatchTest(unittest.TestCase):
+    def setUp(self):
+        self.loader = ModelLoader()
+        # predict_batch only checks that a model is loaded; generation is replaced below
+        self.loader.loaded = object()
+        self.calls = []
+
+        def generate(loaded, items, tgt_langs, num_beams, num_return_sequences):
+            self.calls.append(([item["sources"] for item in items], tgt_langs))
+            if "de" in tgt_langs:
+                raise RuntimeError("generation failed")
+            return [[["{0}:{1}".format(t, item["sources"][t])] for t in tgt_langs] for item in items]
+
+        self.loader._generate = generate
+
+    @staticmethod
+    def item(sources, tgt_lang, num_beams=1):
+        return {"sources": sources, "descriptions": {}, "tgt_lang": tgt_lang, "num_beams": num_beams,
+                "num_return_sequences": 1}
+
+    def test_items_are_grouped_and_returned_in_order(self):
+        items = [
+            self.item({"en": "a"}, "en"),
+            self.item({"fr": "b", "en": "c"}, ["fr", "en"]),
+            self.item({"en": "d", "fr": "e"}, "en"),
+            self.item({"en": "f"}, "en", num_beams=2),
+        ]
+        outputs = self.loader.predict_batch(items)
+
+        self.assertEqual(outputs, [["en:a"], {"fr": ["fr:b"], "en": ["en:c"]}, ["en:d"], ["en:f"]])
+        self.assertEqual(len(self.calls), 3)
+
+    def test_item_without_target_paragraph_fails_alone(self):
+        items = [self.item({"fr": "a"}, "en"), self.item({"en": "b"}, "en")]
+        outputs = self.loader.predict_batch(items, return_exceptions=True)
+
+        self.assertIsInstance(outputs[0], ValueError)
+        self.assertEqual(outputs[1], ["en:b"])
+        self.assertEqual(self.calls, [([{"en": "b"}], ["en"])])
+        with self.assertRaises(ValueError):
+            self.loader.predict_batch(items)
+
+    def test_failed_generation_only_fails_its_group(self):
+        items = [self.item({"de": "a"}, "de"), self.item({"en": "b"}, "en")]
+        outputs = self.loader.predict_batch(items, return_exceptions=True)
+
+        self.assertIsInstance(outputs[0], RuntimeError)
+        self.assertEqual(outputs[1], ["en:b"])
+
+    def test_requires_a_loaded_model(self):
+        self.loader.loaded = None
+        with self.assertRaises(RuntimeError):
+            self.loader.predict_batch([self.item({"en": "a"}, "en")])
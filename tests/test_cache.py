@@ -0,0 +1,153 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from artdescapi.utils.cache import LRUCache, MmapVectorStore, SqliteStore, description_key
+
+
+class Clock:
+    """Stands in for `time.time` in the cache module."""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class CacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        patcher = mock.patch("artdescapi.utils.cache.time.time", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+
+    def store(self, **kwargs):
+        return SqliteStore(os.path.join(self.tmp_dir.name, "cache.sqlite"), **kwargs)
+
+
+class LRUCacheTest(CacheTestCase):
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(max_entries=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual((cache.get("a"), cache.get("c")), (1, 3))
+        self.assertEqual(cache.stats()["entries"], 2)
+
+    def test_entries_expire(self):
+        cache = LRUCache(ttl=10)
+        cache.set("a", 1)
+        cache.set("b", 2, ttl=100)
+        self.clock.now += 50
+
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get("b"), 2)
+        self.assertEqual(cache.get("a", "default"), "default")
+
+    def test_entries_without_ttl_never_expire(self):
+        cache = LRUCache(ttl=None)
+        cache.set("a", 1)
+        self.clock.now += 1e9
+        self.assertEqual(cache.get("a"), 1)
+
+    def test_stats(self):
+        cache = LRUCache()
+        cache.set("a", 1)
+        cache.get("a")
+        cache.get("b")
+        stats = cache.stats()
+
+        self.assertEqual((stats["hits"], stats["misses"], stats["hit-rate"]), (1, 1, 0.5))
+        self.assertIsNone(LRUCache().stats()["hit-rate"])
+
+    def test_falls_back_to_the_store(self):
+        LRUCache(ttl=10, store=self.store()).set("a", [1, 2])
+        # a new process: nothing in memory, the entry is read back from disk
+        cache = LRUCache(ttl=10, store=self.store())
+
+        self.assertEqual(cache.get("a"), [1, 2])
+        self.assertEqual(cache.get("a"), [1, 2])
+        self.assertEqual((cache.stats()["store-hits"], cache.stats()["hits"]), (1, 1))
+        self.clock.now += 20
+        self.assertIsNone(LRUCache(store=self.store()).get("a"))
+
+
+class SqliteStoreTest(CacheTestCase):
+    def count_rows(self, store):
+        return store._connection().execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+    def test_get_respects_expiry(self):
+        store = self.store()
+        store.set(["en", "key"], 1010.0, {"value": 1})
+        store.set("forever", None, 2)
+
+        self.assertEqual(store.get(["en", "key"], 1005.0), (1010.0, {"value": 1}))
+        self.assertIsNone(store.get(["en", "key"], 1010.0))
+        self.assertEqual(store.get("forever", 1e12), (None, 2))
+        self.assertIsNone(store.get("missing", 0))
+
+    def test_prune_drops_expired_rows(self):
+        store = self.store()
+        store.set("old", 1010.0, 1)
+        store.set("new", 2000.0, 2)
+        self.clock.now = 1500.0
+        store.prune()
+
+        self.assertEqual(self.count_rows(store), 1)
+        self.assertEqual(store.get("new", 1500.0), (2000.0, 2))
+
+    def test_prune_caps_rows_keeping_the_latest_to_expire(self):
+        store = self.store(max_entries=2, prune_every=3)
+        store.set("a", 1100.0, 1)
+        store.set("b", None, 2)
+        self.assertEqual(self.count_rows(store), 2)
+        store.set("c", 1200.0, 3)
+
+        self.assertEqual(self.count_rows(store), 2)
+        self.assertIsNone(store.get("a", 1000.0))
+        self.assertEqual(store.get("b", 1000.0), (None, 2))
+
+    def test_opening_prunes(self):
+        self.store().set("old", 1010.0, 1)
+        self.clock.now = 1500.0
+        self.assertEqual(self.count_rows(self.store()), 0)
+
+
+class DescriptionKeyTest(unittest.TestCase):
+    def test_normalises_case_unicode_and_whitespace(self):
+        key = description_key("fr", "Joueur de baseball  américain")
+        self.assertEqual(key, description_key("fr", " joueur de BASEBALL\taméricain"))
+        self.assertNotEqual(key, description_key("en", "Joueur de baseball américain"))
+        self.assertTrue(0 <= key < 2 ** 64)
+
+
+class MmapVectorStoreTest(unittest.TestCase):
+    def test_build_and_get(self):
+        keys = [description_key("en", "a"), description_key("en", "b"), description_key("en", "a")]
+        vectors = np.arange(9, dtype=np.float32).reshape(3, 3)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            MmapVectorStore.build(tmp_dir, keys, vectors)
+            store = MmapVectorStore(tmp_dir)
+
+            self.assertEqual(len(store), 2)
+            expires, vector = store.get(keys[0], 0)
+            self.assertIsNone(expires)
+            self.assertEqual(vector.dtype, np.float16)
+            self.assertTrue(np.array_equal(vector, vectors[0]))
+            self.assertTrue(np.array_equal(store.get(keys[1], 0)[1], vectors[1]))
+            self.assertIsNone(store.get(description_key("en", "c"), 0))
+            # a read-only backend: entries set on the cache stay in memory
+            cache = LRUCache(store=store)
+            self.assertTrue(np.array_equal(cache.get(keys[1]), vectors[1]))
+            cache.set(keys[1], np.zeros(3))
+            self.assertTrue(np.array_equal(store.get(keys[1], 0)[1], vectors[1]))
+            del store, cache
@@ -0,0 +1,72 @@
+# coding=utf-8
+# Copyright 2021 The HuggingFace Inc. team
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import tempfile
+import unittest
+
+from artdescapi.transformers import is_torch_available
+from artdescapi.transformers.testing_utils import require_torch
+
+
+if is_torch_available():
+    import torch
+    from torch import nn
+
+    from artdescapi.transformers import VocabShortlist, load_vocab_shortlists, save_vocab_shortlists
+
+
+@require_torch
+class VocabShortlistTest(unittest.TestCase):
+    def setUp(self):
+        torch.manual_seed(0)
+        self.lm_head = nn.Linear(8, 20, bias=False)
+        self.final_logits_bias = torch.randn(1, 20)
+        self.hidden_states = torch.randn(2, 3, 8)
+
+    def test_logits_are_minus_inf_outside_the_shortlist(self):
+        shortlist = VocabShortlist([7, 2, 11, 2])
+        logits = shortlist.project(self.hidden_states, self.lm_head, self.final_logits_bias)
+        expected = self.lm_head(self.hidden_states) + self.final_logits_bias
+
+        self.assertEqual(logits.shape, (2, 3, 20))
+        outside = torch.ones(20, dtype=torch.bool)
+        outside[[2, 7, 11]] = False
+        self.assertTrue(torch.isneginf(logits[..., outside]).all())
+        self.assertTrue(torch.allclose(logits[..., ~outside], expected[..., ~outside], atol=1e-6))
+        self.assertTrue(set(logits.argmax(dim=-1).flatten().tolist()) <= {2, 7, 11})
+
+    def test_projection_follows_new_weights(self):
+        shortlist = VocabShortlist([1, 3])
+        shortlist.project(self.hidden_states, self.lm_head)
+        with torch.no_grad():
+            self.lm_head.weight = nn.Parameter(self.lm_head.weight * 2)
+        logits = shortlist.project(self.hidden_states, self.lm_head)
+        self.assertTrue(torch.allclose(logits[..., [1, 3]], self.lm_head(self.hidden_states)[..., [1, 3]], atol=1e-6))
+
+    def test_membership_and_union(self):
+        shortlist = VocabShortlist([4, 1]).union(VocabShortlist([9, 4]))
+        self.assertEqual(shortlist.token_ids.tolist(), [1, 4, 9])
+        self.assertEqual(len(shortlist), 3)
+        self.assertIn(9, shortlist)
+        self.assertNotIn(5, shortlist)
+        self.assertNotIn(10, shortlist)
+
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "shortlists.json")
+            save_vocab_shortlists(path, {"en": VocabShortlist([3, 1]), "fr": VocabShortlist([2])})
+            shortlists = load_vocab_shortlists(path)
+        self.assertEqual({lang: s.token_ids.tolist() for lang, s in shortlists.items()}, {"en": [1, 3], "fr": [2]})
@@ -0,0 +1,90 @@
+# coding=utf-8
+# Copyright 2021 The HuggingFace Inc. team
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import tempfile
+import unittest
+
+from artdescapi.transformers import is_torch_available
+from artdescapi.transformers.testing_utils import require_torch
+
+from .test_modeling_mbart_multisource import tiny_config
+
+
+if is_torch_available():
+    import torch
+    from torch import nn
+
+    from artdescapi.transformers import MBartForConditionalGeneration
+    from artdescapi.transformers.modeling_utils import TORCH_INIT_FUNCTIONS, no_init_weights
+
+
+MISSING_KEY = "model.encoder.layers.0.fc1.weight"
+
+
+@require_torch
+class FastInitTest(unittest.TestCase):
+    def setUp(self):
+        torch.manual_seed(0)
+        self.model = MBartForConditionalGeneration(tiny_config()).eval()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.model.save_pretrained(self.tmp_dir.name)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def load(self, fast_init):
+        return MBartForConditionalGeneration.from_pretrained(
+            self.tmp_dir.name, config=tiny_config(), use_mmap=False, _fast_init=fast_init
+        )
+
+    def test_fast_and_slow_init_load_the_same_weights(self):
+        fast, slow = self.load(True), self.load(False)
+
+        self.assertEqual(set(fast.state_dict()), set(slow.state_dict()))
+        for name, tensor in self.model.state_dict().items():
+            self.assertTrue(torch.equal(fast.state_dict()[name], tensor), name)
+            self.assertTrue(torch.equal(slow.state_dict()[name], tensor), name)
+        for model in (fast, slow):
+            self.assertEqual(
+                model.get_output_embeddings().weight.data_ptr(), model.get_input_embeddings().weight.data_ptr()
+            )
+
+    def test_weights_missing_from_the_checkpoint_are_initialized(self):
+        state_dict = self.model.state_dict()
+        del state_dict[MISSING_KEY]
+        torch.save(state_dict, os.path.join(self.tmp_dir.name, "pytorch_model.bin"))
+
+        for fast_init in (True, False):
+            # leftovers of earlier allocations must not survive as the missing weight
+            with no_init_weights():
+                nn.Linear(16, 32).weight.data.fill_(float("nan"))
+            model = self.load(fast_init)
+            weight = model.state_dict()[MISSING_KEY]
+            self.assertTrue(torch.isfinite(weight).all())
+            # MBart's _init_weights draws linear weights from N(0, init_std)
+            self.assertAlmostEqual(weight.std().item(), model.config.init_std, delta=0.01)
+            self.assertFalse(torch.equal(weight, self.model.state_dict()[MISSING_KEY]))
+            # the other tensors of the module keep the checkpoint's values
+            bias = MISSING_KEY.replace("weight", "bias")
+            self.assertTrue(torch.equal(model.state_dict()[bias], self.model.state_dict()[bias]))
+
+    def test_no_init_weights_restores_torch_init(self):
+        with no_init_weights():
+            with no_init_weights():
+                pass
+            self.assertIsNot(nn.init.normal_, TORCH_INIT_FUNCTIONS["normal_"])
+        for name, init_function in TORCH_INIT_FUNCTIONS.items():
+            self.assertIs(getattr(nn.init, name), init_function)
@@ -0,0 +1,237 @@
+# coding=utf-8
+# Copyright 2021 The HuggingFace Inc. team
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from artdescapi.transformers import is_torch_available
+from artdescapi.transformers.testing_utils import require_torch
+
+
+if is_torch_available():
+    import torch
+
+    from artdescapi.transformers import EncoderOutputCache, MBartConfig, MBartForConditionalGeneration
+    from artdescapi.transformers.generation_utils import masked_mean_pooling
+    from artdescapi.transformers.models.mbart.modeling_mbart import _select_main_lang
+
+
+def tiny_config():
+    return MBartConfig(
+        vocab_size=99,
+        d_model=16,
+        encoder_layers=2,
+        decoder_layers=2,
+        encoder_attention_heads=2,
+        decoder_attention_heads=2,
+        encoder_ffn_dim=32,
+        decoder_ffn_dim=32,
+        max_position_embeddings=64,
+        graph_embd_length=8,
+    )
+
+
+def multilingual_batch(lengths, batch_size=3, seed=0):
+    """
+    Right-padded per-language ``input_ids`` / ``attention_mask`` with a different length per language; row ``i`` has
+    ``i`` padding tokens, as the tokenizer gives for shorter texts.
+    """
+    generator = torch.Generator().manual_seed(seed)
+    input_ids, attention_mask = {}, {}
+    for lang, length in lengths.items():
+        ids = torch.randint(4, 99, (batch_size, length), generator=generator)
+        mask = torch.ones_like(ids)
+        for row in range(batch_size):
+            ids[row, length - row - 1] = 2  # eos
+            ids[row, length - row :] = 1  # pad
+            mask[row, length - row :] = 0
+        input_ids[lang] = ids
+        attention_mask[lang] = mask
+    return input_ids, attention_mask
+
+
+@require_torch
+class MBartMultiSourceEncodingTest(unittest.TestCase):
+    def setUp(self):
+        torch.manual_seed(0)
+        self.model = MBartForConditionalGeneration(tiny_config()).eval()
+        self.encoder = self.model.get_encoder()
+
+    def assert_close_where(self, actual, expected, mask):
+        # outputs are only compared at real tokens: padding positions don't feed into anything downstream
+        mask = mask.bool()
+        self.assertTrue(torch.allclose(actual[mask], expected[mask], atol=1e-5))
+
+    def test_forward_packed_matches_per_language_encoding(self):
+        input_ids, attention_mask = multilingual_batch({"en": 7, "fr": 5, "de": 11})
+        with torch.no_grad():
+            expected = {
+                lang: self.encoder(input_ids=input_ids[lang], attention_mask=attention_mask[lang]).last_hidden_state
+                for lang in input_ids
+            }
+            for num_buckets in (1, 2, 3):
+                packed = self.encoder.forward_packed(input_ids, attention_mask, num_buckets=num_buckets)
+                self.assertEqual(list(packed), list(input_ids))
+                for lang in input_ids:
+                    self.assertEqual(packed[lang].last_hidden_state.shape, expected[lang].shape)
+                    self.assert_close_where(
+                        packed[lang].last_hidden_state, expected[lang], attention_mask[lang]
+                    )
+
+    def test_forward_packed_skips_missing_languages_and_rows(self):
+        input_ids, attention_mask = multilingual_batch({"en": 7, "fr": 5})
+        input_ids["de"], attention_mask["de"] = None, None
+        language_mask = {"en": torch.tensor([1, 1, 1]), "fr": torch.tensor([1, 0, 1]), "de": torch.tensor([0, 0, 0])}
+        with torch.no_grad():
+            packed = self.encoder.forward_packed(input_ids, attention_mask, language_mask=language_mask)
+            expected = self.encoder(input_ids=input_ids["fr"], attention_mask=attention_mask["fr"]).last_hidden_state
+
+        self.assertEqual(set(packed), {"en", "fr"})
+        fr = packed["fr"].last_hidden_state
+        self.assertTrue(torch.equal(fr[1], torch.zeros_like(fr[1])))
+        for row in (0, 2):
+            self.assert_close_where(fr[row], expected[row], attention_mask["fr"][row])
+
+    def test_fused_memory_only_averages_the_languages_an_item_has(self):
+        input_ids, attention_mask = multilingual_batch({"en": 7, "fr": 5}, batch_size=2)
+        language_mask = {"en": torch.tensor([1, 1]), "fr": torch.tensor([1, 0])}
+        model = self.model.model
+        with torch.no_grad():
+            encoder_outputs = self.encoder.forward_packed(input_ids, attention_mask)
+            fused = model.fuse_encoder_outputs(encoder_outputs, attention_mask, "en", language_mask=language_mask)
+            # the second item on its own, with only the language it has
+            alone = model.fuse_encoder_outputs(
+                {"en": (encoder_outputs["en"].last_hidden_state[1:],)}, {"en": attention_mask["en"][1:]}, "en"
+            )
+            both = model.fuse_encoder_outputs(
+                {lang: (outputs.last_hidden_state[:1],) for lang, outputs in encoder_outputs.items()},
+                {lang: mask[:1] for lang, mask in attention_mask.items()},
+                "en",
+            )
+
+        self.assertTrue(torch.allclose(fused.last_hidden_state[1:], alone.last_hidden_state, atol=1e-5))
+        self.assertTrue(torch.allclose(fused.last_hidden_state[:1], both.last_hidden_state, atol=1e-5))
+
+    def test_encoder_last_hidden_state_with_one_main_language_per_row(self):
+        input_ids, attention_mask = multilingual_batch({"en": 7, "fr": 5}, batch_size=2)
+        with torch.no_grad():
+            outputs = self.model.model(
+                input_ids=input_ids,
+                attention_mask=attention_mask,
+                decoder_input_ids=torch.tensor([[2, 5], [2, 6]]),
+                target_lang="en",
+                main_lang=["fr", "en"],
+                encoder_buckets=1,
+            )
+            encoder_outputs = self.encoder.forward_packed(input_ids, attention_mask)
+
+        expected = _select_main_lang(
+            {lang: output.last_hidden_state for lang, output in encoder_outputs.items()}, ["fr", "en"]
+        )
+        self.assertTrue(torch.allclose(outputs.encoder_last_hidden_state, expected, atol=1e-5))
+
+    def test_generate_with_encoder_buckets_matches_per_language_encoding(self):
+        input_ids, attention_mask = multilingual_batch({"en": 7, "fr": 5, "de": 11}, batch_size=2)
+        outputs = []
+        for encoder_buckets in (None, 2):
+            with torch.no_grad():
+                outputs.append(
+                    self.model.generate(
+                        input_ids=dict(input_ids),
+                        attention_mask=dict(attention_mask),
+                        graph_embeddings=None,
+                        bert_inputs=None,
+                        bert_outputs=torch.zeros(2, 768),
+                        max_length=8,
+                        num_beams=2,
+                        target_lang="en",
+                        decoder_start_token_id=2,
+                        encoder_buckets=encoder_buckets,
+                    )
+                )
+        self.assertTrue(torch.equal(outputs[0], outputs[1]))
+
+
+@require_torch
+class SelectMainLangTest(unittest.TestCase):
+    def test_single_language(self):
+        per_lang = {"en": torch.ones(2, 3), "fr": torch.zeros(2, 5)}
+        self.assertIs(_select_main_lang(per_lang, "en"), per_lang["en"])
+
+    def test_one_language_per_row(self):
+        per_lang = {"en": torch.arange(6.0).view(2, 3, 1), "fr": -torch.arange(1.0, 11.0).view(2, 5, 1)}
+        selected = _select_main_lang(per_lang, ["fr", "en"])
+
+        self.assertEqual(selected.shape, (2, 5, 1))
+        self.assertTrue(torch.equal(selected[0], per_lang["fr"][0]))
+        self.assertTrue(torch.equal(selected[1, :3], per_lang["en"][1]))
+        self.assertTrue(torch.equal(selected[1, 3:], torch.zeros(2, 1)))
+
+
+@require_torch
+class MaskedMeanPoolingTest(unittest.TestCase):
+    def test_padding_does_not_change_the_mean(self):
+        hidden_states = torch.randn(1, 4, 3)
+        padded = torch.cat([hidden_states, torch.randn(1, 2, 3)], dim=1)
+        mask = torch.tensor([[1, 1, 1, 1, 0, 0]])
+
+        pooled = masked_mean_pooling(padded, mask)
+        self.assertTrue(torch.allclose(pooled, hidden_states.mean(dim=1), atol=1e-6))
+
+    def test_row_without_tokens_is_zero(self):
+        pooled = masked_mean_pooling(torch.randn(2, 3, 4), torch.tensor([[1, 1, 0], [0, 0, 0]]))
+        self.assertTrue(torch.equal(pooled[1], torch.zeros(4)))
+
+
+@require_torch
+class EncoderOutputCacheTest(unittest.TestCase):
+    def setUp(self):
+        torch.manual_seed(0)
+        self.encoder = MBartForConditionalGeneration(tiny_config()).eval().get_encoder()
+
+    def test_encode_matches_forward_packed_and_reuses_entries(self):
+        input_ids, attention_mask = multilingual_batch({"en": 7, "fr": 5})
+        cache = EncoderOutputCache()
+        with torch.no_grad():
+            expected = self.encoder.forward_packed(input_ids, attention_mask)
+            first = cache.encode(self.encoder, input_ids, attention_mask)
+            second = cache.encode(self.encoder, input_ids, attention_mask)
+
+        self.assertEqual(cache.stats()["entries"], 6)
+        self.assertEqual(cache.hits, 6)
+        for lang in input_ids:
+            mask = attention_mask[lang].bool()
+            self.assertTrue(
+                torch.allclose(first[lang].last_hidden_state[mask], expected[lang].last_hidden_state[mask], atol=1e-5)
+            )
+            self.assertTrue(torch.equal(first[lang].last_hidden_state[mask], second[lang].last_hidden_state[mask]))
+
+    def test_evicts_least_recently_used_beyond_max_bytes(self):
+        entry = torch.zeros(4, 16)
+        size = entry.element_size() * entry.nelement()
+        cache = EncoderOutputCache(max_bytes=2 * size)
+        cache.put(("en", b"a"), entry)
+        cache.put(("en", b"b"), entry)
+        cache.get(("en", b"a"))
+        cache.put(("en", b"c"), entry)
+
+        self.assertIsNone(cache.get(("en", b"b")))
+        self.assertIsNotNone(cache.get(("en", b"a")))
+        self.assertEqual(cache.bytes_used, 2 * size)
+
+    def test_key_depends_on_language_and_ids(self):
+        key = EncoderOutputCache.key("en", torch.tensor([5, 6, 2]))
+        self.assertEqual(key, EncoderOutputCache.key("en", torch.tensor([5, 6, 2, 1])[:3]))
+        self.assertNotEqual(key, EncoderOutputCache.key("fr", torch.tensor([5, 6, 2])))
+        self.assertNotEqual(key, EncoderOutputCache.key("en", torch.tensor([5, 7, 2])))
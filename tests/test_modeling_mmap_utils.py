@@ -0,0 +1,92 @@
+# coding=utf-8
+# Copyright 2021 The HuggingFace Inc. team
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import tempfile
+import unittest
+
+from artdescapi.transformers import is_torch_available
+from artdescapi.transformers.testing_utils import require_torch
+
+from .test_modeling_mbart_multisource import tiny_config
+
+
+if is_torch_available():
+    import torch
+
+    from artdescapi.transformers import MMAP_WEIGHTS_NAME, MBartForConditionalGeneration
+    from artdescapi.transformers.modeling_mmap_utils import (
+        MMAP_ALIGNMENT,
+        load_mmap_checkpoint,
+        save_mmap_checkpoint,
+    )
+
+
+@require_torch
+class MmapCheckpointTest(unittest.TestCase):
+    def test_round_trip(self):
+        weight = torch.randn(3, 5)
+        state_dict = {
+            "weight": weight,
+            "tied": weight,
+            "half": torch.randn(7).half(),
+            "ids": torch.arange(4),
+            "empty": torch.zeros(0, 2),
+        }
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, MMAP_WEIGHTS_NAME)
+            save_mmap_checkpoint(state_dict, path)
+            loaded = load_mmap_checkpoint(path)
+
+            self.assertEqual(list(loaded), list(state_dict))
+            for name, tensor in state_dict.items():
+                self.assertEqual(loaded[name].dtype, tensor.dtype)
+                self.assertTrue(torch.equal(loaded[name], tensor))
+            # tied tensors are stored once, and every tensor is aligned in the mapping
+            self.assertEqual(loaded["weight"].data_ptr(), loaded["tied"].data_ptr())
+            for tensor in loaded.values():
+                if tensor.numel() > 0:
+                    self.assertEqual(tensor.data_ptr() % MMAP_ALIGNMENT, 0)
+
+    def test_writes_to_loaded_tensors_do_not_reach_the_file(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, MMAP_WEIGHTS_NAME)
+            save_mmap_checkpoint({"weight": torch.ones(4)}, path)
+            load_mmap_checkpoint(path)["weight"].zero_()
+            self.assertTrue(torch.equal(load_mmap_checkpoint(path)["weight"], torch.ones(4)))
+
+    def test_rejects_other_files(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "pytorch_model.bin")
+            torch.save({"weight": torch.ones(4)}, path)
+            with self.assertRaises(ValueError):
+                load_mmap_checkpoint(path)
+
+    def test_from_pretrained_loads_the_mmap_checkpoint(self):
+        torch.manual_seed(0)
+        model = MBartForConditionalGeneration(tiny_config()).eval()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            model.save_pretrained(tmp_dir)
+            save_mmap_checkpoint(model.state_dict(), os.path.join(tmp_dir, MMAP_WEIGHTS_NAME))
+            # the .bin no longer matches, so only weights read from the .mmap give the original model back
+            torch.save({}, os.path.join(tmp_dir, "pytorch_model.bin"))
+            loaded = MBartForConditionalGeneration.from_pretrained(tmp_dir, config=tiny_config()).eval()
+
+            for name, tensor in model.state_dict().items():
+                self.assertTrue(torch.equal(loaded.state_dict()[name], tensor), name)
+            # tied weights stay tied
+            self.assertEqual(
+                loaded.get_input_embeddings().weight.data_ptr(), loaded.get_output_embeddings().weight.data_ptr()
+            )
@@ -0,0 +1,59 @@
+import gzip
+import json
+import os
+import tempfile
+import unittest
+
+from artdescapi.transformers import is_torch_available
+from artdescapi.transformers.testing_utils import require_torch
+from artdescapi.utils.cache import description_key
+
+
+if is_torch_available():
+    from artdescapi.utils.prewarm_embeddings import count_descriptions, most_frequent
+
+
+def write_dump(path, descriptions):
+    """A Wikidata-style dump with one entity per (lang, description), one JSON entity per line inside a list."""
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        f.write("[\n")
+        lines = [json.dumps({"descriptions": {lang: {"value": text}}}) for lang, text in descriptions]
+        f.write(",\n".join(lines))
+        f.write("\n]\n")
+
+
+@require_torch
+class CountDescriptionsTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.path = os.path.join(self.tmp_dir.name, "dump.json.gz")
+
+    def test_exact_counts_when_everything_fits(self):
+        write_dump(self.path, [("en", "painter")] * 3 + [("fr", "peintre"), ("en", "Painter"), ("xx", "painter")])
+        entries, total = count_descriptions(self.path, {"en", "fr"}, capacity=10)
+
+        self.assertEqual(total, 5)
+        self.assertEqual(entries[description_key("en", "painter")][:2], [4, 0])
+        self.assertEqual(entries[description_key("fr", "peintre")], [1, 0, "peintre"])
+        self.assertEqual(most_frequent(entries, top=5), [description_key("en", "painter")])
+        self.assertEqual(most_frequent(entries, top=5, min_count=1)[0], description_key("en", "painter"))
+
+    def test_frequent_descriptions_survive_a_small_table(self):
+        frequent = ["painter", "village", "footballer"]
+        descriptions = []
+        for i in range(300):
+            descriptions.append(("en", frequent[i % 3]))
+            descriptions.append(("en", "rare description {0}".format(i)))
+        write_dump(self.path, descriptions)
+        entries, total = count_descriptions(self.path, {"en"}, capacity=4)
+
+        self.assertEqual(total, 600)
+        self.assertLessEqual(len(entries), 8)
+        keys = [description_key("en", text) for text in frequent]
+        self.assertEqual(set(most_frequent(entries, top=3)), set(keys))
+        for key in keys:
+            count, error, _ = entries[key]
+            # upper bound, off by at most the error
+            self.assertLessEqual(count - error, 100)
+            self.assertGreaterEqual(count, 100)
@@ -0,0 +1,104 @@
+# coding=utf-8
+# Copyright 2021 The HuggingFace Inc. team
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import io
+import os
+import tempfile
+import unittest
+
+from artdescapi.transformers import MBartTokenizer, MBartTokenizerFast, is_sentencepiece_available
+from artdescapi.transformers.testing_utils import require_sentencepiece, require_tokenizers
+
+
+if is_sentencepiece_available():
+    import sentencepiece as spm
+
+
+CORPUS = {
+    "en_XX": ["The quick brown fox jumps over the lazy dog", "American baseball player"],
+    "fr_XX": ["Le renard brun rapide saute par-dessus le chien paresseux", "joueur de baseball américain"],
+    "de_DE": ["Der schnelle braune Fuchs springt über den faulen Hund", "amerikanischer Baseballspieler"],
+    "es_XX": ["El rápido zorro marrón salta sobre el perro perezoso", "jugador de béisbol estadounidense"],
+}
+
+
+def train_sentencepiece(path, vocab_size=120):
+    """A small sentencepiece model of :obj:`CORPUS`, written to :obj:`path`."""
+    model = io.BytesIO()
+    sentences = [text for texts in CORPUS.values() for text in texts] * 10
+    spm.SentencePieceTrainer.train(
+        sentence_iterator=iter(sentences),
+        model_writer=model,
+        vocab_size=vocab_size,
+        hard_vocab_limit=False,
+        minloglevel=2,
+    )
+    with open(path, "wb") as f:
+        f.write(model.getvalue())
+    return path
+
+
+@require_sentencepiece
+class MBartBatchEncodeMultilingualTest(unittest.TestCase):
+    tokenizer_class = MBartTokenizer
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.TemporaryDirectory()
+        vocab_file = train_sentencepiece(os.path.join(cls.tmp_dir.name, "sentencepiece.bpe.model"))
+        MBartTokenizer(vocab_file).save_pretrained(cls.tmp_dir.name)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp_dir.cleanup()
+
+    def get_tokenizer(self):
+        return self.tokenizer_class.from_pretrained(self.tmp_dir.name)
+
+    def test_matches_per_language_encoding(self):
+        tokenizer = self.get_tokenizer()
+        examples = [(text, lang) for lang, texts in CORPUS.items() for text in texts]
+        encoded = tokenizer.batch_encode_multilingual(examples)
+
+        self.assertEqual(list(encoded), list(CORPUS))
+        for lang, texts in CORPUS.items():
+            expected = self.tokenizer_class.from_pretrained(self.tmp_dir.name, src_lang=lang)(texts, padding=True)
+            self.assertEqual(encoded[lang]["input_ids"], expected["input_ids"])
+            self.assertEqual(encoded[lang]["attention_mask"], expected["attention_mask"])
+
+    def test_truncation_keeps_the_language_suffix(self):
+        tokenizer = self.get_tokenizer()
+        encoded = tokenizer.batch_encode_multilingual([(CORPUS["fr_XX"][0], "fr_XX")], max_length=6)
+        ids = encoded["fr_XX"]["input_ids"][0]
+
+        self.assertEqual(len(ids), 6)
+        self.assertEqual(ids[-2:], [tokenizer.eos_token_id, tokenizer.convert_tokens_to_ids("fr_XX")])
+
+    def test_leaves_src_lang_untouched(self):
+        tokenizer = self.get_tokenizer()
+        suffix_tokens = list(tokenizer.suffix_tokens)
+        tokenizer.batch_encode_multilingual([(CORPUS["de_DE"][0], "de_DE")])
+
+        self.assertEqual(tokenizer.src_lang, "en_XX")
+        self.assertEqual(tokenizer.suffix_tokens, suffix_tokens)
+
+    def test_no_examples(self):
+        self.assertEqual(self.get_tokenizer().batch_encode_multilingual([]), {})
+
+
+@require_sentencepiece
+@require_tokenizers
+class MBartFastBatchEncodeMultilingualTest(MBartBatchEncodeMultilingualTest):
+    tokenizer_class = MBartTokenizerFast
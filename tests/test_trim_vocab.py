@@ -0,0 +1,80 @@
+import os
+import tempfile
+import unittest
+
+from artdescapi.transformers import MBartTokenizer, is_sentencepiece_available, is_torch_available
+from artdescapi.transformers.testing_utils import require_sentencepiece, require_torch
+
+from .test_modeling_mbart_multisource import tiny_config
+from .test_tokenization_mbart_multilingual import CORPUS, train_sentencepiece
+
+
+if is_torch_available():
+    import torch
+
+    from artdescapi.transformers import MBartForConditionalGeneration
+
+if is_sentencepiece_available():
+    from artdescapi.transformers.utils import sentencepiece_model_pb2
+
+if is_torch_available() and is_sentencepiece_available():
+    from artdescapi.utils.trim_vocab import (
+        check,
+        count_tokens,
+        kept_pieces,
+        new_to_old_ids,
+        trim_model,
+        trim_sentencepiece,
+    )
+
+
+@require_torch
+@require_sentencepiece
+class TrimVocabTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.tokenizer = MBartTokenizer(train_sentencepiece(os.path.join(self.tmp_dir.name, "old.model")))
+        # only two of the languages the sentencepiece model was trained on are served
+        self.lines = CORPUS["en_XX"] + CORPUS["fr_XX"]
+
+        self.proto = sentencepiece_model_pb2.ModelProto()
+        with open(self.tokenizer.vocab_file, "rb") as f:
+            self.proto.ParseFromString(f.read())
+        offset = self.tokenizer.fairseq_offset
+        self.kept = kept_pieces(self.proto, count_tokens(self.tokenizer, self.lines), offset, keep_chars=False)
+        self.new_to_old = new_to_old_ids(self.kept, offset, len(self.proto.pieces), len(self.tokenizer))
+
+        vocab_file = os.path.join(self.tmp_dir.name, "new.model")
+        trim_sentencepiece(self.tokenizer.vocab_file, self.kept, vocab_file)
+        self.new_tokenizer = MBartTokenizer(vocab_file)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_trims_pieces_of_unserved_languages(self):
+        self.assertLess(len(self.kept), len(self.proto.pieces))
+        self.assertEqual(len(self.new_tokenizer), len(self.new_to_old))
+
+    def test_new_ids_map_back_to_the_original(self):
+        self.assertEqual(check(self.tokenizer, self.new_tokenizer, self.new_to_old, self.lines), 1.0)
+        for token in ["<s>", "<pad>", "</s>", "<unk>", "<mask>"] + list(CORPUS):
+            self.assertEqual(
+                self.new_to_old[self.new_tokenizer.convert_tokens_to_ids(token)],
+                self.tokenizer.convert_tokens_to_ids(token),
+                token,
+            )
+
+    def test_trim_model_keeps_the_mapped_rows(self):
+        config = tiny_config()
+        config.vocab_size = len(self.tokenizer)
+        model = MBartForConditionalGeneration(config).eval()
+        old_embeddings = model.get_input_embeddings().weight.detach().clone()
+        old_bias = model.final_logits_bias.clone()
+
+        trim_model(model, self.new_to_old)
+        index = torch.tensor(self.new_to_old)
+        self.assertEqual(model.config.vocab_size, len(self.new_to_old))
+        self.assertTrue(torch.equal(model.get_input_embeddings().weight, old_embeddings[index]))
+        self.assertTrue(torch.equal(model.final_logits_bias, old_bias[:, index]))
+        self.assertIs(model.get_output_embeddings().weight, model.get_input_embeddings().weight)
+        self.assertEqual(model.config.pad_token_id, self.new_tokenizer.pad_token_id)
@@ -0,0 +1,29 @@
+import unittest
+
+from artdescapi.transformers import is_torch_available
+from artdescapi.transformers.testing_utils import require_torch
+
+
+if is_torch_available():
+    import torch
+    from torch import nn
+
+    from artdescapi.utils.utils import pack_weights
+
+
+@require_torch
+class PackWeightsTest(unittest.TestCase):
+    def test_weights_move_into_one_buffer_per_dtype(self):
+        torch.manual_seed(0)
+        model = nn.Sequential(nn.Embedding(10, 4), nn.Linear(4, 10), nn.BatchNorm1d(10))
+        model[1].weight = model[0].weight
+        expected = {name: tensor.clone() for name, tensor in model.state_dict().items()}
+        pack_weights(model, skip=[model[2].running_mean])
+
+        for name, tensor in model.state_dict().items():
+            self.assertTrue(torch.equal(tensor, expected[name]), name)
+        self.assertIs(model[1].weight, model[0].weight)
+        floats = [model[0].weight, model[1].bias, model[2].weight, model[2].bias, model[2].running_var]
+        self.assertEqual({tensor.storage().data_ptr() for tensor in floats}, {floats[0].storage().data_ptr()})
+        self.assertNotEqual(model[2].running_mean.storage().data_ptr(), floats[0].storage().data_ptr())
+        self.assertNotEqual(model[2].num_batches_tracked.storage().data_ptr(), floats[0].storage().data_ptr())